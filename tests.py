@@ -1,7 +1,912 @@
 import unittest
 
+import asyncio
+import fcntl
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import types
+import wave
+
+from tinaudio.album import Album, AlbumCue
+from tinaudio.cache import ICache
+from tinaudio.cover import CoverCache, imagetype
+from tinaudio.tempstore import TempStore
+from tinaudio import pcm
+from tinaudio.encoder import Encoder
+from tinutils import allscope, jobmerge, jobplan, jobsetup, jobsplit, keyscope, prunedirs, shardscope, shardspec, tempdirs, topdirs
+from tinjob import covers, tmpstore, CoverJob, GenericJob, EncodeJob, UpdateJob, STAGES
+from tinsched import Scheduler
+from tinasync import AsyncScheduler, call, chain, reap
+from tinstats import Stats, percentile, stats, throughput
+from tinbench import makelibrary, survey, Templates
+from tinload import Controller, LoadSampler
+from tinjournal import Journal, journalname, JOURNAL_FILE, JOURNAL_LOCK, JOURNAL_PATTERN
+from tinwatch import Debouncer, InotifyWatcher, PollWatcher, albumdir
+from tinnet import Coordinator, Worker, endpoint
+
+
+class FakeAlbumSet(object):
+    def __init__(self, key, tracks=(), mtime=0.0, cover=None, audiotime=None, covertime=0.0):
+        self.key = key
+        self.tracks = [(key, 1, i + 1, max(mtime, covertime), t) for (i, t) in enumerate(tracks)]
+        self.cover = cover
+        self.times = (mtime if audiotime is None else audiotime, mtime, covertime)
+
+    def getkey(self):
+        return self.key
+
+    def load(self):
+        pass
+
+    def dump(self):
+        return self.tracks
+
+    def getcover(self):
+        return self.cover
+
+    def getcovertime(self):
+        return self.times[2]
+
+    def gettimes(self, discnumber, tracknumber):
+        return self.times
+
+    def fingerprint(self, discnumber, tracknumber):
+        return 'fp-{}-{}'.format(self.key, tracknumber)
+
+    def getduration(self, discnumber, tracknumber):
+        return 10.0
+
+    def getformat(self, discnumber, tracknumber):
+        return (48000, 6, 3)
+
+    def splittable(self, discnumber):
+        return self.key.endswith('.cue')
+
+
+def fakeflac(path, channels, bits, rate, samples):
+    """
+    Minimal FLAC file (STREAMINFO only)
+    """
+    streaminfo = struct.pack('>HH', 4096, 4096) + bytes(6)
+    streaminfo += struct.pack('>Q', (rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | samples)
+    streaminfo += bytes(16)
+    with open(path, 'wb') as stream:
+        stream.write(b'fLaC' + bytes([0x80, 0, 0, len(streaminfo)]) + streaminfo)
+
+
+def fakedecoder(bindir, name, frames, frame):
+    """
+    Decoder on PATH writing the frame number (as a byte per sample byte) of every frame
+    """
+    f = os.path.join(bindir, name)
+    with open(f, 'w') as stream:
+        stream.write('#!{}\nimport sys\n'.format(sys.executable))
+        stream.write('for i in range(0, {:d}):\n'.format(frames))
+        stream.write('    sys.stdout.buffer.write(bytes([i % 256]) * {:d})\n'.format(frame))
+    os.chmod(f, 0o755)
+
+
+def extensiblewav(path, channels, width, mask, frames):
+    """
+    WAVE_FORMAT_EXTENSIBLE file from frames of integer samples
+    """
+    data = b''.join([b''.join([v.to_bytes(width, 'little', signed=True) for v in f]) for f in frames])
+    fmt = struct.pack('<HHIIHHHHI', pcm.WAVE_FORMAT_EXTENSIBLE, channels, 48000, 48000 * channels * width,
+                      channels * width, 8 * width, 22, 8 * width, mask)
+    fmt += struct.pack('<H', pcm.WAVE_FORMAT_PCM) + b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+    with open(path, 'wb') as stream:
+        stream.write(b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(data)) + b'WAVE')
+        stream.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+        stream.write(b'data' + struct.pack('<I', len(data)) + data)
+
+
+class FingerprintEncoder(Encoder):
+    def getfingerprint(self, dstf):
+        return {'/dst/old/01 a.opus': 'fp-old-1', '/dst/old/02 b.opus': 'stale'}.get(dstf)
+
+
+class FakeJob(GenericJob):
+    def __init__(self, name, log, fail=False, cost=0.0):
+        self.name = name
+        self.log = log
+        self.fail = fail
+        self.jobcost = cost
+
+    def cost(self):
+        return self.jobcost
+
+    def announce(self, failed):
+        pass
+
+    def doit(self):
+        self.log.append(self.name)
+        if self.fail:
+            raise Exception(self.name)
+
+
+class StagedJob(GenericJob):
+    def __init__(self, name, log, fail=None):
+        self.name = name
+        self.log = log
+        self.fail = fail
+        self.cleaned = False
+
+    def announce(self, failed):
+        pass
+
+    def stages(self):
+        return STAGES
+
+    def runstage(self, stage):
+        self.log.append((self.name, stage))
+        if stage == self.fail:
+            raise Exception(self.name)
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+class FakeCache(object):
+    def __init__(self, root, files):
+        self.root = root
+        self.files = files
+
+    def getroot(self):
+        return self.root
+
+    def getleafs(self):
+        return sorted(set(os.path.dirname(f) for f in self.files.keys()))
+
+    def get(self, key):
+        return ([], sorted(os.path.basename(f) for f in self.files.keys() if os.path.dirname(f) == key))
+
+    def getmtime(self, f):
+        return self.files[f]
+
+
+class SplitAlbumSet(FakeAlbumSet):
+    """
+    CUE album set of 100 byte tracks (split writes them at once)
+    """
+    def getroot(self):
+        return '/'
+
+    def getduration(self, discnumber, tracknumber):
+        return 1.0
+
+    def getformat(self, discnumber, tracknumber):
+        return (100, 1, 1)
+
+    def getsize(self, discnumber, tracknumber):
+        return 10
+
+    def exportmeta(self, discnumber, tracknumber):
+        return (None, {})
+
+    def split(self, discnumber, wavfiles):
+        for f in wavfiles.values():
+            with open(f, 'wb') as stream:
+                stream.write(bytes(100))
+
+
+class CopyEncoder(object):
+    """
+    Encoder copying the WAV
+    """
+    codec = 'wav'
+    downmix = False
+
+    def suffix(self):
+        return 'wav'
+
+    def cost(self):
+        return 1.0
+
+    def streamable(self):
+        return False
+
+    def encodeargs(self, wavf, dstf):
+        return ['cp', wavf, dstf]
+
+    def tag(self, dstf, cover, meta, fingerprint):
+        pass
+
+
+class CountingAlbum(Album):
+    def __init__(self):
+        super(CountingAlbum, self).__init__()
+        self.tracktotal = 2
+        self.reads = 0
+
+    def readmeta(self):
+        self.reads += 1
+        return [{'title': ['a']}, {'title': ['b']}]
+
+
 class TestMethods(unittest.TestCase):
-  pass
+
+    def test_loadmeta_once(self):
+        a = CountingAlbum()
+        threads = [threading.Thread(target=a.loadmeta) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        a.loadmeta()
+        self.assertEqual(a.reads, 1)
+        self.assertEqual(a.getmeta(2), {'title': ['b']})
+
+    def test_jobmerge(self):
+        a = FakeAlbumSet('a')
+        b = FakeAlbumSet('b')
+        opus = Encoder('opus', False)
+        mp3 = Encoder('mp3', True)
+        jobs = [EncodeJob(a, 1, 1, '/opus', 'a/01 x.opus', opus),
+                EncodeJob(b, 1, 1, '/opus', 'b/01 y.opus', opus),
+                EncodeJob(a, 1, 1, '/mp3', 'a/01 x.mp3', mp3),
+                EncodeJob(a, 1, 2, '/mp3', 'a/02 z.mp3', mp3)]
+        merged = jobmerge(jobs)
+        self.assertEqual(len(merged), 3)
+        self.assertEqual([t[1] for t in merged[0].targets], ['a/01 x.opus', 'a/01 x.mp3'])
+        self.assertEqual(len(merged[1].targets), 1)
+        self.assertEqual(len(merged[2].targets), 1)
+        # outputs moved into place before the failure are not failed
+        merged[0].committed.append(('/opus', 'a/01 x.opus'))
+        failed = stats.failed
+        merged[0].announce(True)
+        self.assertEqual(stats.failed, failed + 1)
+
+    def test_jobsplit(self):
+        cue = FakeAlbumSet('a.cue')
+        opus = Encoder('opus', False)
+        jobs = jobmerge([EncodeJob(cue, 1, 1, '/opus', 'a/01 x.opus', opus),
+                         EncodeJob(cue, 1, 2, '/opus', 'a/02 y.opus', opus),
+                         EncodeJob(cue, 1, 2, '/mp3', 'a/02 y.mp3', Encoder('mp3', True)),
+                         EncodeJob(FakeAlbumSet('b'), 1, 1, '/opus', 'b/01 z.opus', opus)])
+        for j in jobs:
+            j.split = True
+        (splitjobs, splitdeps) = jobsplit(jobs)
+        self.assertEqual(len(splitjobs), 1)
+        self.assertEqual([j.tracknumber for j in splitjobs[0].jobs], [1, 2])
+        self.assertEqual(set(splitdeps.keys()), set(jobs[0:2]))
+        self.assertFalse(jobs[1].streaming())
+        # not split, may stream
+        self.assertFalse(jobs[2].split)
+
+    def test_cuesplit(self):
+        root = tempfile.mkdtemp()
+        bindir = tempfile.mkdtemp()
+        fakeflac(os.path.join(root, 'a.flac'), 2, 16, 44100, 700)
+        fakedecoder(bindir, 'flac', 700, 4)
+        album = AlbumCue(types.SimpleNamespace(getroot=lambda: root), '', 'a', 'a')
+        index = types.SimpleNamespace(index_number=1, index_offset=0)
+        pregap = [types.SimpleNamespace(index_number=0, index_offset=0),
+                  types.SimpleNamespace(index_number=1, index_offset=50)]
+        album.cuesheet = types.SimpleNamespace(tracks=[
+            types.SimpleNamespace(start_offset=0, indexes=[index]),
+            types.SimpleNamespace(start_offset=250, indexes=pregap),
+            types.SimpleNamespace(start_offset=600, indexes=[index]),
+            types.SimpleNamespace(start_offset=700, indexes=[])])
+        # source bytes read, the track's share of the image
+        self.assertEqual(album.getsize(1), os.path.getsize(os.path.join(root, 'a.flac')) * 250 // 700)
+        wavfiles = {n: os.path.join(root, '{:d}.wav'.format(n)) for n in (1, 2)}
+        path = os.environ['PATH']
+        os.environ['PATH'] = bindir + os.pathsep + path
+        try:
+            album.split(wavfiles)
+        finally:
+            os.environ['PATH'] = path
+        for (n, first, frames) in ((1, 0, 300), (2, 300, 300)):
+            w = wave.open(wavfiles[n], 'rb')
+            self.assertEqual((w.getnchannels(), w.getsampwidth(), w.getframerate()), (2, 2, 44100))
+            self.assertEqual(w.getnframes(), frames)
+            data = w.readframes(frames)
+            w.close()
+            self.assertEqual(data[0], first % 256)
+            self.assertEqual(data[-1], (first + frames - 1) % 256)
+
+    def test_jobsetup(self):
+        albums = {
+            'new': FakeAlbumSet('new', ['01 a'], 10.0, 'new/folder.png'),
+            'old': FakeAlbumSet('old', ['01 a', '02 b', '04 d'], 10.0, 'old/folder.png'),
+        }
+        dstcache = FakeCache('/dst', {
+            'gone/01 x.opus': 5.0,
+            'old/01 a.opus': 20.0,
+            'old/02 b.opus': 5.0,
+            'old/03 c.opus': 20.0,
+            'old/folder.jpg': 20.0,
+        })
+        (unlink, cvrjobs, encjobs) = jobsetup(albums, dstcache, Encoder('opus', False), True)
+        self.assertEqual(unlink, ['gone/01 x.opus', 'old/02 b.opus', 'old/03 c.opus'])
+        self.assertEqual([j.dstroot for j in cvrjobs], ['/dst/new'])
+        self.assertEqual([j.targets[0][1] for j in encjobs], ['new/01 a.opus', 'old/02 b.opus', 'old/04 d.opus'])
+
+    def test_jobsetup_fingerprint(self):
+        albums = {'old': FakeAlbumSet('old', ['01 a', '02 b'], 10.0)}
+        dstcache = FakeCache('/dst', {'old/01 a.opus': 5.0, 'old/02 b.opus': 5.0})
+        (unlink, cvrjobs, encjobs) = jobsetup(albums, dstcache, FingerprintEncoder('opus', False), False, True)
+        self.assertEqual(unlink, ['old/02 b.opus'])
+        self.assertTrue(isinstance(encjobs[0], UpdateJob))
+        self.assertEqual(encjobs[0].dstfile, 'old/01 a.opus')
+        self.assertTrue(isinstance(encjobs[1], EncodeJob) and encjobs[1].fingerprint)
+        self.assertEqual(len(jobmerge(encjobs)), 2)
+
+    def test_contentdigest(self):
+        album = Album()
+        (no, f) = tempfile.mkstemp()
+        os.write(no, b'image')
+        os.close(no)
+        digest = album.contentdigest(f)
+        # tracks of an image share its digest, read once
+        with open(f, 'wb') as stream:
+            stream.write(b'changed')
+        self.assertEqual(album.contentdigest(f), digest)
+        os.remove(f)
+
+    def test_jobsetup_retag(self):
+        albums = {'cue': FakeAlbumSet('cue', ['01 a'], 10.0, audiotime=1.0)}
+        dstcache = FakeCache('/dst', {'cue/01 a.opus': 5.0})
+        (unlink, cvrjobs, encjobs) = jobsetup(albums, dstcache, Encoder('opus', False), False)
+        self.assertEqual(unlink, [])
+        self.assertTrue(isinstance(encjobs[0], UpdateJob) and encjobs[0].retag)
+
+    def test_retag_keeps(self):
+        templates = Templates(1, 1.0)
+        meta = {'title': ['T'], 'artist': ['A'], 'album': ['B'], 'albumartist': ['A'], 'tracknumber': ['1'],
+                'tracktotal': ['1'], 'discnumber': ['1'], 'disctotal': ['1']}
+        root = tempfile.mkdtemp()
+        for (codec, data) in (('opus', templates.outopus), ('flac', templates.outflac), ('mp3', templates.outmp3)):
+            f = os.path.join(root, 'x.' + codec)
+            with open(f, 'wb') as stream:
+                stream.write(data)
+            encoder = Encoder(codec, False)
+            encoder.tag(f, None, meta, 'fp')
+            encoder.retag(f, dict(meta, title=['U']), None)
+            # a later fingerprint run must not see every retagged output as changed
+            self.assertEqual(encoder.getfingerprint(f), 'fp')
+
+    def test_jobsetup_recover(self):
+        albums = {'a': FakeAlbumSet('a', ['01 x', '02 y'], 1.0, 'a/cover.png', covertime=10.0)}
+        dstcache = FakeCache('/dst', {'a/01 x.mp3': 5.0, 'a/02 y.mp3': 5.0, 'a/folder.jpg': 5.0})
+        (unlink, cvrjobs, encjobs) = jobsetup(albums, dstcache, Encoder('mp3', True), True)
+        self.assertEqual(unlink, [])
+        self.assertEqual([j.dstroot for j in cvrjobs], ['/dst/a'])
+        self.assertEqual(len(encjobs), 2)
+        self.assertTrue(all(isinstance(j, UpdateJob) and j.recover and not j.retag for j in encjobs))
+
+    def test_jobplan(self):
+        albums = {
+            'a': FakeAlbumSet('a', ['01 x', '02 y'], 10.0),
+            'b.cue': FakeAlbumSet('b.cue', ['01 z', '02 w'], 10.0, audiotime=1.0),
+        }
+        dstcache = FakeCache('/dst', {'b.cue/01 z.mp3': 5.0, 'b.cue/02 w.mp3': 5.0, 'c/01 v.mp3': 5.0})
+        (unlink, cvrjobs, encjobs) = jobsetup(albums, dstcache, Encoder('mp3', True), False)
+        opus = jobsetup(albums, FakeCache('/opus', {}), Encoder('opus', False), False)[2]
+        tracks = jobmerge(encjobs + opus)
+        for j in tracks:
+            j.split = True
+        (splitjobs, splitdeps) = jobsplit(tracks)
+        plan = jobplan(unlink, cvrjobs, tracks, splitdeps, {'decode': 1, 'encode': 1, 'commit': 1}, {'opus': 20.0})
+        self.assertEqual(plan['unlink'], ['c/01 v.mp3'])
+        self.assertEqual(len(plan['updates']), 2)
+        self.assertEqual([(e['album'], e['split']) for e in plan['encodes']],
+                         [('a', False), ('a', False), ('b.cue', True), ('b.cue', True)])
+        self.assertEqual(plan['splits'], [{'album': 'b.cue', 'disc': 1, 'tracks': 2}])
+        estimate = plan['estimate']
+        self.assertEqual(estimate['audio'], {'mp3': 20.0, 'opus': 40.0})
+        self.assertEqual(estimate['measured'], ['opus'])
+        self.assertAlmostEqual(estimate['encoding']['mp3'], 20.0 * 1.2)
+        self.assertAlmostEqual(estimate['wall'], 40.0 * 0.2 + 20.0 * 1.2 + 40.0 / 20.0)
+        # 3 holders: the split disc (opus only) and both tracks (with stereo downmix)
+        self.assertEqual(estimate['tempspace'], 10 * 48000 * (2 * 6 + 8 + 8) * 3)
+        d = tempfile.mkdtemp()
+        stats = Stats()
+        stats.record('encode', 2.0, 'a', 'opus', 60.0)
+        stats.record('encode', 1.0, 'a', 'mp3', 0.0)
+        stats.dump(os.path.join(d, 'report.json'))
+        self.assertEqual(throughput(os.path.join(d, 'report.json')), {'opus': 30.0})
+
+    def test_journal(self):
+        root = tempfile.mkdtemp()
+        tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(root, 'a'))
+        for f in ('a/01 x.opus', 'a/02 y.opus'):
+            open(os.path.join(root, f), 'w').close()
+        journal = Journal(root)
+        journal.open([tmpdir], 'tin0-')
+        for f in ('a/01 x.opus', 'a/02 y.opus', 'a/03 z.opus'):
+            journal.start(f)
+        journal.commit('a/01 x.opus', 'opus', (1.0, 2.0, 0.0), 'fp')
+        journal.commit('a/02 y.opus', 'opus', (1.0, 2.0, 0.0))
+        # interrupted: half moved output, temp file, 02 touched since
+        open(os.path.join(root, 'a/03 z.opus.tmp'), 'w').close()
+        open(os.path.join(root, 'a/03 z.opus.2-1.tmp'), 'w').close()
+        open(os.path.join(tmpdir, 'tin0-abc.wav'), 'w').close()
+        open(os.path.join(tmpdir, 'other.wav'), 'w').close()
+        os.utime(os.path.join(root, 'a/02 y.opus'), (0, 0))
+        journal.stream.close()
+        journal.lockstream.close()
+        # a live run (of any host) holds the lock, nothing recovered
+        with open(os.path.join(root, JOURNAL_FILE + JOURNAL_LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            other = Journal(root)
+            other.open([tmpdir], 'tin2-')
+            other.close()
+        self.assertTrue(os.path.exists(os.path.join(root, 'a/03 z.opus.tmp')))
+        resumed = Journal(root)
+        resumed.open([tmpdir], 'tin1-')
+        self.assertFalse(os.path.exists(os.path.join(root, 'a/03 z.opus.tmp')))
+        self.assertFalse(os.path.exists(os.path.join(root, 'a/03 z.opus.2-1.tmp')))
+        self.assertEqual(os.listdir(tmpdir), ['other.wav'])
+        mtime = os.path.getmtime(os.path.join(root, 'a/01 x.opus'))
+        self.assertTrue(resumed.committed('a/01 x.opus', mtime, 'opus', (1.0, 2.0, 0.0)))
+        self.assertFalse(resumed.committed('a/01 x.opus', mtime, 'opus', (1.0, 3.0, 0.0)))
+        self.assertFalse(resumed.committed('a/01 x.opus', mtime, 'opus downmix', (1.0, 2.0, 0.0)))
+        self.assertFalse(resumed.committed('a/02 y.opus', 0.0, 'opus', (1.0, 2.0, 0.0)))
+        resumed.close()
+        # compacted, the journal itself is not an output
+        with open(os.path.join(root, JOURNAL_FILE)) as stream:
+            self.assertEqual(len(stream.readlines()), 3)
+        self.assertEqual(ICache(root, ignore=[JOURNAL_PATTERN]).getleafs(), ['a'])
+        # ambiguous mtimes, committed from the same source
+        albums = {'a': FakeAlbumSet('a', ['01 x'], mtime + 10.0)}
+        albums['a'].times = (1.0, 2.0, 0.0)
+        dstcache = FakeCache(root, {'a/01 x.opus': mtime})
+        self.assertEqual(jobsetup(albums, dstcache, Encoder('opus', False), False, False, resumed)[2], [])
+        self.assertEqual(len(jobsetup(albums, dstcache, Encoder('opus', False), False)[2]), 1)
+
+    def test_jobsetup_scope(self):
+        self.assertEqual(topdirs(['a/b', 'a', 'c/d', 'c/dd']), ['a', 'c/d', 'c/dd'])
+        self.assertEqual(topdirs(['x', '']), [''])
+        albums = {'a/x': FakeAlbumSet('a/x', ['01 p'], 10.0), 'b': FakeAlbumSet('b', ['01 q'], 10.0)}
+        dstcache = FakeCache('/dst', {'a/x/02 r.opus': 5.0, 'a/y/01 s.opus': 5.0, 'c/01 t.opus': 5.0})
+        (unlink, cvrjobs, encjobs) = jobsetup(albums, dstcache, Encoder('opus', False), False, scope=keyscope(['a']))
+        self.assertEqual(unlink, ['a/y/01 s.opus', 'a/x/02 r.opus'])
+        self.assertEqual([j.targets[0][1] for j in encjobs], ['a/x/01 p.opus'])
+        root = tempfile.mkdtemp()
+        for d in ('a/x/CD1', 'a/y', 'b/z'):
+            os.makedirs(os.path.join(root, d))
+        open(os.path.join(root, 'a/y/01 s.opus'), 'w').close()
+        prunedirs(root, ['a/x', 'b/z/gone'])
+        self.assertEqual(sorted(os.listdir(root)), ['a'])
+        self.assertEqual(os.listdir(os.path.join(root, 'a')), ['y'])
+
+    def test_shard(self):
+        self.assertEqual(shardspec('1/4'), (1, 4))
+        for spec in ('4/4', '-1/2', '1', 'a/b'):
+            self.assertRaises(Exception, shardspec, spec)
+        keys = ['a/x', 'a/y', 'b', 'c/d/e', 'gone']
+        albums = dict([(k, FakeAlbumSet(k, ['01 p'], 10.0)) for k in keys[0:4]])
+        dstcache = FakeCache('/dst', {'a/x/01 p.opus': 20.0, 'gone/01 q.opus': 5.0})
+        unlinks = []
+        encodes = []
+        for i in range(0, 3):
+            scope = shardscope(i, 3)
+            (unlink, cvrjobs, encjobs) = jobsetup(albums, dstcache, Encoder('opus', False), False, scope=scope)
+            unlinks.extend(unlink)
+            encodes.extend([j.targets[0][1] for j in encjobs])
+        self.assertEqual([sum([shardscope(i, 3)(k) for i in range(0, 3)]) for k in keys], [1] * len(keys))
+        both = allscope([keyscope(['a']), shardscope(0, 3)])
+        self.assertEqual([both(k) for k in keys], [keyscope(['a'])(k) and shardscope(0, 3)(k) for k in keys])
+        self.assertEqual(unlinks, ['gone/01 q.opus'])
+        self.assertEqual(sorted(encodes), ['a/y/01 p.opus', 'b/01 p.opus', 'c/d/e/01 p.opus'])
+        root = tempfile.mkdtemp()
+        for name in (journalname(0, 3), journalname(2, 3) + '.tmp', 'x'):
+            open(os.path.join(root, name), 'w').close()
+        self.assertEqual(ICache(root, ignore=[JOURNAL_PATTERN]).get(''), ([], ['x']))
+        os.makedirs(os.path.join(root, 'a', 'x'))
+        prunedirs(root, ['a/x'], False)
+        self.assertEqual(os.listdir(os.path.join(root, 'a')), [])
+
+    def test_watch(self):
+        self.assertEqual(albumdir('a/b/CD02'), 'a/b')
+        self.assertEqual(albumdir('a/b'), 'a/b')
+        debouncer = Debouncer(10.0)
+        debouncer.add('/src', 'a/CD1', 0.0)
+        debouncer.add('/src', 'b', 5.0)
+        debouncer.add('/src', 'a', 8.0)
+        self.assertEqual(debouncer.timeout(9.0), 6.0)
+        self.assertEqual(debouncer.due(17.0), [('/src', 'b')])
+        self.assertEqual(debouncer.due(18.0), [('/src', 'a')])
+        self.assertEqual(debouncer.timeout(18.0), None)
+        root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(root, 'a'))
+        watchers = [PollWatcher([root], 0.0, 1)]
+        try:
+            watchers.append(InotifyWatcher([root]))
+        except OSError:
+            pass
+        os.makedirs(os.path.join(root, 'b', 'CD1'))
+        with open(os.path.join(root, 'a', '01 x.flac'), 'w') as stream:
+            stream.write('x')
+        for w in watchers:
+            changed = set()
+            for i in range(0, 3):
+                changed.update(w.poll(0.1))
+            self.assertEqual(changed, set([(root, 'a'), (root, 'b'), (root, 'b/CD1')]))
+            w.close()
+
+    def test_coordinator(self):
+        self.assertEqual(endpoint('host:1234'), (socket.AF_INET, ('host', 1234)))
+        self.assertRaises(Exception, endpoint, 'host')
+        address = 'unix:' + os.path.join(tempfile.mkdtemp(), 'sock')
+        coordinator = Coordinator(address, 0.3, lambda j: {'name': j.name})
+        jobs = [FakeJob(n, [], cost=c) for (n, c) in (('a', 4.0), ('b', 3.0), ('c', 2.0), ('d', 1.0))]
+        for j in jobs:
+            coordinator.submit(j)
+        coordinator.listen()
+        server = threading.Thread(target=coordinator.serve)
+        server.daemon = True
+        server.start()
+        # one worker dies with its job, another one hangs with its job
+        leased = []
+        conns = []
+        for i in range(0, 2):
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.connect(address[5:])
+            conn.sendall(b'{"op": "pull"}\n')
+            leased.append(json.loads(conn.makefile('r').readline())['job'])
+            conns.append(conn)
+        self.assertEqual([d['name'] for d in leased], ['a', 'b'])
+        self.assertEqual([d['tmpsuffix'] for d in leased], ['.0-1.tmp', '.1-1.tmp'])
+        conns[0].close()
+        log = []
+        suffixes = {}
+
+        def run(d):
+            log.append(d['name'])
+            suffixes[d['name']] = d['tmpsuffix']
+            return d['name'] != 'c'
+
+        workers = [Worker(address, 'w{:d}'.format(i), run) for i in range(0, 2)]
+        threads = [threading.Thread(target=w.work) for w in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        server.join()
+        conns[1].close()
+        coordinator.close()
+        self.assertEqual(sorted(log), ['a', 'b', 'c', 'd'])
+        # leased again, moved into place through its own temp file
+        self.assertEqual(suffixes['a'], '.0-2.tmp')
+        self.assertEqual(coordinator.remaining, 0)
+        self.assertFalse(os.path.exists(address[5:]))
+
+    def test_covercache(self):
+        d = tempfile.mkdtemp()
+        cache = CoverCache(capacity=10)
+        for (f, data) in (('a.jpg', b'aaaaaa'), ('b.jpg', b'bbbbbb')):
+            with open(os.path.join(d, f), 'wb') as stream:
+                stream.write(data)
+        self.assertEqual(cache.get(os.path.join(d, 'a.jpg')), b'aaaaaa')
+        self.assertEqual(cache.get(os.path.join(d, 'a.jpg')), b'aaaaaa')
+        self.assertEqual(cache.get(os.path.join(d, 'b.jpg')), b'bbbbbb')
+        # capacity exceeded, least recently used evicted
+        self.assertEqual([k[0] for k in cache.covers.keys()], [os.path.join(d, 'b.jpg')])
+        # PNG kept unless JPEG required, failed conversions are no cover
+        png = b'\x89PNG\r\n\x1a\n' + b'broken'
+        with open(os.path.join(d, 'c.png'), 'wb') as stream:
+            stream.write(png)
+        cache = CoverCache()
+        self.assertEqual(cache.get(os.path.join(d, 'c.png')), png)
+        self.assertEqual(imagetype(png), 'png')
+        self.assertEqual(imagetype(b'aaaaaa'), 'jpeg')
+        self.assertIsNone(cache.get(os.path.join(d, 'c.png'), True))
+        self.assertIsNone(cache.get(os.path.join(d, 'c.png'), True))
+        # folder.jpg of a failed conversion, the job fails
+        albumset = types.SimpleNamespace(getroot=lambda: d, getcover=lambda: 'c.png', getkey=lambda: 'a')
+        dst = tempfile.mkdtemp()
+        self.assertRaises(Exception, CoverJob(albumset, dst).doit)
+        self.assertEqual(os.listdir(dst), [])
+
+    def test_tempstore(self):
+        self.assertEqual(tempdirs('/dev/shm:2G,/tmp:512K,/'), [('/dev/shm', 2 << 30), ('/tmp', 512 << 10), ('/', None)])
+        self.assertRaises(Exception, tempdirs, 'relative:1G')
+        self.assertRaises(Exception, tempdirs, '/tmp:lots')
+        store = TempStore([('/ram', 100), ('/disk', 200)])
+        self.assertEqual(store.reserve(60), '/ram')
+        self.assertEqual(store.reserve(60), '/disk')
+        self.assertEqual(store.reserve(40), '/ram')
+        # oversized waits for the last tier to empty
+        got = []
+        t = threading.Thread(target=lambda: got.append(store.reserve(500)))
+        t.start()
+        t.join(0.05)
+        self.assertEqual(got, [])
+        store.release('/disk', 60)
+        t.join()
+        self.assertEqual(got, ['/disk'])
+        self.assertEqual(store.used, {'/ram': 100, '/disk': 500})
+
+    def test_tempsize(self):
+        a = FakeAlbumSet('a')
+        job = EncodeJob(a, 1, 1, '/opus', 'a/01 x.opus', Encoder('opus', False))
+        self.assertEqual(job.tempsize(), 10 * 48000 * 6 * 3)
+        # stereo downmix next to the full channel WAV
+        job.addtarget('/mp3', 'a/01 x.mp3', Encoder('mp3', True))
+        self.assertEqual(job.tempsize(), 10 * 48000 * 8 * 3)
+
+    def test_pcm_downmix(self):
+        d = tempfile.mkdtemp()
+        src = os.path.join(d, 'a.wav')
+        full = (1 << 23) - 1
+        # FL FR FC LFE BL BR
+        extensiblewav(src, 6, 3, 0x3f, [(1000, 0, 0, 0, 0, 0),
+                                        (0, 0, 2000, 4000, 0, 0),
+                                        (-1000, 1000, 0, 0, -1000, 1000),
+                                        (full, full, full, full, full, full)] * 3)
+        header = pcm.readheader(src)
+        self.assertEqual((header.format, header.channels, header.width, header.frames), (pcm.WAVE_FORMAT_PCM, 6, 3, 12))
+        self.assertTrue(pcm.supported(header))
+        encoder = Encoder('mp3', True)
+        dst = encoder.downmixWAV(src, os.path.join(d, 'b.wav'))
+        w = wave.open(dst, 'rb')
+        self.assertEqual((w.getnchannels(), w.getsampwidth(), w.getframerate(), w.getnframes()), (2, 3, 48000, 12))
+        data = w.readframes(4)
+        w.close()
+        samples = [int.from_bytes(data[i:i + 3], 'little', signed=True) for i in range(0, len(data), 3)]
+        # normalized by 1 + 0.7071 + 0.7071, LFE dropped, full scale stays in range
+        g = 1 / 2.4142
+        expected = [1000 * g, 0, 2000 * 0.7071 * g, 2000 * 0.7071 * g,
+                    -1000 * 1.7071 * g, 1000 * 1.7071 * g, full, full]
+        for (a, b) in zip(samples, expected):
+            self.assertAlmostEqual(a, b, delta=1)
+        # stereo left alone
+        stereo = os.path.join(d, 'c.wav')
+        extensiblewav(stereo, 2, 2, 0x3, [(1, 2)])
+        self.assertEqual(encoder.downmixWAV(stereo), stereo)
+
+    def test_stats(self):
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 50), 2.0)
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 99), 4.0)
+        self.assertEqual(percentile([], 90), 0.0)
+        stats = Stats()
+        for i in range(1, 11):
+            stats.record('encode', float(i), 'a' if i < 10 else 'b', 'opus', 60.0, read=100, written=10)
+        stats.record('tag', 0.5, 'b')
+        stats.fail()
+        report = stats.report()
+        self.assertEqual(report['stages']['encode']['count'], 10)
+        self.assertEqual(report['stages']['encode']['total'], 55.0)
+        self.assertEqual(report['stages']['encode']['p90'], 9.0)
+        self.assertEqual(report['codecs']['opus']['speed'], 600.0 / 55.0)
+        self.assertEqual(report['bytes'], {'read': 1000, 'written': 100})
+        self.assertEqual(report['failed'], 1)
+        self.assertEqual(report['slowest'], [{'album': 'a', 'seconds': 45.0}, {'album': 'b', 'seconds': 10.5}])
+
+    def test_scheduler(self):
+        log = []
+        cover = FakeJob('cover', log, True)
+        tracks = [FakeJob('track{}'.format(i), log) for i in range(0, 4)]
+        other = FakeJob('other', log)
+        scheduler = Scheduler({'encode': 2})
+        for t in tracks:
+            scheduler.submit(t, [cover])
+        scheduler.submit(cover)
+        scheduler.submit(other)
+        scheduler.start()
+        scheduler.join()
+        scheduler.stop()
+        self.assertEqual(len(log), 6)
+        self.assertTrue(all(log.index('cover') < log.index(t.name) for t in tracks))
+
+    def test_scheduler_longest_first(self):
+        log = []
+        scheduler = Scheduler({'encode': 1})
+        for (name, cost) in (('short', 1.0), ('long', 60.0), ('mid', 10.0)):
+            scheduler.submit(FakeJob(name, log, cost=cost))
+        scheduler.start()
+        scheduler.join()
+        scheduler.stop()
+        self.assertEqual(log, ['long', 'mid', 'short'])
+
+    def test_cuesplit_budget(self):
+        # the budget is smaller than all discs, split tracks hold it until encoded
+        tmpdir = tempfile.mkdtemp()
+        tiers = [(t, tmpstore.budgets[t]) for t in tmpstore.tiers]
+        tmpstore.configure([(tmpdir, 1000)])
+        try:
+            for engine in (Scheduler, AsyncScheduler):
+                dst = tempfile.mkdtemp()
+                tracks = []
+                for disc in range(0, 4):
+                    albumset = SplitAlbumSet('d{:d}.cue'.format(disc))
+                    for n in range(1, 6):
+                        j = EncodeJob(albumset, 1, n, dst, 'd{:d}/{:02d}.wav'.format(disc, n), CopyEncoder())
+                        j.split = True
+                        tracks.append(j)
+                (splitjobs, splitdeps) = jobsplit(tracks)
+                self.assertEqual(len(splitjobs), 4)
+                scheduler = engine({'decode': 2, 'encode': 1, 'commit': 1})
+                scheduler.start()
+                for sj in splitjobs:
+                    scheduler.submit(sj)
+                for j in tracks:
+                    scheduler.submit(j, [splitdeps[j]])
+                t = threading.Thread(target=scheduler.join)
+                t.daemon = True
+                t.start()
+                t.join(30.0)
+                self.assertFalse(t.is_alive())
+                scheduler.stop()
+                self.assertEqual(sum([len(files) for (d, dirs, files) in os.walk(dst)]), 20)
+                self.assertEqual(tmpstore.used, {tmpdir: 0})
+        finally:
+            tmpstore.configure(tiers)
+
+    def test_scheduler_stages(self):
+        log = []
+        jobs = [StagedJob('track{}'.format(i), log) for i in range(0, 6)]
+        failed = StagedJob('failed', log, fail='decode')
+        scheduler = Scheduler({'decode': 2, 'encode': 1, 'commit': 1}, bound=1)
+        for j in jobs + [failed]:
+            scheduler.submit(j)
+        scheduler.start()
+        scheduler.join()
+        scheduler.stop()
+        for j in jobs:
+            self.assertEqual([e[1] for e in log if e[0] == j.name], STAGES)
+            self.assertFalse(j.cleaned)
+        # failed jobs stop and clean up
+        self.assertEqual([e[1] for e in log if e[0] == 'failed'], ['decode'])
+        self.assertTrue(failed.cleaned)
+
+    def test_scheduler_limit(self):
+        log = []
+        running = []
+        peak = []
+
+        class Probe(FakeJob):
+            def doit(self):
+                running.append(self)
+                peak.append(len(running))
+                threading.Event().wait(0.01)
+                running.remove(self)
+
+        scheduler = Scheduler({'encode': 4})
+        scheduler.setlimit(2)
+        for i in range(0, 8):
+            scheduler.submit(Probe('job{}'.format(i), log))
+        scheduler.start()
+        scheduler.join()
+        scheduler.stop()
+        self.assertEqual(len(peak), 8)
+        self.assertLessEqual(max(peak), 2)
+
+    def test_asyncscheduler(self):
+        log = []
+        cover = FakeJob('cover', log, True)
+        tracks = [FakeJob('track{}'.format(i), log, cost=float(i)) for i in range(0, 4)]
+        staged = [StagedJob('staged', log), StagedJob('failed', log, fail='encode')]
+        scheduler = AsyncScheduler({'decode': 2, 'encode': 1, 'commit': 1}, bound=1)
+        scheduler.start()
+        for t in tracks:
+            scheduler.submit(t, [cover])
+        scheduler.submit(cover)
+        for j in staged:
+            scheduler.submit(j)
+        scheduler.join()
+        scheduler.stop()
+        names = [e for e in log if not isinstance(e, tuple)]
+        self.assertEqual(names, ['cover', 'track3', 'track2', 'track1', 'track0'])
+        self.assertEqual([e[1] for e in log if e[0] == 'staged'], STAGES)
+        self.assertEqual([e[1] for e in log if e[0] == 'failed'], ['decode', 'encode'])
+        self.assertEqual([j.cleaned for j in staged], [False, True])
+
+    def test_async_processes(self):
+        async def piped():
+            processes = await chain([['printf', 'abc'], ['tr', 'a-z', 'A-Z']], stdout=asyncio.subprocess.PIPE)
+            out = await processes[-1][1].stdout.read()
+            return (out, [(await reap(*p))[1] for p in processes])
+
+        self.assertEqual(asyncio.run(piped()), (b'ABC', [0, 0]))
+        with self.assertRaisesRegex(Exception, '^sh failed \\(2\\): second$'):
+            asyncio.run(call(['sh', '-c', 'echo first >&2; echo second >&2; exit 2']))
+        self.assertEqual(asyncio.run(call(['printf', 'abc'], True)), b'abc')
+        # covers converted by an awaited converter, into the cover cache
+        root = tempfile.mkdtemp()
+        bindir = tempfile.mkdtemp()
+        with open(os.path.join(root, 'a.png'), 'wb') as stream:
+            stream.write(b'\x89PNG\r\n\x1a\n')
+        with open(os.path.join(root, 'b.png'), 'wb') as stream:
+            stream.write(b'\x89PNG\r\n\x1a\n')
+        with open(os.path.join(bindir, 'convert'), 'w') as stream:
+            stream.write('#!/bin/sh\necho "$1" >> {}\ncase "$1" in *a.png) printf jpeg ;; *) exit 1 ;; esac\n'.format(
+                os.path.join(bindir, 'log')))
+        os.chmod(os.path.join(bindir, 'convert'), 0o755)
+        job = types.SimpleNamespace(albumset=types.SimpleNamespace(getroot=lambda: root))
+        scheduler = AsyncScheduler({'decode': 1})
+
+        async def convert():
+            scheduler.conversions = {}
+            await asyncio.gather(*[scheduler.convert(job, f, True) for f in ('a.png', 'a.png', 'b.png')])
+
+        path = os.environ['PATH']
+        os.environ['PATH'] = bindir + os.pathsep + path
+        try:
+            asyncio.run(convert())
+        finally:
+            os.environ['PATH'] = path
+        with open(os.path.join(bindir, 'log')) as stream:
+            self.assertEqual(len(stream.readlines()), 2)
+        self.assertEqual(covers.get(os.path.join(root, 'a.png'), True), b'jpeg')
+        self.assertIsNone(covers.get(os.path.join(root, 'b.png'), True))
+
+    def test_controller(self):
+        proc = tempfile.mkdtemp()
+        os.makedirs(os.path.join(proc, 'pressure'))
+        with open(os.path.join(proc, 'stat'), 'w') as stream:
+            stream.write('cpu  700 0 100 100 100 0 0 0 0 0\ncpu0 1 1 1 1 1\n')
+        with open(os.path.join(proc, 'loadavg'), 'w') as stream:
+            stream.write('3.50 2.00 1.00 2/72 8848\n')
+        with open(os.path.join(proc, 'pressure', 'cpu'), 'w') as stream:
+            stream.write('some avg10=1.14 avg60=1.24 avg300=1.10 total=17097758\n')
+        sample = LoadSampler(proc).sample()
+        self.assertAlmostEqual(sample['busy'], 0.8)
+        self.assertAlmostEqual(sample['iowait'], 0.1)
+        self.assertEqual(sample['load'], 3.5)
+        self.assertEqual(sample['cpupressure'], 1.14)
+        self.assertIsNone(sample['iopressure'])
+        controller = Controller(None, 1, 8, 4)
+        idle = {'busy': 0.5, 'iowait': 0.0, 'load': 2.0, 'cpupressure': None, 'iopressure': None}
+        self.assertEqual(controller.decide(idle), 5)
+        stalled = dict(idle, busy=0.9, iopressure=30.0)
+        self.assertEqual(controller.decide(stalled), 5)
+        saturated = dict(idle, busy=0.9)
+        self.assertEqual(controller.decide(saturated), 4)
+        oversubscribed = dict(idle, busy=0.99, load=8.0)
+        self.assertEqual(controller.decide(oversubscribed), 3)
+        controller.limit = 1
+        self.assertEqual(controller.decide(oversubscribed), 1)
+
+    def test_synthetic_library(self):
+        root = tempfile.mkdtemp()
+        makelibrary(root, 5, 3, 1.0)
+        albums = survey(root)
+        self.assertEqual(len(albums), 5)
+        discs = sorted([len(set(t[1] for t in a.dump())) for a in albums.values()])
+        self.assertEqual(discs, [1, 1, 1, 2, 2])
+        for a in albums.values():
+            self.assertEqual(len(a.dump()), 3 * len(a.albums))
+            self.assertAlmostEqual(a.getduration(1, 2), 1.0, places=2)
+            self.assertTrue(a.getcover())
+
+    def test_icache_index(self):
+        root = tempfile.mkdtemp()
+        indexdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(root, 'a', 'b'))
+        open(os.path.join(root, 'a', 'b', '01 x.flac'), 'w').close()
+        cold = ICache(root)
+        first = ICache(root, indexdir)
+        second = ICache(root, indexdir)
+        for c in (first, second):
+            self.assertEqual(c.getindex(), cold.getindex())
+            self.assertEqual(c.getleafs(), ['a/b'])
+            self.assertEqual(c.get('a'), (['b'], []))
+            self.assertEqual(c.getmtime('a/b/01 x.flac'), cold.getmtime('a/b/01 x.flac'))
+        # directory mtime changes on new entries
+        os.makedirs(os.path.join(root, 'c'))
+        open(os.path.join(root, 'c', '01 y.flac'), 'w').close()
+        third = ICache(root, indexdir)
+        self.assertEqual(third.getleafs(), ['a/b', 'c'])
+        # source retagged in place, the directory's mtime stays
+        f = os.path.join(root, 'c', '01 y.flac')
+        with open(f, 'wb') as stream:
+            stream.write(Templates(1, 1.0).flac)
+        ICache(root, indexdir)
+        dirmtime = os.stat(os.path.join(root, 'c')).st_mtime_ns
+        Encoder('flac', False).retag(f, {'title': ['Retagged']}, None)
+        os.utime(f, (1000.0, 1000.0))
+        self.assertEqual(os.stat(os.path.join(root, 'c')).st_mtime_ns, dirmtime)
+        self.assertEqual(ICache(root, indexdir).getmtime('c/01 y.flac'), 1000.0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,481 @@
+import asyncio
+import concurrent.futures
+import functools
+import os
+import tempfile
+import time
+
+from typing import Dict, List, Tuple
+
+from tinjob import covers, tmpstore, CoverJob, EncodeJob, UpdateJob, PIPE_CHUNK, STAGE_DECODE, STAGE_ENCODE
+from tinstats import stats
+
+
+# stderr kept per process (diagnostics of failures)
+STDERR_TAIL = 4096
+
+
+async def reap(name: str, process: asyncio.subprocess.Process) -> Tuple[str, int, bytes]:
+    """
+    Waits for a process, collects the end of its stderr meanwhile
+
+    Arguments:
+        name {str} -- Program
+        process {Process} -- Process started with stderr piped
+
+    Returns:
+        (str, int, bytes) -- Program, Exit status, End of stderr
+    """
+    tail = b''
+    chunk = await process.stderr.read(PIPE_CHUNK)
+    while chunk:
+        tail = (tail + chunk)[-STDERR_TAIL:]
+        chunk = await process.stderr.read(PIPE_CHUNK)
+    return (name, await process.wait(), tail)
+
+
+def check(results: List[Tuple[str, int, bytes]]) -> None:
+    """
+    Raises on the first failed process
+
+    Arguments:
+        results {List[(str, int, bytes)]} -- Reaped processes (see reap)
+
+    Raises:
+        Exception: When any of the processes failed, with its last stderr line
+    """
+    # killed ones (eg. the producer of failed consumers) last
+    for (name, status, tail) in sorted(results, key=lambda r: r[1] < 0):
+        if status != 0:
+            lines = tail.decode('utf8', 'replace').strip().splitlines()
+            raise Exception("{} failed ({:d}): {}".format(name, status, lines[-1] if lines else ''))
+
+
+async def chain(commands: List[List[str]], stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL) -> List[Tuple[str, asyncio.subprocess.Process]]:
+    """
+    Starts processes each reading the previous one's output (pipes between children, not through us)
+
+    Arguments:
+        commands {List[List[str]]} -- Command lines in order
+        stdin {int|file} -- Input of the first process
+        stdout {int|file} -- Output of the last process
+
+    Returns:
+        List[(str, Process)] -- Programs and their processes (stderr piped)
+    """
+    processes = []
+    feed = stdin
+    try:
+        for (i, args) in enumerate(commands):
+            (r, w) = (None, stdout)
+            if i + 1 < len(commands):
+                (r, w) = os.pipe()
+            try:
+                p = await asyncio.create_subprocess_exec(*args, stdin=feed, stdout=w, stderr=asyncio.subprocess.PIPE)
+            except BaseException:
+                if r is not None:
+                    os.close(r)
+                raise
+            finally:
+                # the children hold their ends
+                if i > 0:
+                    os.close(feed)
+                if r is not None:
+                    os.close(w)
+            processes.append((args[0], p))
+            feed = r
+    except BaseException:
+        await kill(processes)
+        raise
+    return processes
+
+
+async def kill(processes: List[Tuple[str, asyncio.subprocess.Process]]) -> None:
+    """
+    Kills the processes still running
+
+    Arguments:
+        processes {List[(str, Process)]} -- Programs and their processes
+    """
+    for (name, p) in processes:
+        if p.returncode is None:
+            try:
+                p.kill()
+            except ProcessLookupError:
+                pass
+            await p.wait()
+
+
+async def call(args: List[str], output: bool = False) -> bytes:
+    """
+    Runs a command
+
+    Arguments:
+        args {List[str]} -- Command line
+        output {bool} -- Collect its stdout
+
+    Raises:
+        Exception: When it failed, with its last stderr line
+
+    Returns:
+        bytes -- Its stdout (None if not collected)
+    """
+    if not output:
+        processes = await chain([args])
+        try:
+            check([await reap(*processes[0])])
+        finally:
+            await kill(processes)
+        return None
+    processes = await chain([args], stdout=asyncio.subprocess.PIPE)
+    try:
+        (data, result) = await asyncio.gather(processes[0][1].stdout.read(), reap(*processes[0]))
+        check([result])
+    finally:
+        await kill(processes)
+    return data
+
+
+async def tee(source: asyncio.StreamReader, heads: List[asyncio.StreamWriter]) -> bool:
+    """
+    Copies a stream into several ones (consumers exiting early are dropped)
+
+    Arguments:
+        source {StreamReader} -- Producer's output
+        heads {List[StreamWriter]} -- Consumers' inputs
+
+    Returns:
+        bool -- True if the source was read to its end
+    """
+    alive = list(heads)
+    chunk = await source.read(PIPE_CHUNK)
+    while chunk and alive:
+        for h in alive:
+            h.write(chunk)
+        drained = await asyncio.gather(*[h.drain() for h in alive], return_exceptions=True)
+        alive = [h for (h, d) in zip(alive, drained) if d is None]
+        chunk = await source.read(PIPE_CHUNK)
+    for h in heads:
+        try:
+            h.close()
+            await h.wait_closed()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+    return not chunk
+
+
+class AsyncScheduler(object):
+    """
+    Dependency-aware pipelined job scheduler on asyncio
+
+    Same interface and ordering as Scheduler (see tinsched), but jobs
+    are coroutines of a single event loop: decoders, downmixers and
+    encoders are child processes awaited without a thread each, their
+    pipes wired to one another directly (tee'd only when one decoder
+    feeds several encoders), their stderr kept for the failure reports.
+    Stage pools are semaphores, a job holds its stage's slot until the
+    next stage has room for it (bounded handoff). Covers are converted
+    by awaited child processes too (once per cover, into the cover
+    cache) before the jobs needing them. What runs in process (tagging,
+    PCM downmix, moves) goes to a thread pool no larger than the stage
+    pools.
+    """
+
+    def __init__(self, workers: Dict[str, int], bound: int = None) -> None:
+        """
+        Arguments:
+            workers {Dict[str, int]} -- Number of jobs run at once per stage
+            bound {int} -- Jobs waiting between stages or None (next stage's workers)
+        """
+        self.workers = workers
+        self.bounds = {}
+        for (stage, count) in workers.items():
+            self.bounds[stage] = bound or count
+        self.submitted = []
+        self.done = set()
+        self.executor = None
+
+    def start(self) -> None:
+        """
+        Starts the thread pool of the in-process work
+        """
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=sum(self.workers.values()))
+
+    def submit(self, job, deps: List = ()) -> None:
+        """
+        Adds a job
+
+        Arguments:
+            job {GenericJob} -- Job
+            deps {List[GenericJob]} -- Jobs to finish beforehand
+
+        Raises:
+            Exception: When the job has a stage without workers
+        """
+        for stage in job.stages():
+            if stage not in self.workers:
+                raise Exception("No workers for stage: " + stage)
+        self.submitted.append((job, job.cost(), list(deps)))
+
+    def join(self) -> None:
+        """
+        Runs the submitted jobs until all of them are done
+        """
+        submitted = self.submitted
+        self.submitted = []
+        if submitted:
+            asyncio.run(self.main(submitted))
+
+    def forget(self) -> None:
+        """
+        Drops the done jobs (no job submitted later may depend on them)
+        """
+        self.done = set()
+
+    def stop(self) -> None:
+        """
+        Stops the thread pool
+        """
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def main(self, submitted: List) -> None:
+        """
+        Runs jobs, the costly ones first
+
+        Arguments:
+            submitted {List[(GenericJob, float, List[GenericJob])]} -- Jobs, their costs and dependencies
+        """
+        # cover conversions of this loop
+        self.conversions = {}
+        self.pools = dict([(stage, asyncio.Semaphore(count)) for (stage, count) in self.workers.items()])
+        self.queues = dict([(stage, asyncio.Semaphore(count)) for (stage, count) in self.bounds.items()])
+        events = dict([(job, asyncio.Event()) for (job, cost, deps) in submitted])
+        # waiters are woken in order
+        order = sorted(range(0, len(submitted)), key=lambda i: (-submitted[i][1], i))
+        tasks = []
+        for i in order:
+            (job, cost, deps) = submitted[i]
+            waits = [events[d] for d in deps if d in events and d not in self.done]
+            tasks.append(self.run(job, waits, events[job]))
+        await asyncio.gather(*tasks)
+
+    async def offload(self, f, *args):
+        """
+        Runs blocking in-process work on the thread pool
+
+        Arguments:
+            f {Callable} -- Function
+
+        Returns:
+            object -- Its result
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(f, *args))
+
+    async def run(self, job, deps: List[asyncio.Event], event: asyncio.Event) -> None:
+        """
+        Runs the stages of a job
+
+        Arguments:
+            job {GenericJob} -- Job
+            deps {List[Event]} -- Dependencies' completion
+            event {Event} -- Completion of the job (set even if failed)
+        """
+        try:
+            for d in deps:
+                await d.wait()
+            stages = job.stages()
+            for (i, stage) in enumerate(stages):
+                async with self.pools[stage]:
+                    if i == 0:
+                        job.announce(False)
+                    else:
+                        self.queues[stage].release()
+                    try:
+                        await self.runstage(job, stage, i == 0)
+                    except Exception as e:
+                        job.announce(True)
+                        print("ERROR: {}".format(e))
+                        try:
+                            await self.offload(job.cleanup)
+                        except Exception:
+                            pass
+                        return
+                    if i + 1 < len(stages):
+                        await self.queues[stages[i + 1]].acquire()
+        finally:
+            self.done.add(job)
+            event.set()
+
+    async def runstage(self, job, stage: str, first: bool) -> None:
+        """
+        Runs a stage of a job (child processes of track encodes awaited)
+
+        Arguments:
+            job {GenericJob} -- Job
+            stage {str} -- Stage
+            first {bool} -- First stage of the job
+        """
+        if isinstance(job, EncodeJob) and stage in (STAGE_DECODE, STAGE_ENCODE):
+            if first:
+                job.journalstart()
+            if stage == STAGE_DECODE:
+                await self.decode(job)
+            elif job.streaming():
+                await self.pipe(job)
+            else:
+                if job.presplitted:
+                    await self.decode(job)
+                await self.encode(job)
+        else:
+            if isinstance(job, CoverJob):
+                await self.convert(job, job.albumset.getcover(), True)
+            elif isinstance(job, UpdateJob) and job.recover:
+                (cover, meta) = await self.offload(job.albumset.exportmeta, job.discnumber, job.tracknumber)
+                await self.convert(job, cover)
+            await self.offload(job.runstage, stage)
+
+    async def convert(self, job, cover: str, jpeg: bool = False) -> None:
+        """
+        Converts a job's cover into the cover cache (see CoverCache.convertargs)
+
+        Covers taken as is are left to the job. A failed conversion is
+        cached as no cover, same as the in process one.
+
+        Arguments:
+            job {GenericJob} -- Job
+            cover {str} -- Cover file (relative to album collection' root) or None
+            jpeg {bool} -- Convert to JPEG
+        """
+        if not cover:
+            return
+        cover = os.path.join(job.albumset.getroot(), cover)
+        try:
+            key = covers.key(cover, jpeg)
+            args = covers.convertargs(cover, jpeg)
+        except OSError:
+            # missing, the job fails on its own
+            return
+        if args is None or covers.cached(key):
+            return
+        if key not in self.conversions:
+            self.conversions[key] = asyncio.ensure_future(self.converter(key, args))
+        await self.conversions[key]
+
+    async def converter(self, key: Tuple[str, float, bool], args: List[str]) -> None:
+        """
+        Runs a cover conversion, caches its result
+
+        Arguments:
+            key {(str, float, bool)} -- Cover cache key
+            args {List[str]} -- Converter command line
+        """
+        try:
+            data = await call(args, True)
+        except Exception:
+            data = b''
+        covers.put(key, data)
+
+    async def decode(self, job: EncodeJob) -> None:
+        """
+        Decodes a track into a temp WAV (see EncodeJob.decode)
+
+        Arguments:
+            job {EncodeJob} -- Job
+        """
+        if False not in job.wavs:
+            # temp wav, waits for temp space
+            job.reserved = job.tempsize()
+            job.tier = await self.offload(tmpstore.reserve, job.reserved)
+            (no, tmpwav) = tempfile.mkstemp(suffix='.wav', prefix=tmpstore.prefix, dir=job.tier)
+            os.close(no)
+            job.wavs[False] = tmpwav
+            t = time.perf_counter()
+            await call(job.albumset.exportfileargs(job.discnumber, job.tracknumber, tmpwav))
+            stats.record('decode', time.perf_counter() - t, job.key, read=job.sourcesize())
+        (cover, meta) = await self.offload(job.albumset.exportmeta, job.discnumber, job.tracknumber)
+        await self.convert(job, cover)
+        await self.offload(job.prepare, cover, meta)
+        await self.offload(job.downmix, job.wavs[False])
+
+    async def encode(self, job: EncodeJob) -> None:
+        """
+        Encodes a decoded track into every destination (see EncodeJob.encode)
+
+        Arguments:
+            job {EncodeJob} -- Job
+        """
+        for (dstroot, dstfile, encoder) in job.targets:
+            tmp = job.tmpoutput(encoder)
+            job.outputs.append((dstroot, dstfile, encoder, tmp))
+            wavf = job.wavs[encoder.downmix]
+            t = time.perf_counter()
+            await call(encoder.encodeargs(wavf, tmp))
+            stats.record('encode', time.perf_counter() - t, job.key, encoder.codec, job.duration())
+        # delete wav(s)
+        for f in set(job.wavs.values()):
+            if os.path.isfile(f):
+                os.remove(f)
+        job.wavs = {}
+        job.release()
+
+    async def pipe(self, job: EncodeJob) -> None:
+        """
+        Streams a track's decoder into every encoder (see EncodeJob.pipe)
+
+        A single encoder (or downmixer) reads the decoder's pipe itself,
+        several ones are fed chunk by chunk.
+
+        Arguments:
+            job {EncodeJob} -- Job
+
+        Raises:
+            Exception: When any of the processes failed
+        """
+        t = time.perf_counter()
+        (cover, meta) = await self.offload(job.albumset.exportmeta, job.discnumber, job.tracknumber)
+        await self.convert(job, cover)
+        await self.offload(job.prepare, cover, meta)
+        channels = job.albumset.getchannels(job.discnumber, job.tracknumber)
+        multichannel = channels is None or channels > 2
+        consumers = []
+        for (dstroot, dstfile, encoder) in job.targets:
+            tmp = job.tmpoutput(encoder)
+            job.outputs.append((dstroot, dstfile, encoder, tmp))
+            commands = [encoder.encodeargs('-', tmp)]
+            if encoder.downmix and multichannel:
+                commands.insert(0, encoder.downmixargs())
+            consumers.append(commands)
+        decoder = job.albumset.exportargs(job.discnumber, job.tracknumber)
+        processes = []
+        reaps = []
+        try:
+            if len(consumers) == 1:
+                processes.extend(await chain([decoder] + consumers[0]))
+                reaps = [asyncio.ensure_future(reap(*p)) for p in processes]
+            else:
+                processes.extend(await chain([decoder], stdout=asyncio.subprocess.PIPE))
+                heads = []
+                for commands in consumers:
+                    c = await chain(commands, stdin=asyncio.subprocess.PIPE)
+                    processes.extend(c)
+                    heads.append(c[0][1].stdin)
+                reaps = [asyncio.ensure_future(reap(*p)) for p in processes]
+                if not await tee(processes[0][1].stdout, heads):
+                    # nobody listens any more
+                    await kill(processes[0:1])
+            check(await asyncio.gather(*reaps))
+        finally:
+            await kill(processes)
+            for r in reaps:
+                if not r.done():
+                    r.cancel()
+        # decoder and encoders ran together, every codec took the whole time
+        seconds = time.perf_counter() - t
+        read = job.sourcesize()
+        for o in job.outputs:
+            stats.record('pipe', seconds, job.key, o[2].codec, job.duration(), read=read)
+            # the source is read once for all encoders
+            read = 0
@@ -151,8 +151,16 @@ class Album(object):
         self.covertime = 0
         self.trackname = []
         self.tracktime = []
+        self.trackaudiotime = []
+        self.trackmetatime = []
         self.trackmeta = []
         self.tracktotal = 0
+        self.metaloaded = False
+        self.metalock = threading.Lock()
+        self.coverdigest = None
+        self.digests = {}
+        self.digestlocks = {}
+        self.digestlock = threading.Lock()
 
     def dump(self) -> List[str]:
         """
@@ -182,6 +190,59 @@ class Album(object):
         """
         return self.trackmeta[tracknumber - 1]
 
+    def loadmeta(self) -> None:
+        """
+        Loads metadata of the album (once, thread-safe)
+        """
+        with self.metalock:
+            if not self.metaloaded:
+                self.trackmeta = self.readmeta()
+                self.metaloaded = True
+
+    def fingerprint(self, tracknumber: int) -> Tuple[str, str, str]:
+        """
+        Content fingerprint of a track (independent of modification times)
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            (str, str, str) -- Audio, Metadata, Cover digests
+        """
+        self.loadmeta()
+        meta = dict(self.getmeta(tracknumber))
+        meta['~trackname'] = [self.trackname[tracknumber - 1]]
+        if self.coverfile and self.coverdigest is None:
+            self.coverdigest = filedigest(os.path.join(self.icache.getroot(), self.coverfile))
+        return (self.audiodigest(tracknumber), metadigest(meta), self.coverdigest or '')
+
+    def contentdigest(self, f: str) -> str:
+        """
+        Content hash of a file of the album (once per file, thread-safe)
+
+        Arguments:
+            f {str} -- File
+
+        Returns:
+            str -- Hex digest
+        """
+        with self.digestlock:
+            if f in self.digests:
+                return self.digests[f]
+            if f not in self.digestlocks:
+                self.digestlocks[f] = threading.Lock()
+            filelock = self.digestlocks[f]
+        # single read per file, others wait for it
+        with filelock:
+            with self.digestlock:
+                if f in self.digests:
+                    return self.digests[f]
+            digest = filedigest(f)
+            with self.digestlock:
+                self.digests[f] = digest
+                del self.digestlocks[f]
+        return digest
+
     def recalcmtimes(self) -> None:
         """
         Re-calculates album modification times
@@ -199,6 +260,75 @@ class Album(object):
         """
         return self.coverfile
 
+    def getchannels(self, tracknumber: int) -> int:
+        """
+        Number of audio channels of a track
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            int -- Channels or None if unknown
+        """
+        return None
+
+    def getformat(self, tracknumber: int) -> Tuple[int, int, int]:
+        """
+        PCM format a track decodes to
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            (int, int, int) -- Sample rate, Channels, Bytes per sample
+        """
+        return PCM_FORMAT_CD
+
+    def getduration(self, tracknumber: int) -> float:
+        """
+        Duration of a track (estimate)
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            float -- Seconds
+        """
+        return 0.0
+
+    def getsize(self, tracknumber: int) -> int:
+        """
+        Source bytes of a track
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            int -- Bytes
+        """
+        return 0
+
+    def splittable(self) -> bool:
+        """
+        Whether all tracks can be cut from a single decode (see split)
+
+        Returns:
+            bool -- True if supported
+        """
+        return False
+
+    def split(self, wavfiles: Dict[int, str]) -> None:
+        """
+        Export tracks to PCM WAV files at once
+
+        Arguments:
+            wavfiles {Dict[int, str]} -- WAV file per track number
+
+        Raises:
+            Exception: When not supported
+        """
+        raise Exception("Split not supported: " + self.key)
+
     def load(self) -> None:
         self.loadtrackname()
         self.findcover()
@@ -216,6 +346,18 @@ class Album(object):
         """
         return self.tracktime[number]
 
+    def gettracktimes(self, number: int) -> Tuple[float, float, float]:
+        """
+        Track's modification times per component
+
+        Arguments:
+            number {int} -- Track index
+
+        Returns:
+            (float, float, float) -- Audio, Metadata, Cover modification times
+        """
+        return (self.trackaudiotime[number], self.trackmetatime[number], self.covertime)
+
 
 class AlbumSplit(Album):
     """
@@ -244,14 +386,119 @@ class AlbumSplit(Album):
             wavfile {str} -- WAV file
         """
         FNULL = open(os.devnull, 'w')
+        subprocess.call(self.exportfileargs(tracknumber, wavfile), stdout=FNULL, stderr=FNULL)
+        FNULL.close()
+
+    def exportfileargs(self, tracknumber: int, wavfile: str) -> List[str]:
+        """
+        Command line exporting a track to PCM WAV file
+
+        Arguments:
+            tracknumber {int} -- Track number
+            wavfile {str} -- WAV file
+
+        Returns:
+            List[str] -- Decoder command line
+        """
         tunefile = os.path.join(self.icache.getroot(), self.albumdir, self.tracktunes[tracknumber - 1])
         if self.format == 'DTS':
             # DTS
-            subprocess.call(['ffmpeg', '-y', '-i', tunefile, '-vn', '-c:a', 'pcm_s24le', wavfile], stdout=FNULL, stderr=FNULL)
-        else:
-            # FLAC
-            subprocess.call(['flac', '-f', '--totally-silent', '-d', '-o', wavfile, tunefile], stdout=FNULL, stderr=FNULL)
-        FNULL.close()
+            return ['ffmpeg', '-y', '-i', tunefile, '-vn', '-c:a', 'pcm_s24le', wavfile]
+        # FLAC
+        return ['flac', '-f', '--totally-silent', '-d', '-o', wavfile, tunefile]
+
+    def exportargs(self, tracknumber: int) -> List[str]:
+        """
+        Command line decoding a track to PCM WAV on stdout
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            List[str] -- Decoder command line
+        """
+        tunefile = os.path.join(self.icache.getroot(), self.albumdir, self.tracktunes[tracknumber - 1])
+        if self.format == 'DTS':
+            # DTS
+            return ['ffmpeg', '-i', tunefile, '-vn', '-c:a', 'pcm_s24le', '-f', 'wav', '-']
+        # FLAC
+        return ['flac', '--totally-silent', '-d', '-c', tunefile]
+
+    def getchannels(self, tracknumber: int) -> int:
+        """
+        Number of audio channels of a track
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            int -- Channels or None if unknown (DTS)
+        """
+        if self.format == 'DTS':
+            return None
+        tunefile = os.path.join(self.icache.getroot(), self.albumdir, self.tracktunes[tracknumber - 1])
+        return FLAC(tunefile).info.channels
+
+    def getformat(self, tracknumber: int) -> Tuple[int, int, int]:
+        """
+        PCM format a track decodes to
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            (int, int, int) -- Sample rate, Channels, Bytes per sample (DTS assumed 5.1)
+        """
+        if self.format == 'DTS':
+            return PCM_FORMAT_DTS
+        tunefile = os.path.join(self.icache.getroot(), self.albumdir, self.tracktunes[tracknumber - 1])
+        info = FLAC(tunefile).info
+        return (info.sample_rate, info.channels, (info.bits_per_sample + 7) // 8)
+
+    def getduration(self, tracknumber: int) -> float:
+        """
+        Duration of a track (STREAMINFO, DTS estimated from its size)
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            float -- Seconds
+        """
+        tunefile = os.path.join(self.icache.getroot(), self.albumdir, self.tracktunes[tracknumber - 1])
+        if self.format == 'DTS':
+            return os.path.getsize(tunefile) / DTS_BYTES_PER_SECOND
+        return FLAC(tunefile).info.length
+
+    def getsize(self, tracknumber: int) -> int:
+        """
+        Source bytes of a track (its file)
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            int -- Bytes
+        """
+        return os.path.getsize(os.path.join(self.icache.getroot(), self.albumdir, self.tracktunes[tracknumber - 1]))
+
+    def audiodigest(self, tracknumber: int) -> str:
+        """
+        Fingerprint of a track's audio (FLAC STREAMINFO MD5)
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            str -- Hex digest
+        """
+        tunefile = os.path.join(self.icache.getroot(), self.albumdir, self.tracktunes[tracknumber - 1])
+        if self.format != 'DTS':
+            md5 = FLAC(tunefile).info.md5_signature
+            if md5:
+                return "{:032x}".format(md5)
+        # no STREAMINFO (or unset MD5)
+        return self.contentdigest(tunefile)
 
     def loadtrackname(self) -> None:
         """
@@ -289,6 +536,9 @@ class AlbumSplit(Album):
                     self.trackname.append(tunes[i][pl:-5])
                 self.tracktunes.append(tunes[i])
                 self.tracktime.append(self.icache.getmtime(os.path.join(self.albumdir, tunes[i])))
+                # tags live in the very same file
+                self.trackaudiotime.append(self.tracktime[-1])
+                self.trackmetatime.append(self.tracktime[-1])
             else:
                 raise Exception("TUNE-CHAOS: %s" % self.albumdir)
             i += 1
@@ -330,19 +580,23 @@ class AlbumSplit(Album):
             self.covertime = self.icache.getmtime(self.coverfile)
         return None
 
-    def loadmeta(self) -> None:
+    def readmeta(self) -> List[Dict[str, List[str]]]:
         """
-        Loads metadata of the album
+        Reads metadata of the album
 
         Raises:
             Exception: When discrepancy within the album
+
+        Returns:
+            List[Dict[str, List[str]]] -- Metadata per track
         """
+        trackmeta = []
         for i in range(0, self.tracktotal):
             if self.tracktotal > 99:
                 ii = "{:03d}".format(i + 1)
             else:
                 ii = "{:02d}".format(i + 1)
-            self.trackmeta.append({})
+            trackmeta.append({})
             if self.format == 'DTS':
                 # DTS
                 f = os.path.join(self.icache.getroot(), self.albumdir, ii + " " + self.trackname[i] + ".dts")
@@ -361,33 +615,33 @@ class AlbumSplit(Album):
 
                 # album
                 if 'Album' in dts.keys():
-                    self.trackmeta[i]['album'] = [str(xx) for xx in dts['Album']]
+                    trackmeta[i]['album'] = [str(xx) for xx in dts['Album']]
                 # artist
                 if 'Artist' in dts.keys():
-                    self.trackmeta[i]['artist'] = [str(xx) for xx in dts['Artist']]
+                    trackmeta[i]['artist'] = [str(xx) for xx in dts['Artist']]
                 # year
                 if 'Year' in dts.keys():
-                    self.trackmeta[i]['date'] = [str(xx) for xx in dts['Year']]
+                    trackmeta[i]['date'] = [str(xx) for xx in dts['Year']]
                 # title
                 if 'Title' in dts.keys():
-                    self.trackmeta[i]['title'] = [str(xx) for xx in dts['Title']]
+                    trackmeta[i]['title'] = [str(xx) for xx in dts['Title']]
             else:
                 # FLAC
                 f = os.path.join(self.icache.getroot(), self.albumdir, ii + " " + self.trackname[i] + ".flac")
                 ff = FLAC(f)
                 for t in ff.keys():
-                    self.trackmeta[i][t.lower()] = ff[t]
+                    trackmeta[i][t.lower()] = ff[t]
                 for t in SUPPRESS_TAGS:
-                    if t in self.trackmeta[i].keys():
-                        del self.trackmeta[i][t]
+                    if t in trackmeta[i].keys():
+                        del trackmeta[i][t]
 
             if self.tracktotal > 99:
-                self.trackmeta[i]['tracknumber'] = ["{:03d}".format(i + 1)]
-                self.trackmeta[i]['tracktotal'] = ["{:03d}".format(self.tracktotal)]
+                trackmeta[i]['tracknumber'] = ["{:03d}".format(i + 1)]
+                trackmeta[i]['tracktotal'] = ["{:03d}".format(self.tracktotal)]
             else:
-                self.trackmeta[i]['tracknumber'] = ["{:02d}".format(i + 1)]
-                self.trackmeta[i]['tracktotal'] = ["{:02d}".format(self.tracktotal)]
-        return None
+                trackmeta[i]['tracknumber'] = ["{:02d}".format(i + 1)]
+                trackmeta[i]['tracktotal'] = ["{:02d}".format(self.tracktotal)]
+        return trackmeta
 
 
 class AlbumCue(Album):
@@ -406,6 +660,9 @@ class AlbumCue(Album):
         self.reldir = reldir
         self.key = key
         self.cdroot = cdroot
+        self.cuesheet = None
+        self.samplerate = 44100
+        self.md5 = None
 
     def export(self, tracknumber: int, wavfile: str) -> None:
         """
@@ -416,11 +673,196 @@ class AlbumCue(Album):
             wavfile {str} -- WAV file
         """
         FNULL = open(os.devnull, 'w')
-        flacfile = os.path.join(self.icache.getroot(), self.reldir, self.cdroot + ".flac")
-        subprocess.call(['flac', '-f', '--totally-silent', '-d', '-o', wavfile,
-                         "--cue={:d}.1-{:d}.1".format(tracknumber, tracknumber + 1), flacfile], stdout=FNULL, stderr=FNULL)
+        subprocess.call(self.exportfileargs(tracknumber, wavfile), stdout=FNULL, stderr=FNULL)
         FNULL.close()
 
+    def exportfileargs(self, tracknumber: int, wavfile: str) -> List[str]:
+        """
+        Command line exporting a track to PCM WAV file
+
+        Arguments:
+            tracknumber {int} -- Track number
+            wavfile {str} -- WAV file
+
+        Returns:
+            List[str] -- Decoder command line
+        """
+        flacfile = os.path.join(self.icache.getroot(), self.reldir, self.cdroot + ".flac")
+        return ['flac', '-f', '--totally-silent', '-d', '-o', wavfile,
+                "--cue={:d}.1-{:d}.1".format(tracknumber, tracknumber + 1), flacfile]
+
+    def exportargs(self, tracknumber: int) -> List[str]:
+        """
+        Command line decoding a track to PCM WAV on stdout
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            List[str] -- Decoder command line
+        """
+        flacfile = os.path.join(self.icache.getroot(), self.reldir, self.cdroot + ".flac")
+        return ['flac', '--totally-silent', '-d', '-c',
+                "--cue={:d}.1-{:d}.1".format(tracknumber, tracknumber + 1), flacfile]
+
+    def getchannels(self, tracknumber: int) -> int:
+        """
+        Number of audio channels of a track
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            int -- Channels
+        """
+        flacfile = os.path.join(self.icache.getroot(), self.reldir, self.cdroot + ".flac")
+        return FLAC(flacfile).info.channels
+
+    def getformat(self, tracknumber: int) -> Tuple[int, int, int]:
+        """
+        PCM format a track decodes to
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            (int, int, int) -- Sample rate, Channels, Bytes per sample
+        """
+        flacfile = os.path.join(self.icache.getroot(), self.reldir, self.cdroot + ".flac")
+        info = FLAC(flacfile).info
+        return (info.sample_rate, info.channels, (info.bits_per_sample + 7) // 8)
+
+    def trackoffset(self, tracknumber: int) -> int:
+        """
+        First sample of a track (INDEX 01 of the embedded cuesheet)
+
+        Arguments:
+            tracknumber {int} -- Track number (tracktotal + 1 for the lead-out)
+
+        Returns:
+            int -- Sample offset
+        """
+        track = self.cuesheet.tracks[tracknumber - 1]
+        for index in track.indexes:
+            if index.index_number == 1:
+                return track.start_offset + index.index_offset
+        return track.start_offset
+
+    def splittable(self) -> bool:
+        """
+        Whether all tracks can be cut from a single decode (see split)
+
+        Returns:
+            bool -- True
+        """
+        return True
+
+    def split(self, wavfiles: Dict[int, str]) -> None:
+        """
+        Export tracks to PCM WAV files decoding the image once
+
+        The image is decoded sequentially (raw PCM) and cut at the
+        cuesheet's INDEX 01 offsets, same as flac --cue=N.1-N+1.1 per
+        track. Decoding stops after the last requested track.
+
+        Arguments:
+            wavfiles {Dict[int, str]} -- WAV file per track number
+
+        Raises:
+            Exception: When decoding failed or the image is shorter than its cuesheet
+        """
+        flacfile = os.path.join(self.icache.getroot(), self.reldir, self.cdroot + ".flac")
+        info = FLAC(flacfile).info
+        width = (info.bits_per_sample + 7) // 8
+        frame = info.channels * width
+        slices = [(n, self.trackoffset(n), self.trackoffset(n + 1), wavfiles[n]) for n in sorted(wavfiles.keys())]
+        last = slices[-1][2]
+        FNULL = open(os.devnull, 'w')
+        p = subprocess.Popen(['flac', '--totally-silent', '-d', '-c', '--force-raw-format',
+                              '--endian=little', '--sign=signed', flacfile], stdout=subprocess.PIPE, stderr=FNULL)
+        writers = {}
+        position = 0
+        try:
+            while position < last:
+                data = p.stdout.read(SPLIT_CHUNK_FRAMES * frame)
+                if not data:
+                    break
+                end = position + len(data) // frame
+                for (n, start, stop, wavfile) in slices:
+                    if start >= end or stop <= position:
+                        continue
+                    if n not in writers:
+                        w = wave.open(wavfile, 'wb')
+                        w.setnchannels(info.channels)
+                        w.setsampwidth(width)
+                        w.setframerate(info.sample_rate)
+                        writers[n] = w
+                    a = max(start, position) - position
+                    b = min(stop, end) - position
+                    writers[n].writeframes(data[a * frame:b * frame])
+                    if stop <= end:
+                        writers.pop(n).close()
+                position = end
+        finally:
+            for w in writers.values():
+                w.close()
+            p.stdout.close()
+            if p.poll() is None:
+                # past the last requested track
+                p.kill()
+            p.wait()
+            FNULL.close()
+        if position < last:
+            raise Exception("CUE image split failed: " + flacfile)
+
+    def getduration(self, tracknumber: int) -> float:
+        """
+        Duration of a track (from the embedded cuesheet)
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            float -- Seconds
+        """
+        start = self.cuesheet.tracks[tracknumber - 1].start_offset
+        end = self.cuesheet.tracks[tracknumber].start_offset
+        return (end - start) / self.samplerate
+
+    def getsize(self, tracknumber: int) -> int:
+        """
+        Source bytes of a track (its share of the image)
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            int -- Bytes
+        """
+        flacfile = os.path.join(self.icache.getroot(), self.reldir, self.cdroot + ".flac")
+        start = self.cuesheet.tracks[tracknumber - 1].start_offset
+        end = self.cuesheet.tracks[tracknumber].start_offset
+        leadout = self.cuesheet.tracks[-1].start_offset
+        return os.path.getsize(flacfile) * (end - start) // max(1, leadout)
+
+    def audiodigest(self, tracknumber: int) -> str:
+        """
+        Fingerprint of a track's audio (image's STREAMINFO MD5 + track boundaries)
+
+        Arguments:
+            tracknumber {int} -- Track number
+
+        Returns:
+            str -- Hex digest
+        """
+        md5 = self.md5
+        if not md5:
+            # the whole image, once for all its tracks
+            md5 = self.contentdigest(os.path.join(self.icache.getroot(), self.reldir, self.cdroot + ".flac"))
+        start = self.cuesheet.tracks[tracknumber - 1].start_offset
+        end = self.cuesheet.tracks[tracknumber].start_offset
+        return "{}:{:d}:{:d}".format(md5, start, end)
+
     def findcover(self) -> None:
         """
         Automatic probe for album's cover
@@ -456,16 +898,20 @@ class AlbumCue(Album):
         f = os.path.join(self.icache.getroot(), self.reldir, self.cdroot + ".files.yml")
         ff = os.path.join(self.reldir, self.cdroot + ".flac")
         fm = os.path.join(self.reldir, self.cdroot + ".meta.txt")
-        globaltime = max(self.icache.getmtime(ff), self.icache.getmtime(fm))
+        audiotime = self.icache.getmtime(ff)
+        metatime = self.icache.getmtime(fm)
+        globaltime = max(audiotime, metatime)
         y = None
         with open(f, 'r') as stream:
-            y = yaml.load(stream)
+            y = yaml.safe_load(stream)
         i = 1
         ok = True
         while i < 100 and ok:
             try:
                 self.trackname.append(y[i])
                 self.tracktime.append(globaltime)
+                self.trackaudiotime.append(audiotime)
+                self.trackmetatime.append(metatime)
                 i += 1
             except KeyError:
                 ok = False
@@ -478,15 +924,22 @@ class AlbumCue(Album):
         if len(cue.tracks) != i:
             raise Exception("CueSheet tracknumber mismatch %s i=%d cue=%d" %
                             (os.path.join(self.icache.getroot(), ff), i, len(cue.tracks)))
+        self.cuesheet = cue
+        self.samplerate = tmp.info.sample_rate
+        if tmp.info.md5_signature:
+            self.md5 = "{:032x}".format(tmp.info.md5_signature)
         # set the number of tracks
         self.tracktotal = len(self.trackname)
 
-    def loadmeta(self) -> None:
+    def readmeta(self) -> List[Dict[str, List[str]]]:
         """
-        Load album's metadata
+        Reads album's metadata
 
         Raises:
             Exception: When discrepancy within the album
+
+        Returns:
+            List[Dict[str, List[str]]] -- Metadata per track
         """
         common = {}
         pertrack = []
@@ -500,34 +953,38 @@ class AlbumCue(Album):
         for line in content:
             # filter comments
             if not PATTERN_COMMENT.match(line):
-                if PATTERN_META_PERTRACK.match(line):
-                    no = int(PATTERN_META_PERTRACK.search(line).group(1), 10)
-                    tag = PATTERN_META_PERTRACK.search(line).group(2).lower()
-                    value = PATTERN_META_PERTRACK.search(line).group(3)
+                m = PATTERN_META_PERTRACK.match(line)
+                if m:
+                    no = int(m.group(1), 10)
+                    tag = m.group(2).lower()
+                    value = m.group(3)
                     # push into dict
                     if tag in pertrack[no - 1].keys():
                         pertrack[no - 1][tag].append(value)
                     else:
                         pertrack[no - 1][tag] = [value]
                 else:
-                    tag = PATTERN_META_COMMON.search(line).group(1).lower()
-                    value = PATTERN_META_COMMON.search(line).group(2)
+                    m = PATTERN_META_COMMON.search(line)
+                    tag = m.group(1).lower()
+                    value = m.group(2)
                     # common tags
                     if tag in common.keys():
                         common[tag].append(value)
                     else:
                         common[tag] = [value]
         # post-processing
+        trackmeta = []
         for i in range(0, self.tracktotal):
-            self.trackmeta.append({})
+            trackmeta.append({})
             for k in common.keys():
-                self.trackmeta[i][k] = common[k]
+                trackmeta[i][k] = common[k]
             for k in pertrack[i].keys():
-                self.trackmeta[i][k] = pertrack[i][k]
+                trackmeta[i][k] = pertrack[i][k]
             for t in SUPPRESS_TAGS:
-                if t in self.trackmeta[i].keys():
-                    del self.trackmeta[i][t]
-            self.trackmeta[i]['tracknumber'] = ["{:02d}".format(i + 1)]
+                if t in trackmeta[i].keys():
+                    del trackmeta[i][t]
+            trackmeta[i]['tracknumber'] = ["{:02d}".format(i + 1)]
+        return trackmeta
 
 
 class AlbumSet(object):
@@ -611,6 +1068,15 @@ class AlbumSet(object):
                 a.load()
             self.loaded = True
 
+    def getcovertime(self) -> float:
+        """
+        Cover's modification time for the album set
+
+        Returns:
+            float -- Modification time (0 if no cover)
+        """
+        return self.albums[0].covertime
+
     def getcover(self) -> str:
         """
         Cover for the album set
@@ -633,11 +1099,151 @@ class AlbumSet(object):
             (str, str) -- Cover, MetaData
         """
         self.albums[discnumber - 1].export(tracknumber, wavfile)
+        return self.exportmeta(discnumber, tracknumber)
+
+    def exportargs(self, discnumber: int, tracknumber: int) -> List[str]:
+        """
+        Command line decoding a track to PCM WAV on stdout
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            tracknumber {int} -- Track number of the album
+
+        Returns:
+            List[str] -- Decoder command line
+        """
+        return self.albums[discnumber - 1].exportargs(tracknumber)
+
+    def exportfileargs(self, discnumber: int, tracknumber: int, wavfile: str) -> List[str]:
+        """
+        Command line exporting a track to PCM WAV file
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            tracknumber {int} -- Track number of the album
+            wavfile {str} -- WAV file
+
+        Returns:
+            List[str] -- Decoder command line
+        """
+        return self.albums[discnumber - 1].exportfileargs(tracknumber, wavfile)
+
+    def exportmeta(self, discnumber: int, tracknumber: int) -> Tuple[str, str]:
+        """
+        Cover and metadata of a track
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            tracknumber {int} -- Track number of the album
+
+        Returns:
+            (str, str) -- Cover, MetaData
+        """
         self.albums[discnumber - 1].loadmeta()
         c = self.albums[discnumber - 1].getcover()
         m = self.albums[discnumber - 1].getmeta(tracknumber)
         return (c, m)
 
+    def gettimes(self, discnumber: int, tracknumber: int) -> Tuple[float, float, float]:
+        """
+        Track's modification times per component
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            tracknumber {int} -- Track number of the album
+
+        Returns:
+            (float, float, float) -- Audio, Metadata, Cover modification times
+        """
+        return self.albums[discnumber - 1].gettracktimes(tracknumber - 1)
+
+    def fingerprint(self, discnumber: int, tracknumber: int) -> str:
+        """
+        Content fingerprint of a track
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            tracknumber {int} -- Track number of the album
+
+        Returns:
+            str -- Fingerprint as "<audio>/<metadata>/<cover>" digests
+        """
+        return "/".join(self.albums[discnumber - 1].fingerprint(tracknumber))
+
+    def getduration(self, discnumber: int, tracknumber: int) -> float:
+        """
+        Duration of a track (estimate)
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            tracknumber {int} -- Track number of the album
+
+        Returns:
+            float -- Seconds
+        """
+        return self.albums[discnumber - 1].getduration(tracknumber)
+
+    def getsize(self, discnumber: int, tracknumber: int) -> int:
+        """
+        Source bytes of a track
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            tracknumber {int} -- Track number of the album
+
+        Returns:
+            int -- Bytes
+        """
+        return self.albums[discnumber - 1].getsize(tracknumber)
+
+    def splittable(self, discnumber: int) -> bool:
+        """
+        Whether all tracks of a disc can be cut from a single decode
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+
+        Returns:
+            bool -- True if supported
+        """
+        return self.albums[discnumber - 1].splittable()
+
+    def split(self, discnumber: int, wavfiles: Dict[int, str]) -> None:
+        """
+        Export tracks of a disc to PCM WAV files at once
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            wavfiles {Dict[int, str]} -- WAV file per track number
+        """
+        self.albums[discnumber - 1].split(wavfiles)
+
+    def getformat(self, discnumber: int, tracknumber: int) -> Tuple[int, int, int]:
+        """
+        PCM format a track decodes to
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            tracknumber {int} -- Track number of the album
+
+        Returns:
+            (int, int, int) -- Sample rate, Channels, Bytes per sample
+        """
+        return self.albums[discnumber - 1].getformat(tracknumber)
+
+    def getchannels(self, discnumber: int, tracknumber: int) -> int:
+        """
+        Number of audio channels of a track
+
+        Arguments:
+            discnumber {int} -- Disc number of the album set
+            tracknumber {int} -- Track number of the album
+
+        Returns:
+            int -- Channels or None if unknown
+        """
+        return self.albums[discnumber - 1].getchannels(tracknumber)
+
     def show(self) -> None:
         """
         Debug routine to print an album set
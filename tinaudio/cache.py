@@ -1,17 +1,36 @@
 from .shared import *
 
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import sqlite3
+
+SCAN_WORKERS = 8
+
 
 class ICache(object):
     """
     Directory tree in-memory cache
     """
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, indexdir: str = None, workers: int = SCAN_WORKERS, ignore: List[str] = (),
+                 subdirs: List[str] = ('',)) -> None:
         """
         Cache constructor
 
+        With an index directory the directory listings are persisted
+        (SQLite) and on later runs only directories whose own mtime
+        changed are listed again. The files of unchanged directories are
+        stat'ed again: in-place modifications (eg. retagging) don't
+        change the directory's mtime.
+
         Arguments:
             path {str} -- Cache root directory
+            indexdir {str} -- Persistent index directory or None
+            workers {int} -- Number of directory scanning threads
+            ignore {List[str]} -- Files (relative to root, shell patterns) left out, eg. journals
+            subdirs {List[str]} -- Subtrees (relative to root, not nested) to scan only
 
         Raises:
             Exception: If the directory argument is not absolute
@@ -20,30 +39,160 @@ class ICache(object):
             self.tracktunes = []
             raise Exception('path MUST be absolute')
         self.path = path
+        self.ignore = list(ignore)
+        self.subdirs = list(subdirs)
         while self.path[-1] == '/':
             self.path = self.path[:-1]
         self.index = []
         self.files = {}
         self.dirs = {}
         self.timecache = {}
-        # walk, walk, walk
-        for (xpath, xdirs, xfiles) in os.walk(self.path, topdown=True):
-            relative_path = xpath[len(self.path) + 1:]
-            self.index.append(relative_path)
-            # store files
-            xfiles.sort()
-            tmpfiles = []
-            # store dirs
-            xdirs.sort()
-            self.dirs[relative_path] = xdirs
-            for f in xfiles:
-                relative_file = os.path.join(relative_path, f)
-                absolute_file = os.path.join(self.path, relative_file)
-                if os.path.isfile(absolute_file):
-                    self.timecache[relative_file] = os.path.getmtime(absolute_file)
-                    tmpfiles.append(f)
-            self.files[relative_path] = tmpfiles
+        self.stored = {}
+        self.scanned = {}
+        db = None
+        if indexdir:
+            db = self.opendb(indexdir)
+        # walk, walk, walk (independent subtrees concurrently)
+        if workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                pending = dict([(pool.submit(self.scan, d), d) for d in self.subdirs])
+                while pending:
+                    (done, notdone) = concurrent.futures.wait(pending.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        for d in self.store(pending.pop(future), future.result()):
+                            pending[pool.submit(self.scan, d)] = d
+        else:
+            pending = list(self.subdirs)
+            while pending:
+                relative_path = pending.pop()
+                pending.extend(self.store(relative_path, self.scan(relative_path)))
         self.index.sort()
+        if db:
+            self.savedb(db)
+
+    def store(self, relative_path: str, entry: Tuple[int, List[str], List[str], List[Tuple[str, float]]]) -> List[str]:
+        """
+        Stores a directory listing in the cache
+
+        Arguments:
+            relative_path {str} -- Directory relative to cache root
+            entry {(int, List[str], List[str], List[(str, float)])} -- Listing (see scan)
+
+        Returns:
+            List[str] -- Subdirectories to descend into
+        """
+        if entry is None:
+            return []
+        (mtime, xdirs, xwalk, xfiles) = entry
+        self.scanned[relative_path] = entry
+        self.index.append(relative_path)
+        self.dirs[relative_path] = xdirs
+        tmpfiles = []
+        for (f, fmtime) in xfiles:
+            if any([fnmatch.fnmatchcase(os.path.join(relative_path, f), p) for p in self.ignore]):
+                continue
+            self.timecache[os.path.join(relative_path, f)] = fmtime
+            tmpfiles.append(f)
+        self.files[relative_path] = tmpfiles
+        return [os.path.join(relative_path, d) for d in xwalk]
+
+    def opendb(self, indexdir: str) -> sqlite3.Connection:
+        """
+        Opens the persistent index and loads the stored listings
+
+        Arguments:
+            indexdir {str} -- Persistent index directory
+
+        Returns:
+            sqlite3.Connection -- Index database
+        """
+        os.makedirs(indexdir, exist_ok=True)
+        name = hashlib.sha1(self.path.encode('utf8')).hexdigest() + '.sqlite'
+        db = sqlite3.connect(os.path.join(indexdir, name))
+        db.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER, dirs TEXT, walk TEXT, files TEXT)')
+        for (p, mtime, xdirs, xwalk, xfiles) in db.execute('SELECT path, mtime, dirs, walk, files FROM dirs'):
+            self.stored[p] = (mtime, json.loads(xdirs), json.loads(xwalk), [tuple(f) for f in json.loads(xfiles)])
+        return db
+
+    def savedb(self, db: sqlite3.Connection) -> None:
+        """
+        Persists the directory listings which changed
+
+        Arguments:
+            db {sqlite3.Connection} -- Index database
+        """
+        with db:
+            for p in self.stored.keys():
+                if p not in self.scanned and self.within(p):
+                    db.execute('DELETE FROM dirs WHERE path = ?', (p,))
+            for (p, entry) in self.scanned.items():
+                if self.stored.get(p) != entry:
+                    (mtime, xdirs, xwalk, xfiles) = entry
+                    db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)',
+                               (p, mtime, json.dumps(xdirs), json.dumps(xwalk), json.dumps(xfiles)))
+        db.close()
+
+    def within(self, relative_path: str) -> bool:
+        """
+        Whether a directory is within the scanned subtrees
+
+        Arguments:
+            relative_path {str} -- Directory relative to cache root
+
+        Returns:
+            bool -- True if scanned (or vanished) by this cache
+        """
+        for d in self.subdirs:
+            if d == '' or relative_path == d or relative_path.startswith(d + '/'):
+                return True
+        return False
+
+    def scan(self, relative_path: str) -> Tuple[int, List[str], List[str], List[Tuple[str, float]]]:
+        """
+        Lists a directory (or reuses its stored listing when unchanged)
+
+        Arguments:
+            relative_path {str} -- Directory relative to cache root
+
+        Returns:
+            (int, List[str], List[str], List[(str, float)]) -- Directory mtime (ns),
+                Directories, Directories to descend, Files with modification times
+                or None if the directory vanished
+        """
+        absolute_path = os.path.join(self.path, relative_path) if relative_path else self.path
+        try:
+            mtime = os.stat(absolute_path).st_mtime_ns
+        except OSError:
+            return None
+        stored = self.stored.get(relative_path)
+        if stored and stored[0] == mtime:
+            # same entries, their contents may have changed in place
+            try:
+                xfiles = [(f, os.stat(os.path.join(absolute_path, f)).st_mtime) for (f, fmtime) in stored[3]]
+                return (mtime, stored[1], stored[2], xfiles)
+            except OSError:
+                pass
+        xdirs = []
+        xwalk = []
+        xfiles = []
+        try:
+            with os.scandir(absolute_path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            xdirs.append(entry.name)
+                            if not entry.is_symlink():
+                                xwalk.append(entry.name)
+                        elif entry.is_file():
+                            xfiles.append((entry.name, entry.stat().st_mtime))
+                    except OSError:
+                        pass
+        except OSError:
+            return None
+        xdirs.sort()
+        xwalk.sort()
+        xfiles.sort()
+        return (mtime, xdirs, xwalk, xfiles)
 
     def get(self, relative_path: str) -> Tuple[List[str], List[str]]:
         """
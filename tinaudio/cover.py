@@ -0,0 +1,177 @@
+from .shared import *
+
+import collections
+
+COVER_CACHE_BYTES = 256 << 20
+
+
+class CoverCache(object):
+    """
+    Album covers (as is or converted to JPEG) shared by all jobs of a run
+
+    Keyed by source file, its modification time and the JPEG requirement,
+    the least recently used covers are evicted beyond the capacity. Failed
+    conversions are kept as no cover.
+    """
+
+    def __init__(self, maxsize: int = None, capacity: int = COVER_CACHE_BYTES) -> None:
+        """
+        Arguments:
+            maxsize {int} -- Maximum width/height of the covers in pixels or None
+            capacity {int} -- Bytes held in memory
+        """
+        self.maxsize = maxsize
+        self.capacity = capacity
+        self.size = 0
+        self.covers = collections.OrderedDict()
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def key(self, cover: str, jpeg: bool = False) -> Tuple[str, float, bool]:
+        """
+        Cache key of a cover
+
+        Arguments:
+            cover {str} -- Cover file (absolute)
+            jpeg {bool} -- Convert to JPEG
+
+        Returns:
+            (str, float, bool) -- Cover file, its modification time, JPEG required
+        """
+        return (cover, os.path.getmtime(cover), jpeg)
+
+    def cached(self, key: Tuple[str, float, bool]) -> bool:
+        """
+        Whether a cover is converted already (see key)
+
+        Arguments:
+            key {(str, float, bool)} -- Cache key
+
+        Returns:
+            bool -- True if cached (failed conversions too)
+        """
+        with self.lock:
+            return key in self.covers
+
+    def put(self, key: Tuple[str, float, bool], data: bytes) -> None:
+        """
+        Caches a cover converted elsewhere (see convertargs)
+
+        Arguments:
+            key {(str, float, bool)} -- Cache key
+            data {bytes} -- JPEG or PNG data, b'' if the conversion failed
+        """
+        with self.lock:
+            if key in self.covers:
+                self.size -= len(self.covers.pop(key))
+            self.covers[key] = data
+            self.size += len(data)
+            while self.size > self.capacity and len(self.covers) > 1:
+                (k, v) = self.covers.popitem(last=False)
+                self.size -= len(v)
+
+    def get(self, cover: str, jpeg: bool = False) -> bytes:
+        """
+        Data of a cover (as is unless resized or JPEG required)
+
+        Arguments:
+            cover {str} -- Cover file (absolute)
+            jpeg {bool} -- Convert to JPEG (eg. folder.jpg)
+
+        Returns:
+            bytes -- JPEG or PNG data, None if the conversion failed (no cover)
+        """
+        key = self.key(cover, jpeg)
+        with self.lock:
+            if key in self.covers:
+                self.covers.move_to_end(key)
+                return self.covers[key] or None
+            if key not in self.locks:
+                self.locks[key] = threading.Lock()
+            keylock = self.locks[key]
+        # single conversion per cover, others wait for it
+        with keylock:
+            with self.lock:
+                if key in self.covers:
+                    self.covers.move_to_end(key)
+                    return self.covers[key] or None
+            try:
+                data = self.convert(cover, jpeg)
+            except Exception:
+                # failures are remembered too
+                data = b''
+            self.put(key, data)
+            with self.lock:
+                del self.locks[key]
+        return data or None
+
+    def convertargs(self, cover: str, jpeg: bool = False) -> List[str]:
+        """
+        Command line converting a cover to JPEG on stdout (ImageMagick)
+
+        Arguments:
+            cover {str} -- Cover file (absolute)
+            jpeg {bool} -- Convert to JPEG
+
+        Returns:
+            List[str] -- Converter command line, None if the cover is taken as is
+        """
+        if not self.maxsize and (not jpeg or covertype(cover) == 'jpeg'):
+            return None
+        args = ['convert', cover]
+        if self.maxsize:
+            args.extend(['-resize', "{:d}x{:d}>".format(self.maxsize, self.maxsize)])
+        args.append('jpg:-')
+        return args
+
+    def convert(self, cover: str, jpeg: bool = False) -> bytes:
+        """
+        Converts a cover to JPEG if resized or required
+
+        Arguments:
+            cover {str} -- Cover file (absolute)
+            jpeg {bool} -- Convert to JPEG
+
+        Raises:
+            Exception: When the conversion failed
+
+        Returns:
+            bytes -- JPEG or PNG data
+        """
+        args = self.convertargs(cover, jpeg)
+        if args is None:
+            with open(cover, 'rb') as stream:
+                return stream.read()
+        p = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if p.returncode != 0 or not p.stdout:
+            raise Exception("Cover conversion failed: " + cover)
+        return p.stdout
+
+
+def imagetype(data: bytes) -> str:
+    """
+    Image format of cover data
+
+    Arguments:
+        data {bytes} -- Cover data
+
+    Returns:
+        str -- 'png' or 'jpeg'
+    """
+    if data[0:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    return 'jpeg'
+
+
+def covertype(cover: str) -> str:
+    """
+    Image format of a cover file
+
+    Arguments:
+        cover {str} -- Cover file
+
+    Returns:
+        str -- 'png' or 'jpeg'
+    """
+    with open(cover, 'rb') as stream:
+        return imagetype(stream.read(8))
@@ -1,5 +1,17 @@
 from .shared import *
 from .album import TrackMeta
+from .cover import imagetype
+from . import pcm
+
+
+# relative encoder costs (per audio second)
+CODEC_COST = {
+    'flac': 0.4,
+    'opus': 1.0,
+    'aac': 1.5,
+    'mp3': 1.2
+}
+
 
 class Encoder(object):
     """
@@ -11,6 +23,28 @@ class Encoder(object):
     def __init__(self, codec, downmix) -> None:
         self.codec = codec
         self.downmix = downmix
+        # downmix gains (center, surround, lfe), see pcm.downmix
+        self.mix = {}
+
+    def cost(self) -> float:
+        """
+        Relative encoding cost (CPU seconds per audio second, roughly)
+
+        Returns:
+            float -- Cost factor
+        """
+        return CODEC_COST.get(self.codec, 1.0)
+
+    def settings(self) -> str:
+        """
+        Settings the output depends on (eg. recorded in journals)
+
+        Returns:
+            str -- Codec and downmix gains
+        """
+        if self.downmix:
+            return "{} downmix {}".format(self.codec, ",".join(["{}={}".format(k, v) for (k, v) in sorted(self.mix.items())]))
+        return self.codec
 
     def suffix(self) -> str:
         if self.codec == 'aac':
@@ -18,129 +52,338 @@ class Encoder(object):
         else:
             return self.codec
 
-    def downmixWAV(self, wavf: str) -> None:
+    def downmixWAV(self, wavf: str, stereof: str = None) -> str:
         """
         Downmix to 2 channels if multichannel audio
 
+        In process (see pcm.downmix) if possible, ffmpeg otherwise.
+
         Arguments:
             wavf {str} -- WAV file
+            stereof {str} -- Stereo WAV file to create or None (downmix in place)
+
+        Returns:
+            str -- Stereo WAV file (wavf if in place or already stereo)
         """
-        # HACK: https://github.com/jiaaro/pydub/issues/129
-        # FIXME: a reliable method to get number of wav channels
-        multichannel = True
         try:
-            w = wave.open(wavf, 'rb')
-            if w.getnchannels() < 3:
-                multichannel = False
-            w.close()
+            header = pcm.readheader(wavf)
         except Exception:
-            pass
-        if multichannel:
-            newwavf = wavf[:-4] + "-stereo.wav"
+            # unknown, assume multichannel
+            header = None
+        if header and header.channels < 3:
+            return wavf
+        newwavf = stereof or wavf[:-4] + "-stereo.wav"
+        if header and pcm.supported(header):
+            pcm.downmix(wavf, newwavf, header, **self.mix)
+        else:
             FNULL = open(os.devnull, 'w')
             subprocess.call(['ffmpeg', '-y', '-i', wavf, '-c:a', 'pcm_s24le', '-ac', '2', newwavf], stdout=FNULL, stderr=FNULL)
             FNULL.close()
-            os.remove(wavf)
-            os.rename(newwavf, wavf)
+        if stereof:
+            return stereof
+        os.remove(wavf)
+        os.rename(newwavf, wavf)
+        return wavf
 
-    def encode(self, wavf: str, dstf: str, cover: str, meta: TrackMeta) -> None:
+    def streamable(self) -> bool:
         """
-        Entrypoint to encode a PCM WAV according to self.codec
+        Whether the encoder is able to read PCM WAV from stdin
 
-        Calls the corresponding encoding flavour subroutine
+        Returns:
+            bool -- True if piping is supported
+        """
+        return self.codec != 'aac'
+
+    def downmixargs(self) -> List[str]:
+        """
+        Command line downmixing PCM WAV from stdin to stdout
+
+        Returns:
+            List[str] -- Downmix command line
+        """
+        return ['ffmpeg', '-i', '-', '-c:a', 'pcm_s24le', '-ac', '2', '-f', 'wav', '-']
+
+    def encodeargs(self, wavf: str, dstf: str) -> List[str]:
+        """
+        Command line encoding a PCM WAV according to self.codec
+
+        Arguments:
+            wavf {str} -- PCM WAV file ('-' for stdin)
+            dstf {str} -- Output file
+
+        Raises:
+            Exception: Invalid output format called
+
+        Returns:
+            List[str] -- Encoder command line
+        """
+        if self.codec == 'opus':
+            return self.encodeOpus(wavf, dstf)
+        elif self.codec == 'flac':
+            return self.encodeFLAC(wavf, dstf)
+        elif self.codec == 'aac':
+            return self.encodeAAC(wavf, dstf)
+        elif self.codec == 'mp3':
+            return self.encodeMP3(wavf, dstf)
+        else:
+            raise Exception('Unsupported encoder: ' + self.codec)
+
+    def tag(self, dstf: str, cover: bytes, meta: TrackMeta, fingerprint: str = None, clear: bool = False) -> None:
+        """
+        Tags an encoded file according to self.codec
 
         Arguments:
-            wavf {str} -- PCM WAV file
             dstf {str} -- Output file
-            cover {str} -- Cover file
+            cover {bytes} -- Cover (JPEG) to embed or None
             meta {TrackMeta} -- Metadata
+            fingerprint {str} -- Source fingerprint to record or None
+            clear {bool} -- Drop the existing tags first (pictures, encoder tags and fingerprints are kept)
 
         Raises:
             Exception: Invalid output format called
         """
-        if self.downmix:
-            self.downmixWAV(wavf)
         if self.codec == 'opus':
-            self.encodeOpus(wavf, dstf, cover, meta)
+            self.tagOpus(dstf, cover, meta, fingerprint, clear)
         elif self.codec == 'flac':
-            self.encodeFLAC(wavf, dstf, cover, meta)
+            self.tagFLAC(dstf, cover, meta, fingerprint, clear)
         elif self.codec == 'aac':
-            self.encodeAAC(wavf, dstf, cover, meta)
+            self.tagAAC(dstf, cover, meta, fingerprint, clear)
         elif self.codec == 'mp3':
-            self.encodeMP3(wavf, dstf, cover, meta)
+            self.tagMP3(dstf, cover, meta, fingerprint, clear)
         else:
             raise Exception('Unsupported encoder: ' + self.codec)
 
-    def encodeOpus(self, wavf: str, dstf: str, cover: str, meta: TrackMeta) -> None:
+    def retag(self, dstf: str, meta: TrackMeta, fingerprint: str = None) -> None:
         """
-        Encodes a PCM WAV file to Opus format
+        Rewrites the tags of an already encoded file (no re-encode)
 
         Arguments:
-            wavf {str} -- PCM WAV file
             dstf {str} -- Output file
-            cover {str} -- Cover file
             meta {TrackMeta} -- Metadata
+            fingerprint {str} -- Source fingerprint to record or None
+        """
+        self.tag(dstf, None, meta, fingerprint, True)
+
+    def embedcover(self, dstf: str, cover: bytes) -> None:
+        """
+        Replaces the embedded picture of an already encoded file (no re-encode)
+
+        Arguments:
+            dstf {str} -- Output file
+            cover {bytes} -- Cover (JPEG or PNG) or None to remove the picture
+
+        Raises:
+            Exception: Invalid output format called
+        """
+        if self.codec == 'opus':
+            f = OggOpus(dstf)
+        elif self.codec == 'flac':
+            f = FLAC(dstf)
+        elif self.codec == 'aac':
+            f = MP4(dstf)
+        elif self.codec == 'mp3':
+            f = MP3(dstf, ID3=ID3)
+        else:
+            raise Exception('Unsupported encoder: ' + self.codec)
+        self.setcover(f, cover)
+        f.save()
+
+    def setcover(self, f, cover: bytes) -> None:
+        """
+        Replaces the picture in an opened (mutagen) file
+
+        Arguments:
+            f {FileType} -- Opened output file
+            cover {bytes} -- Cover (JPEG or PNG) or None to remove the picture
+        """
+        if self.codec == 'opus':
+            if 'metadata_block_picture' in f:
+                del f['metadata_block_picture']
+            if cover:
+                f['metadata_block_picture'] = [base64.b64encode(self.picture(cover).write()).decode('ascii')]
+        elif self.codec == 'flac':
+            f.clear_pictures()
+            if cover:
+                f.add_picture(self.picture(cover))
+        elif self.codec == 'aac':
+            if 'covr' in f:
+                del f['covr']
+            if cover:
+                fmt = MP4Cover.FORMAT_PNG if imagetype(cover) == 'png' else MP4Cover.FORMAT_JPEG
+                f['covr'] = [MP4Cover(cover, fmt)]
+        elif self.codec == 'mp3':
+            if f.tags is None:
+                f.add_tags()
+            f.tags.delall('APIC')
+            if cover:
+                f.tags.add(APIC(encoding=3, mime='image/' + imagetype(cover), type=3, desc=u'Cover', data=cover))
+
+    def picture(self, cover: bytes) -> Picture:
+        """
+        FLAC picture block (front cover)
+
+        Arguments:
+            cover {bytes} -- Cover (JPEG or PNG)
+
+        Returns:
+            Picture -- Picture block
+        """
+        picture = Picture()
+        picture.type = 3
+        picture.mime = 'image/' + imagetype(cover)
+        picture.data = cover
+        return picture
+
+    def getfingerprint(self, dstf: str) -> str:
+        """
+        Source fingerprint recorded in an encoded file
+
+        Arguments:
+            dstf {str} -- Output file
+
+        Returns:
+            str -- Fingerprint or None
+        """
+        try:
+            if self.codec == 'opus' or self.codec == 'flac':
+                if self.codec == 'opus':
+                    f = OggOpus(dstf)
+                else:
+                    f = FLAC(dstf)
+                if FINGERPRINT_TAG in f:
+                    return f[FINGERPRINT_TAG][0]
+            elif self.codec == 'aac':
+                aac = MP4(dstf)
+                if MP4_FINGERPRINT in aac:
+                    return bytes(aac[MP4_FINGERPRINT][0]).decode('utf8')
+            elif self.codec == 'mp3':
+                mp3 = MP3(dstf, ID3=ID3)
+                frame = 'TXXX:' + FINGERPRINT_TAG
+                if mp3.tags and frame in mp3.tags:
+                    return str(mp3.tags[frame].text[0])
+        except Exception:
+            pass
+        return None
+
+    def encodeOpus(self, wavf: str, dstf: str) -> List[str]:
+        """
+        Command line encoding a PCM WAV file to Opus format
+
+        Arguments:
+            wavf {str} -- PCM WAV file ('-' for stdin)
+            dstf {str} -- Output file
+
+        Returns:
+            List[str] -- Encoder command line
         """
         # TODO: bitrate 160/128
-        FNULL = open(os.devnull, 'w')
         args = ['opusenc', '--bitrate', '192', '--quiet']
-        if cover:
-            args.append('--picture')
-            args.append(cover)
+        if wavf == '-':
+            args.append('--ignorelength')
         args.append(wavf)
         args.append(dstf)
-        subprocess.call(args, stdout=FNULL, stderr=FNULL)
-        FNULL.close()
-        # tag the file
+        return args
+
+    def tagOpus(self, dstf: str, cover: bytes, meta: TrackMeta, fingerprint: str = None, clear: bool = False) -> None:
+        """
+        Tags an Opus file
+
+        Arguments:
+            dstf {str} -- Output file
+            cover {bytes} -- Cover (JPEG) or None
+            meta {TrackMeta} -- Metadata
+            fingerprint {str} -- Source fingerprint or None
+            clear {bool} -- Drop the existing tags first
+        """
         opus = OggOpus(dstf)
+        if clear:
+            keep = [(k, opus[k]) for k in OPUS_KEEP_TAGS if k in opus]
+            opus.clear()
+            for (k, v) in keep:
+                opus[k] = v
         # no need to save r128_track_gain
         for c in sorted(meta.keys()):
             opus[c] = meta[c]
+        if fingerprint:
+            opus[FINGERPRINT_TAG] = fingerprint
+        if cover:
+            self.setcover(opus, cover)
         opus.save()
 
-    def encodeFLAC(self, wavf: str, dstf: str, cover: str, meta: TrackMeta) -> None:
+    def encodeFLAC(self, wavf: str, dstf: str) -> List[str]:
         """
-        Encodes a PCM WAV file to FLAC format
+        Command line encoding a PCM WAV file to FLAC format
 
         Arguments:
-            wavf {str} -- PCM WAV file
+            wavf {str} -- PCM WAV file ('-' for stdin)
             dstf {str} -- Output file
-            cover {str} -- Cover file
-            meta {TrackMeta} -- Metadata
+
+        Returns:
+            List[str] -- Encoder command line
         """
-        FNULL = open(os.devnull, 'w')
         args = ['flac', '-f', '--totally-silent', '--best']
-        if cover:
-            args.append('--picture')
-            args.append(cover)
+        if wavf == '-':
+            args.append('--ignore-chunk-sizes')
         args.append('-o')
         args.append(dstf)
         args.append(wavf)
-        subprocess.call(args, stdout=FNULL, stderr=FNULL)
-        FNULL.close()
-        # tag the file
+        return args
+
+    def tagFLAC(self, dstf: str, cover: bytes, meta: TrackMeta, fingerprint: str = None, clear: bool = False) -> None:
+        """
+        Tags a FLAC file
+
+        Arguments:
+            dstf {str} -- Output file
+            cover {bytes} -- Cover (JPEG) or None
+            meta {TrackMeta} -- Metadata
+            fingerprint {str} -- Source fingerprint or None
+            clear {bool} -- Drop the existing tags first
+        """
         f = FLAC(dstf)
+        if clear and f.tags:
+            keep = [(k, f[k]) for k in FLAC_KEEP_TAGS if k in f]
+            f.tags.clear()
+            for (k, v) in keep:
+                f[k] = v
         for c in sorted(meta.keys()):
             f[c] = meta[c]
+        if fingerprint:
+            f[FINGERPRINT_TAG] = fingerprint
+        if cover:
+            self.setcover(f, cover)
         f.save()
 
-    def encodeAAC(self, wavf: str, dstf: str, cover: str, meta: TrackMeta) -> None:
+    def encodeAAC(self, wavf: str, dstf: str) -> List[str]:
         """
-        Encodes a PCM WAV file to MPEG-4 AAC format (using NeroAAC)
+        Command line encoding a PCM WAV file to MPEG-4 AAC format (using NeroAAC)
 
         Arguments:
             wavf {str} -- PCM WAV file
             dstf {str} -- Output file
-            cover {str} -- Cover file
+
+        Returns:
+            List[str] -- Encoder command line
+        """
+        return ['neroAacEnc', '-q', '0.5', '-if', wavf, '-of', dstf]
+
+    def tagAAC(self, dstf: str, cover: bytes, meta: TrackMeta, fingerprint: str = None, clear: bool = False) -> None:
+        """
+        Tags an MPEG-4 AAC file
+
+        Arguments:
+            dstf {str} -- Output file
+            cover {bytes} -- Cover (JPEG) or None
             meta {TrackMeta} -- Metadata
+            fingerprint {str} -- Source fingerprint or None
+            clear {bool} -- Drop the existing tags first
         """
-        FNULL = open(os.devnull, 'w')
-        subprocess.call(['neroAacEnc', '-q', '0.5',
-                         '-if', wavf, '-of', dstf], stdout=FNULL, stderr=FNULL)
-        FNULL.close()
-        # tag AAC
         mm = TrackMeta(meta)
         aac = MP4(dstf)
+        if clear:
+            for k in list(aac.keys()):
+                if k not in MP4_KEEP_TAGS:
+                    del aac[k]
         aac['\xa9nam'] = mm.title()
         aac['\xa9ART'] = mm.artist()
         aac['\xa9alb'] = mm.album()
@@ -164,33 +407,44 @@ class Encoder(object):
 
         # cover
         if cover:
-            data = open(cover, 'rb').read()
-            covr = []
-            if cover.endswith('png'):
-                covr.append(MP4Cover(data, MP4Cover.FORMAT_PNG))
-            else:
-                covr.append(MP4Cover(data, MP4Cover.FORMAT_JPEG))
-            aac['covr'] = covr
+            self.setcover(aac, cover)
+
+        if fingerprint:
+            aac[MP4_FINGERPRINT] = [MP4FreeForm(fingerprint.encode('utf8'))]
 
         # save AAC tags
         aac.save()
 
-    def encodeMP3(self, wavf: str, dstf: str, cover: str, meta: TrackMeta) -> None:
+    def encodeMP3(self, wavf: str, dstf: str) -> List[str]:
         """
-        Encodes a PCM WAV file to MPEG-1 Audio Layer 3 format
+        Command line encoding a PCM WAV file to MPEG-1 Audio Layer 3 format
 
         Arguments:
-            wavf {str} -- PCM WAV file
+            wavf {str} -- PCM WAV file ('-' for stdin)
             dstf {str} -- Output file
-            cover {str} -- Cover file
+
+        Returns:
+            List[str] -- Encoder command line
+        """
+        return ['lame', '-V2', wavf, dstf]
+
+    def tagMP3(self, dstf: str, cover: bytes, meta: TrackMeta, fingerprint: str = None, clear: bool = False) -> None:
+        """
+        Tags an MPEG-1 Audio Layer 3 file
+
+        Arguments:
+            dstf {str} -- Output file
+            cover {bytes} -- Cover (JPEG) or None
             meta {TrackMeta} -- Metadata
+            fingerprint {str} -- Source fingerprint or None
+            clear {bool} -- Drop the existing tags first
         """
-        FNULL = open(os.devnull, 'w')
-        subprocess.call(['lame', '-V2', wavf, dstf], stdout=FNULL, stderr=FNULL)
-        FNULL.close()
-        # tag MP3
         mm = TrackMeta(meta)
         mp3 = MP3(dstf, ID3=ID3)
+        if clear and mp3.tags:
+            for k in list(mp3.tags.keys()):
+                if not any([k == f or k.startswith(f + ':') for f in MP3_KEEP_FRAMES]):
+                    del mp3.tags[k]
         mp3["TIT2"] = TIT2(encoding=3, text=mm.title())
         mp3["TPE1"] = TPE1(encoding=3, text=mm.artist())
         mp3["TALB"] = TALB(encoding=3, text=mm.album())
@@ -208,12 +462,10 @@ class Encoder(object):
 
         # cover
         if cover:
-            data = open(cover, 'rb').read()
-            if cover.endswith('png'):
-                mime = 'image/png'
-            else:
-                mime = 'image/jpeg'
-            mp3.tags.add(APIC(encoding=3, mime=mime, type=3, desc=u'Cover', data=data))
+            self.setcover(mp3, cover)
+
+        if fingerprint:
+            mp3.tags.add(TXXX(encoding=3, desc=FINGERPRINT_TAG, text=fingerprint))
 
         # save
-        mp3.save()
\ No newline at end of file
+        mp3.save()
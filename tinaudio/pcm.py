@@ -0,0 +1,273 @@
+from .shared import *
+
+import struct
+
+try:
+    import numpy  # type: ignore
+except ImportError:
+    numpy = None
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# speaker positions (WAVEFORMATEXTENSIBLE channel mask bits)
+SPEAKER_FL = 0x1
+SPEAKER_FR = 0x2
+SPEAKER_FC = 0x4
+SPEAKER_LFE = 0x8
+SPEAKER_BL = 0x10
+SPEAKER_BR = 0x20
+SPEAKER_FLC = 0x40
+SPEAKER_FRC = 0x80
+SPEAKER_BC = 0x100
+SPEAKER_SL = 0x200
+SPEAKER_SR = 0x400
+
+# channel layouts of WAVs without (valid) channel mask (ffmpeg's defaults)
+DEFAULT_LAYOUTS = {
+    1: SPEAKER_FC,
+    2: SPEAKER_FL | SPEAKER_FR,
+    3: SPEAKER_FL | SPEAKER_FR | SPEAKER_FC,
+    4: SPEAKER_FL | SPEAKER_FR | SPEAKER_BL | SPEAKER_BR,
+    5: SPEAKER_FL | SPEAKER_FR | SPEAKER_FC | SPEAKER_BL | SPEAKER_BR,
+    6: SPEAKER_FL | SPEAKER_FR | SPEAKER_FC | SPEAKER_LFE | SPEAKER_BL | SPEAKER_BR,
+    7: SPEAKER_FL | SPEAKER_FR | SPEAKER_FC | SPEAKER_LFE | SPEAKER_BC | SPEAKER_SL | SPEAKER_SR,
+    8: SPEAKER_FL | SPEAKER_FR | SPEAKER_FC | SPEAKER_LFE | SPEAKER_BL | SPEAKER_BR | SPEAKER_SL | SPEAKER_SR,
+}
+
+# default downmix gains (ITU-R BS.775, LFE dropped like ffmpeg -ac 2)
+DOWNMIX_CENTER = 0.7071
+DOWNMIX_SURROUND = 0.7071
+DOWNMIX_LFE = 0.0
+
+# frames per downmix chunk (~0.7 s at 96 kHz)
+PCM_CHUNK_FRAMES = 65536
+
+
+class WavHeader(object):
+    """
+    Format and data location of a PCM WAV file
+    """
+
+    def __init__(self, format: int, channels: int, rate: int, bits: int, align: int, mask: int,
+                 offset: int, size: int) -> None:
+        """
+        Arguments:
+            format {int} -- Format tag (sub format of WAVE_FORMAT_EXTENSIBLE)
+            channels {int} -- Channels
+            rate {int} -- Sample rate
+            bits {int} -- Bits per sample
+            align {int} -- Bytes per frame
+            mask {int} -- Channel mask (0 if none)
+            offset {int} -- Offset of the PCM data
+            size {int} -- Bytes of PCM data (whole frames)
+        """
+        self.format = format
+        self.channels = channels
+        self.rate = rate
+        self.bits = bits
+        self.align = align
+        self.width = align // channels
+        self.mask = mask
+        self.offset = offset
+        self.size = size
+        self.frames = size // align
+
+    def speakers(self) -> List[int]:
+        """
+        Speaker position of each channel
+
+        Raises:
+            Exception: When the layout is unknown
+
+        Returns:
+            List[int] -- Speaker bits in channel order
+        """
+        mask = self.mask
+        if bin(mask).count('1') != self.channels:
+            if self.channels not in DEFAULT_LAYOUTS:
+                raise Exception("Unknown channel layout: {:d} channels".format(self.channels))
+            mask = DEFAULT_LAYOUTS[self.channels]
+        return [1 << i for i in range(0, 32) if mask & (1 << i)]
+
+
+def readheader(wavf: str) -> WavHeader:
+    """
+    Parses the RIFF header of a WAV file (WAVE_FORMAT_EXTENSIBLE too)
+
+    Data chunk sizes left unset by streaming writers (0 or 0xFFFFFFFF)
+    are taken from the file size.
+
+    Arguments:
+        wavf {str} -- WAV file
+
+    Raises:
+        Exception: When not a WAV file
+
+    Returns:
+        WavHeader -- Header
+    """
+    with open(wavf, 'rb') as stream:
+        riff = stream.read(12)
+        if len(riff) < 12 or riff[0:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise Exception("Not a RIFF/WAVE file: " + wavf)
+        fmt = None
+        while True:
+            chunk = stream.read(8)
+            if len(chunk) < 8:
+                raise Exception("No WAV data chunk: " + wavf)
+            (cid, size) = struct.unpack('<4sI', chunk)
+            if cid == b'fmt ':
+                body = stream.read(size)
+                (tag, channels, rate, rate_bytes, align, bits) = struct.unpack('<HHIIHH', body[0:16])
+                mask = 0
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 40:
+                    (mask, tag) = struct.unpack('<IH', body[20:26])
+                fmt = (tag, channels, rate, bits, align, mask)
+                stream.seek(size & 1, 1)
+            elif cid == b'data':
+                if fmt is None or fmt[1] == 0 or fmt[4] == 0:
+                    raise Exception("No WAV format chunk: " + wavf)
+                offset = stream.tell()
+                available = os.fstat(stream.fileno()).st_size - offset
+                if size == 0 or size > available:
+                    size = available
+                size -= size % fmt[4]
+                return WavHeader(*fmt, offset=offset, size=size)
+            else:
+                stream.seek(size + (size & 1), 1)
+
+
+def matrix(speakers: List[int], center: float = DOWNMIX_CENTER, surround: float = DOWNMIX_SURROUND,
+           lfe: float = DOWNMIX_LFE):
+    """
+    Stereo downmix matrix of a channel layout
+
+    Normalized so that no output can exceed full scale (clipping guard).
+
+    Arguments:
+        speakers {List[int]} -- Speaker bits in channel order
+        center {float} -- Gain of the center channels
+        surround {float} -- Gain of the surround/back channels
+        lfe {float} -- Gain of the LFE channel
+
+    Returns:
+        numpy.ndarray -- Gains (channels x 2)
+    """
+    gains = {
+        SPEAKER_FL: (1.0, 0.0),
+        SPEAKER_FR: (0.0, 1.0),
+        SPEAKER_FC: (center, center),
+        SPEAKER_LFE: (lfe, lfe),
+        SPEAKER_BL: (surround, 0.0),
+        SPEAKER_BR: (0.0, surround),
+        SPEAKER_FLC: (1.0, 0.0),
+        SPEAKER_FRC: (0.0, 1.0),
+        SPEAKER_BC: (surround * center, surround * center),
+        SPEAKER_SL: (surround, 0.0),
+        SPEAKER_SR: (0.0, surround),
+    }
+    m = numpy.array([gains.get(s, (0.0, 0.0)) for s in speakers], dtype=numpy.float64)
+    peak = numpy.abs(m).sum(axis=0).max()
+    if peak > 1.0:
+        m /= peak
+    return m
+
+
+def supported(header: WavHeader) -> bool:
+    """
+    Whether the in-process downmix can handle a WAV
+
+    Arguments:
+        header {WavHeader} -- Header
+
+    Returns:
+        bool -- True if NumPy is available and the WAV is integer PCM
+    """
+    if numpy is None or header.format != WAVE_FORMAT_PCM or header.width not in (1, 2, 3, 4):
+        return False
+    try:
+        header.speakers()
+    except Exception:
+        return False
+    return True
+
+
+def tofloat(data, width: int):
+    """
+    Integer PCM to floats (full scale: 1.0)
+
+    Arguments:
+        data {numpy.ndarray} -- Bytes (frames x channels x width)
+        width {int} -- Bytes per sample
+
+    Returns:
+        numpy.ndarray -- Samples (frames x channels)
+    """
+    if width == 1:
+        return (data[:, :, 0].astype(numpy.float64) - 128.0) / 128.0
+    if width == 3:
+        samples = data[:, :, 0].astype(numpy.int32) | (data[:, :, 1].astype(numpy.int32) << 8) | \
+            (data[:, :, 2].view(numpy.int8).astype(numpy.int32) << 16)
+    else:
+        samples = data.reshape(data.shape[0], -1).view('<i{:d}'.format(width))
+    return samples.astype(numpy.float64) / float(1 << (8 * width - 1))
+
+
+def fromfloat(samples, width: int) -> bytes:
+    """
+    Floats (full scale: 1.0) to integer PCM, clipped
+
+    Arguments:
+        samples {numpy.ndarray} -- Samples (frames x channels)
+        width {int} -- Bytes per sample
+
+    Returns:
+        bytes -- Interleaved PCM
+    """
+    scale = float(1 << (8 * width - 1))
+    ints = numpy.clip(numpy.rint(samples * scale), -scale, scale - 1).astype(numpy.int64)
+    if width == 1:
+        return (ints + 128).astype(numpy.uint8).tobytes()
+    if width == 3:
+        return ints.astype('<i4').view(numpy.uint8).reshape(ints.shape[0], ints.shape[1], 4)[:, :, 0:3].tobytes()
+    return ints.astype('<i{:d}'.format(width)).tobytes()
+
+
+def downmix(wavf: str, stereof: str, header: WavHeader = None, center: float = DOWNMIX_CENTER,
+            surround: float = DOWNMIX_SURROUND, lfe: float = DOWNMIX_LFE) -> None:
+    """
+    Downmixes a multichannel PCM WAV to stereo (same sample rate and width)
+
+    The source is memory-mapped and mixed chunk by chunk.
+
+    Arguments:
+        wavf {str} -- Multichannel WAV file
+        stereof {str} -- Stereo WAV file to create
+        header {WavHeader} -- Header of wavf (or None to read it)
+        center {float} -- Gain of the center channels
+        surround {float} -- Gain of the surround/back channels
+        lfe {float} -- Gain of the LFE channel
+
+    Raises:
+        Exception: When the WAV is not supported (see supported)
+    """
+    header = header or readheader(wavf)
+    if not supported(header):
+        raise Exception("Unsupported WAV for downmix: " + wavf)
+    m = matrix(header.speakers(), center, surround, lfe)
+    w = wave.open(stereof, 'wb')
+    try:
+        w.setnchannels(2)
+        w.setsampwidth(header.width)
+        w.setframerate(header.rate)
+        w.setnframes(header.frames)
+        if header.frames > 0:
+            data = numpy.memmap(wavf, dtype=numpy.uint8, mode='r', offset=header.offset,
+                                shape=(header.frames, header.channels, header.width))
+            for i in range(0, header.frames, PCM_CHUNK_FRAMES):
+                w.writeframesraw(fromfloat(tofloat(data[i:i + PCM_CHUNK_FRAMES], header.width).dot(m), header.width))
+            del data
+    finally:
+        w.close()
@@ -1,16 +1,20 @@
 import os
 import subprocess
 import re
+import base64
+import hashlib
+import json
+import threading
 
 import yaml
 import wave
 
-from mutagen.flac import FLAC  # type: ignore
+from mutagen.flac import FLAC, Picture  # type: ignore
 from mutagen.apev2 import APEv2  # type: ignore
-from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB, TPE2, TCM, TDRC, TRCK, TPOS
+from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB, TPE2, TCM, TDRC, TRCK, TPOS, TXXX
 from mutagen.mp3 import MP3
 from mutagen.oggopus import OggOpus
-from mutagen.mp4 import MP4, MP4Cover
+from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
 
 from typing import Tuple, List, Dict
 
@@ -27,6 +31,24 @@ PATTERN_CUE_MULTI = re.compile('^(.*) - CD([0-9]{1,3})$')
 PATTERN_SKIP = re.compile('^.*/CD([0-9]{1,3})$')
 
 
+FINGERPRINT_TAG = 'tintranscoder_fingerprint'
+MP4_FINGERPRINT = '----:com.github.attilabogar.tintranscoder:fingerprint'
+# tags kept when retagging: pictures, encoder written ones, source fingerprints
+OPUS_KEEP_TAGS = ['metadata_block_picture', 'encoder', FINGERPRINT_TAG]
+FLAC_KEEP_TAGS = ['encoder', FINGERPRINT_TAG]
+MP4_KEEP_TAGS = ['covr', '\xa9too', MP4_FINGERPRINT]
+MP3_KEEP_FRAMES = ['APIC', 'TSSE', 'TENC', 'TXXX:' + FINGERPRINT_TAG]
+
+# DTS audio CD/DVD full bitrate (1509.75 kbps)
+DTS_BYTES_PER_SECOND = 188718.75
+
+# PCM (sample rate, channels, bytes per sample) of CD audio and of DTS decoded by ffmpeg (5.1, s24le)
+PCM_FORMAT_CD = (44100, 2, 2)
+PCM_FORMAT_DTS = (48000, 6, 3)
+
+# CUE image split read size (~1.5 s of CD audio)
+SPLIT_CHUNK_FRAMES = 65536
+
 COVER_TYPES = ['jpg', 'png']
 COVER_BASES = ['folder', 'cover']
 
@@ -44,5 +66,38 @@ SUPPRESS_TAGS = [
     'encoder settings',
     'source',
     'style',
-    'genre'
-]
\ No newline at end of file
+    'genre',
+    FINGERPRINT_TAG
+]
+
+
+def filedigest(f: str) -> str:
+    """
+    Content hash of a file
+
+    Arguments:
+        f {str} -- File
+
+    Returns:
+        str -- Hex digest
+    """
+    h = hashlib.sha1()
+    with open(f, 'rb') as stream:
+        chunk = stream.read(1 << 20)
+        while chunk:
+            h.update(chunk)
+            chunk = stream.read(1 << 20)
+    return h.hexdigest()
+
+
+def metadigest(meta: Dict[str, List[str]]) -> str:
+    """
+    Hash of a track's metadata
+
+    Arguments:
+        meta {Dict[str, List[str]]} -- Metadata
+
+    Returns:
+        str -- Hex digest
+    """
+    return hashlib.sha1(json.dumps(meta, sort_keys=True).encode('utf8')).hexdigest()
\ No newline at end of file
@@ -0,0 +1,75 @@
+from .shared import *
+
+import tempfile
+
+
+class TempStore(object):
+    """
+    Budgeted temp directories (tiers) shared by all jobs of a run
+
+    Jobs reserve their estimated temp size before writing, the first
+    tier with room in its budget is picked (eg. RAM backed tmpfs first,
+    disk second). When no tier has room the reservation waits until
+    other jobs release theirs. Tiers without budget are unlimited.
+    Temp files are named with the run's own prefix, so those left behind
+    by a dead run can be told apart.
+    """
+
+    def __init__(self, tiers: List[Tuple[str, int]] = None) -> None:
+        """
+        Arguments:
+            tiers {List[Tuple[str, int]]} -- Directory and budget in bytes (or None) per tier
+        """
+        self.cond = threading.Condition()
+        self.prefix = 'tin{:d}-'.format(os.getpid())
+        self.configure(tiers or [(tempfile.gettempdir(), None)])
+
+    def configure(self, tiers: List[Tuple[str, int]]) -> None:
+        """
+        Replaces the tiers (before any reservation)
+
+        Arguments:
+            tiers {List[Tuple[str, int]]} -- Directory and budget in bytes (or None) per tier
+        """
+        with self.cond:
+            self.tiers = [t[0] for t in tiers]
+            self.budgets = dict(tiers)
+            self.used = dict([(t[0], 0) for t in tiers])
+
+    def reserve(self, size: int) -> str:
+        """
+        Reserves temp space, waits until a tier has room
+
+        A reservation larger than every budget is admitted into the
+        last tier once that is unused, hence it can not wait forever.
+
+        Arguments:
+            size {int} -- Bytes
+
+        Returns:
+            str -- Tier directory
+        """
+        with self.cond:
+            while True:
+                for t in self.tiers:
+                    budget = self.budgets[t]
+                    if budget is None or self.used[t] + size <= budget:
+                        self.used[t] += size
+                        return t
+                last = self.tiers[-1]
+                if self.used[last] == 0 and all(size > self.budgets[t] for t in self.tiers):
+                    self.used[last] += size
+                    return last
+                self.cond.wait()
+
+    def release(self, tier: str, size: int) -> None:
+        """
+        Releases (part of) a reservation
+
+        Arguments:
+            tier {str} -- Tier directory
+            size {int} -- Bytes
+        """
+        with self.cond:
+            self.used[tier] -= size
+            self.cond.notify_all()
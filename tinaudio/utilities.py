@@ -1,9 +1,10 @@
 from .shared import *
 from .album import *
-from .cache import ICache
+from .cache import ICache, SCAN_WORKERS
 
 
-def surveyor(albums: Dict[str, AlbumSet], path: str) -> None:
+def surveyor(albums: Dict[str, AlbumSet], path: str, indexdir: str = None, workers: int = SCAN_WORKERS,
+             subdirs: List[str] = ('',)) -> None:
     """
     Maps the album collection' root directory recursively
     into an album set
@@ -11,8 +12,11 @@ def surveyor(albums: Dict[str, AlbumSet], path: str) -> None:
     Arguments:
         albums {Dict[str, AlbumSet]} -- Album sets (returns)
         path {str} -- Album collection' root directory
+        indexdir {str} -- Persistent scan index directory or None
+        workers {int} -- Number of directory scanning threads
+        subdirs {List[str]} -- Subtrees (relative to root, not nested) to survey only
     """
-    c = ICache(path)
+    c = ICache(path, indexdir, workers, subdirs=subdirs)
     for d in c.getindex():
         (dirs, files) = c.get(d)
         foundcue = False
@@ -0,0 +1,715 @@
+#!/usr/bin/env python3
+# vim: tabstop=2 shiftwidth=2 softtabstop=2 expandtab:
+
+#
+# Copyright © 2019 Attila Bogár
+#
+# License: MIT
+#
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import shutil
+import struct
+import tempfile
+import optparse
+import subprocess
+
+from typing import Callable, Dict, List
+
+from mutagen.apev2 import APEv2  # type: ignore
+from mutagen.flac import FLAC, CueSheet, CueSheetTrack, CueSheetTrackIndex  # type: ignore
+from mutagen.ogg import OggPage  # type: ignore
+
+from tinaudio.cache import ICache, SCAN_WORKERS
+from tinaudio.encoder import Encoder
+from tinaudio.shared import DTS_BYTES_PER_SECOND
+from tinaudio.utilities import surveyor
+
+from tinutils import jobsetup
+
+
+DESCRIPTION = "tintranscoder benchmarks"
+VERSION = "0.1"
+
+# album layouts understood by surveyor
+SHAPES = ['flac', 'dts', 'cue', 'multicd', 'multicue']
+# discs of multi-CD albums
+SHAPE_DISCS = 2
+# codecs of end-to-end runs (having stand-in encoders)
+E2E_CODECS = ['flac', 'mp3', 'opus']
+# problem sizes without --sizes (end-to-end runs write real files)
+SIZES = [1000, 10000, 100000]
+E2E_SIZES = [10, 100]
+
+# stand-in for the external tools, run as flac, ffmpeg, opusenc, lame
+# (CPU seconds per audio second: $TINBENCH_COST encoders, $TINBENCH_DECODE_COST decoders)
+FAKE_TOOL = """
+import os
+import struct
+import sys
+import time
+
+BIN = os.path.dirname(os.path.abspath(__file__))
+TOOL = os.path.basename(sys.argv[0])
+ARGS = sys.argv[1:]
+COST = float(os.environ.get('TINBENCH_COST', '0'))
+DECODE_COST = float(os.environ.get('TINBENCH_DECODE_COST', '0'))
+
+
+def burn(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def after(flag):
+    return ARGS[ARGS.index(flag) + 1]
+
+
+def consume(path):
+    stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    head = stream.read(44)
+    (channels, rate, width) = (2, 44100, 2)
+    if head[0:4] == b'RIFF':
+        (channels, rate) = struct.unpack('<HI', head[22:28])
+        width = struct.unpack('<H', head[32:34])[0] // channels
+    size = len(head) - 44
+    data = stream.read(1 << 20)
+    while data:
+        size += len(data)
+        data = stream.read(1 << 20)
+    return (max(0, size) / (channels * rate * width), channels, rate, width)
+
+
+def emit(path, channels, rate, width, frames, raw=False):
+    out = sys.stdout.buffer if path == '-' else open(path, 'wb')
+    size = frames * channels * width
+    if not raw:
+        out.write(b'RIFF' + struct.pack('<I', 36 + size) + b'WAVE')
+        out.write(b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, rate, rate * channels * width,
+                                        channels * width, 8 * width))
+        out.write(b'data' + struct.pack('<I', size))
+    chunk = bytes(1 << 16)
+    while size > 0:
+        out.write(chunk[0:min(size, len(chunk))])
+        size -= len(chunk)
+    out.flush()
+
+
+def copy(template, dst):
+    with open(os.path.join(BIN, template), 'rb') as stream:
+        data = stream.read()
+    with open(dst, 'wb') as stream:
+        stream.write(data)
+
+
+if TOOL == 'flac' and '-d' in ARGS:
+    from mutagen.flac import FLAC
+    info = FLAC(ARGS[-1]).info
+    start = 0
+    end = info.total_samples
+    cue = [a for a in ARGS if a.startswith('--cue=')]
+    if cue:
+        tracks = FLAC(ARGS[-1]).cuesheet.tracks
+        (a, b) = [int(x.split('.')[0]) for x in cue[0][6:].split('-')]
+        start = tracks[a - 1].start_offset
+        end = tracks[b - 1].start_offset
+    frames = end - start
+    burn(DECODE_COST * frames / info.sample_rate)
+    emit('-' if '-c' in ARGS else after('-o'), info.channels, info.sample_rate, (info.bits_per_sample + 7) // 8,
+         frames, '--force-raw-format' in ARGS)
+elif TOOL == 'flac':
+    burn(COST * consume(ARGS[-1])[0])
+    copy('template.flac', after('-o'))
+elif TOOL == 'ffmpeg':
+    src = after('-i')
+    if src.endswith('.dts'):
+        (seconds, channels, rate, width) = (os.path.getsize(src) / {dts}, 6, 48000, 3)
+        burn(DECODE_COST * seconds)
+    else:
+        (seconds, channels, rate, width) = consume(src)
+    if '-ac' in ARGS:
+        channels = int(after('-ac'))
+    emit(ARGS[-1], channels, rate, width, int(seconds * rate))
+elif TOOL == 'opusenc':
+    burn(COST * consume(ARGS[-2])[0])
+    copy('template.opus', ARGS[-1])
+elif TOOL == 'lame':
+    burn(COST * consume(ARGS[-2])[0])
+    copy('template.mp3', ARGS[-1])
+else:
+    sys.exit(1)
+""".format(dts=DTS_BYTES_PER_SECOND)
+
+
+def timeit(f: Callable, *args) -> float:
+    """
+    Wall time of a call
+
+    Arguments:
+        f {Callable} -- Function to call
+
+    Returns:
+        float -- Seconds
+    """
+    t = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t
+
+
+def report(name: str, n: int, results: Dict[str, float]) -> None:
+    """
+    Prints a benchmark line
+
+    Arguments:
+        name {str} -- Benchmark
+        n {int} -- Problem size
+        results {Dict[str, float]} -- Seconds per variant
+    """
+    print("{:<10} {:>9d} ".format(name, n) + "  ".join(["{}={:.3f}s".format(k, results[k]) for k in sorted(results.keys())]))
+
+
+def streaminfo(channels: int, bits: int, rate: int, samples: int) -> bytes:
+    """
+    Minimal FLAC file (STREAMINFO block only, no audio frames)
+
+    Arguments:
+        channels {int} -- Channels
+        bits {int} -- Bits per sample
+        rate {int} -- Sample rate
+        samples {int} -- Samples per channel
+
+    Returns:
+        bytes -- FLAC file
+    """
+    block = struct.pack('>HH', 4096, 4096) + bytes(6)
+    block += struct.pack('>Q', (rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | samples)
+    block += bytes(16)
+    return b'fLaC' + bytes([0x80, 0, 0, len(block)]) + block
+
+
+class Templates(object):
+    """
+    File contents of synthetic albums (built once, written many times)
+    """
+
+    def __init__(self, tracks: int, seconds: float) -> None:
+        """
+        Arguments:
+            tracks {int} -- Tracks per disc
+            seconds {float} -- Track duration
+        """
+        self.tracks = tracks
+        self.seconds = seconds
+        tmpdir = tempfile.mkdtemp()
+        try:
+            samples = int(44100 * seconds)
+            f = os.path.join(tmpdir, 'track.flac')
+            self.write(f, streaminfo(2, 16, 44100, samples))
+            self.flac = self.tagged(f, {'title': 'Track', 'artist': 'Artist', 'album': 'Album',
+                                        'albumartist': 'Artist', 'date': '2019'})
+            # CUE image with embedded cuesheet (tracks + lead-out)
+            f = os.path.join(tmpdir, 'image.flac')
+            self.write(f, streaminfo(2, 16, 44100, samples * tracks))
+            image = FLAC(f)
+            cue = CueSheet(None)
+            cue.media_catalog_number = b''
+            cue.lead_in_samples = 88200
+            cue.compact_disc = True
+            for i in range(0, tracks):
+                t = CueSheetTrack(i + 1, i * samples)
+                t.indexes = [CueSheetTrackIndex(1, 0)]
+                cue.tracks.append(t)
+            cue.tracks.append(CueSheetTrack(170, tracks * samples))
+            image.metadata_blocks.append(cue)
+            image.cuesheet = cue
+            image.save()
+            self.image = self.read(f)
+            self.meta = "ALBUM=Album\nARTIST=Artist\nALBUMARTIST=Artist\nDATE=2019\nTRACKTOTAL={:02d}\n".format(tracks) + \
+                "".join(["cue_track{:02d}_TITLE=Track {:d}\n".format(i + 1, i + 1) for i in range(0, tracks)])
+            self.files = "".join(["{:d}: Track {:d}\n".format(i + 1, i + 1) for i in range(0, tracks)])
+            # DTS: raw payload + APEv2 tags, numbered per track
+            self.dts = []
+            for i in range(0, tracks):
+                f = os.path.join(tmpdir, 'track.dts')
+                self.write(f, bytes(int(DTS_BYTES_PER_SECOND * seconds)))
+                ape = APEv2()
+                ape['Track'] = "{:d}/{:d}".format(i + 1, tracks)
+                ape['Title'] = "Track {:d}".format(i + 1)
+                ape['Artist'] = 'Artist'
+                ape['Album'] = 'Album'
+                ape['Year'] = '2019'
+                ape.save(f)
+                self.dts.append(self.read(f))
+            self.cover = b'\xff\xd8\xff\xe0' + bytes(1024) + b'\xff\xd9'
+            # encoder outputs (valid containers for tagging)
+            f = os.path.join(tmpdir, 'out.flac')
+            self.write(f, streaminfo(2, 16, 44100, samples))
+            self.outflac = self.read(f)
+            self.outopus = self.oggopus(int(48000 * seconds))
+            self.outmp3 = (bytes([0xff, 0xfb, 0x90, 0x64]) + bytes(413)) * max(1, int(38.28 * seconds))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def write(self, f: str, data: bytes) -> None:
+        with open(f, 'wb') as stream:
+            stream.write(data)
+
+    def read(self, f: str) -> bytes:
+        with open(f, 'rb') as stream:
+            return stream.read()
+
+    def tagged(self, f: str, tags: Dict[str, str]) -> bytes:
+        """
+        Adds Vorbis comments to a FLAC file
+
+        Arguments:
+            f {str} -- FLAC file
+            tags {Dict[str, str]} -- Tags
+
+        Returns:
+            bytes -- FLAC file
+        """
+        flac = FLAC(f)
+        for (k, v) in tags.items():
+            flac[k] = v
+        flac.save()
+        return self.read(f)
+
+    def oggopus(self, samples: int) -> bytes:
+        """
+        Minimal Ogg Opus file (header, tags, a single audio packet)
+
+        Arguments:
+            samples {int} -- Samples at 48 kHz
+
+        Returns:
+            bytes -- Ogg Opus file
+        """
+        packets = [b'OpusHead' + bytes([1, 2]) + struct.pack('<HIhB', 312, 48000, 0, 0),
+                   b'OpusTags' + struct.pack('<I', 8) + b'tinbench' + struct.pack('<I', 0),
+                   b'\xfc\xff\xfe']
+        data = b''
+        for (i, p) in enumerate(packets):
+            page = OggPage()
+            page.packets = [p]
+            page.serial = 1
+            page.sequence = i
+            page.position = samples + 312 if i == 2 else 0
+            page.first = i == 0
+            page.last = i == 2
+            data += page.write()
+        return data
+
+
+def writefile(f: str, data) -> None:
+    """
+    Writes a file, creating its directory
+
+    Arguments:
+        f {str} -- File
+        data {bytes|str} -- Content
+    """
+    d = os.path.dirname(f)
+    if not os.path.isdir(d):
+        os.makedirs(d)
+    if isinstance(data, str):
+        data = data.encode('utf8')
+    with open(f, 'wb') as stream:
+        stream.write(data)
+
+
+def makealbum(root: str, shape: str, i: int, templates: Templates) -> None:
+    """
+    Creates a synthetic album
+
+    Arguments:
+        root {str} -- Collection's root directory
+        shape {str} -- Layout (see SHAPES)
+        i {int} -- Album number
+        templates {Templates} -- File contents
+    """
+    d = os.path.join(root, "Artist {:05d}".format(i // 10), "Album {:07d}".format(i))
+    name = "Album {:07d}".format(i)
+    tracks = ["{:02d} Track {:d}".format(j + 1, j + 1) for j in range(0, templates.tracks)]
+    if shape == 'flac':
+        for (j, t) in enumerate(tracks):
+            writefile(os.path.join(d, t + '.flac'), templates.flac)
+        writefile(os.path.join(d, 'folder.jpg'), templates.cover)
+    elif shape == 'dts':
+        for (j, t) in enumerate(tracks):
+            writefile(os.path.join(d, t + '.dts'), templates.dts[j])
+        writefile(os.path.join(d, 'folder.jpg'), templates.cover)
+    elif shape == 'multicd':
+        for cd in range(1, SHAPE_DISCS + 1):
+            for t in tracks:
+                writefile(os.path.join(d, "CD{:d}".format(cd), t + '.flac'), templates.flac)
+        writefile(os.path.join(d, 'folder.jpg'), templates.cover)
+    else:
+        # CUE images: single <name>.* or multi-CD <name> - CDn.*
+        if shape == 'cue':
+            bases = [name]
+        else:
+            bases = ["{} - CD{:d}".format(name, cd) for cd in range(1, SHAPE_DISCS + 1)]
+        for b in bases:
+            writefile(os.path.join(d, b + '.flac'), templates.image)
+            writefile(os.path.join(d, b + '.cue'), '')
+            writefile(os.path.join(d, b + '.meta.txt'), templates.meta)
+            writefile(os.path.join(d, b + '.files.yml'), templates.files)
+        writefile(os.path.join(d, name + '.jpg'), templates.cover)
+
+
+def makelibrary(root: str, albums: int, tracks: int = 12, seconds: float = 0.0, shapes: List[str] = SHAPES) -> None:
+    """
+    Creates a synthetic album collection, album layouts taken in turns
+
+    Arguments:
+        root {str} -- Collection's root directory
+        albums {int} -- Number of albums
+        tracks {int} -- Tracks per disc
+        seconds {float} -- Track duration (audio payload of DTS, STREAMINFO of FLAC)
+        shapes {List[str]} -- Layouts (see SHAPES)
+    """
+    templates = Templates(tracks, seconds)
+    for i in range(0, albums):
+        makealbum(root, shapes[i % len(shapes)], i, templates)
+
+
+def fakebin(bindir: str, seconds: float) -> None:
+    """
+    Installs stand-ins of flac, ffmpeg, opusenc and lame
+
+    Arguments:
+        bindir {str} -- Directory (to put first on $PATH)
+        seconds {float} -- Track duration of the encoded outputs
+    """
+    templates = Templates(1, seconds)
+    tool = os.path.join(bindir, 'tinfake.py')
+    writefile(tool, "#!{}\n".format(sys.executable) + FAKE_TOOL)
+    os.chmod(tool, 0o755)
+    for name in ['flac', 'ffmpeg', 'opusenc', 'lame']:
+        os.symlink(tool, os.path.join(bindir, name))
+    writefile(os.path.join(bindir, 'template.flac'), templates.outflac)
+    writefile(os.path.join(bindir, 'template.opus'), templates.outopus)
+    writefile(os.path.join(bindir, 'template.mp3'), templates.outmp3)
+
+
+def legacyscan(path: str) -> None:
+    """
+    The original os.walk + isfile + getmtime scan (reference)
+
+    Arguments:
+        path {str} -- Root directory
+    """
+    timecache = {}
+    for (xpath, xdirs, xfiles) in os.walk(path, topdown=True):
+        relative_path = xpath[len(path) + 1:]
+        for f in sorted(xfiles):
+            absolute_file = os.path.join(path, relative_path, f)
+            if os.path.isfile(absolute_file):
+                timecache[os.path.join(relative_path, f)] = os.path.getmtime(absolute_file)
+
+
+def survey(path: str) -> Dict:
+    """
+    Surveys and loads an album collection
+
+    Arguments:
+        path {str} -- Root directory
+
+    Returns:
+        Dict[str, AlbumSet] -- Album sets
+    """
+    albums = {}
+    surveyor(albums, path)
+    for k in albums.keys():
+        albums[k].load()
+    return albums
+
+
+def benchscan(sizes: List[int]) -> None:
+    """
+    Cold scan time against album count (all album layouts)
+
+    Arguments:
+        sizes {List[int]} -- Album counts
+    """
+    for n in sizes:
+        root = tempfile.mkdtemp()
+        try:
+            makelibrary(root, n)
+            results = {}
+            results['walk'] = timeit(legacyscan, root)
+            results['scandir'] = timeit(ICache, root, None, 1)
+            results['scandir{}'.format(SCAN_WORKERS)] = timeit(ICache, root, None, SCAN_WORKERS)
+            results['survey'] = timeit(survey, root)
+            report('scan', n, results)
+        finally:
+            shutil.rmtree(root)
+
+
+class SyntheticAlbumSet(object):
+    """
+    Album set stand-in for planning benchmarks
+    """
+
+    def __init__(self, key: str, tracks: int, mtime: float) -> None:
+        self.key = key
+        self.tracks = [(key, 1, i + 1, mtime, "{:02d} Track".format(i + 1)) for i in range(0, tracks)]
+
+    def getkey(self) -> str:
+        return self.key
+
+    def load(self) -> None:
+        pass
+
+    def dump(self) -> List[tuple]:
+        return self.tracks
+
+    def getcover(self) -> str:
+        return None
+
+
+class SyntheticCache(object):
+    """
+    ICache stand-in for planning benchmarks
+    """
+
+    def __init__(self, root: str, leafs: Dict[str, List[str]], mtime: float) -> None:
+        self.root = root
+        self.leafs = leafs
+        self.mtime = mtime
+
+    def getroot(self) -> str:
+        return self.root
+
+    def getleafs(self) -> List[str]:
+        return sorted(self.leafs.keys())
+
+    def get(self, key: str) -> tuple:
+        return ([], self.leafs[key])
+
+    def getmtime(self, relative_file: str) -> float:
+        return self.mtime
+
+
+def synthplan(n: int, tracks: int = 12) -> tuple:
+    """
+    Synthetic source/destination pair: 1/10 albums new, 1/10 removed, rest in sync
+
+    Arguments:
+        n {int} -- Number of albums
+        tracks {int} -- Tracks per album
+
+    Returns:
+        (Dict[str, SyntheticAlbumSet], SyntheticCache) -- Source albums, Destination cache
+    """
+    albums = {}
+    leafs = {}
+    for i in range(0, n):
+        key = "Artist {:05d}/Album {:07d}".format(i // 10, i)
+        if i % 10 != 0:
+            albums[key] = SyntheticAlbumSet(key, tracks, 1.0)
+        if i % 10 != 1:
+            leafs[key] = ["{:02d} Track.opus".format(j + 1) for j in range(0, tracks)]
+    return (albums, SyntheticCache('/dst', leafs, 2.0))
+
+
+def legacydiff(albums: Dict[str, SyntheticAlbumSet], dstcache: SyntheticCache) -> None:
+    """
+    The original list based key diff of jobsetup (reference)
+
+    Arguments:
+        albums {Dict[str, SyntheticAlbumSet]} -- Source albums
+        dstcache {SyntheticCache} -- Destination cache
+    """
+    dstkeys = dstcache.getleafs()
+    keycommon = []
+    keydel = []
+    for k in sorted(list(albums.keys())):
+        if k in dstkeys:
+            keycommon.append(k)
+    for k in dstkeys:
+        if k not in keycommon:
+            keydel.append(k)
+
+
+def benchplan(sizes: List[int]) -> None:
+    """
+    jobsetup time against album count (synthetic and generated collections)
+
+    Arguments:
+        sizes {List[int]} -- Album counts
+    """
+    encoder = Encoder('opus', False)
+    for n in sizes:
+        (albums, dstcache) = synthplan(n)
+        results = {}
+        results['jobsetup'] = timeit(jobsetup, albums, dstcache, encoder, False)
+        # quadratic, only feasible for small libraries
+        if n <= 10000:
+            results['legacydiff'] = timeit(legacydiff, albums, dstcache)
+        root = tempfile.mkdtemp()
+        dst = tempfile.mkdtemp()
+        try:
+            makelibrary(root, n)
+            albums = survey(root)
+            results['library'] = timeit(jobsetup, albums, ICache(dst), encoder, False)
+        finally:
+            shutil.rmtree(root)
+            shutil.rmtree(dst)
+        report('plan', n, results)
+
+
+def transcode(src: str, dsts: Dict[str, str], env: Dict[str, str], reportf: str) -> int:
+    """
+    Runs tintranscoder
+
+    Arguments:
+        src {str} -- Source collection
+        dsts {Dict[str, str]} -- Destination directory per codec
+        env {Dict[str, str]} -- Environment
+        reportf {str} -- Run report file
+
+    Returns:
+        int -- Failed outputs
+    """
+    args = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tintranscoder.py')]
+    for codec in sorted(dsts.keys()):
+        args.append("--dst-{}={}".format(codec, dsts[codec]))
+    args.extend(["--report=" + reportf, src])
+    FNULL = open(os.devnull, 'w')
+    subprocess.call(args, env=env, stdout=FNULL, stderr=FNULL)
+    FNULL.close()
+    with open(reportf, 'r') as stream:
+        return json.load(stream)['failed']
+
+
+def benche2e(sizes: List[int], seconds: float = 1.0, codecs: List[str] = E2E_CODECS) -> None:
+    """
+    End-to-end run time against album count with stand-in tools
+
+    Generated collection (all album layouts) transcoded from scratch
+    (cold) and again without changes (resync). The stand-ins' cost is
+    set by $TINBENCH_COST and $TINBENCH_DECODE_COST.
+
+    Arguments:
+        sizes {List[int]} -- Album counts
+        seconds {float} -- Track duration
+        codecs {List[str]} -- Output codecs
+    """
+    for n in sizes:
+        root = tempfile.mkdtemp()
+        try:
+            src = os.path.join(root, 'src')
+            bindir = os.path.join(root, 'bin')
+            os.makedirs(bindir)
+            makelibrary(src, n, seconds=seconds)
+            fakebin(bindir, seconds)
+            dsts = {}
+            for codec in codecs:
+                dsts[codec] = os.path.join(root, codec)
+                os.makedirs(dsts[codec])
+            env = dict(os.environ)
+            env['PATH'] = bindir + os.pathsep + env.get('PATH', '')
+            results = {}
+            reportf = os.path.join(root, 'report.json')
+            failed = 0
+            for run in ['cold', 'resync']:
+                t = time.perf_counter()
+                failed += transcode(src, dsts, env, reportf)
+                results[run] = time.perf_counter() - t
+            report('e2e', n, results)
+            if failed:
+                print("e2e: {:d} outputs failed".format(failed), file=sys.stderr)
+        finally:
+            shutil.rmtree(root)
+
+
+def makespan(durations: List[float], workers: int) -> float:
+    """
+    Simulated wall time of running jobs in the given order on a worker pool
+
+    Arguments:
+        durations {List[float]} -- Job durations in pick order
+        workers {int} -- Number of workers
+
+    Returns:
+        float -- Makespan
+    """
+    free = [0.0] * workers
+    for d in durations:
+        heapq.heappush(free, heapq.heappop(free) + d)
+    return max(free)
+
+
+def benchorder(sizes: List[int], workers: int = 16) -> None:
+    """
+    Simulated makespan of key (alphabetical) order against longest-first order
+
+    Track lengths: mostly 2-7 minutes, 3% long (classical) 10-70 minutes, in
+    random (key) order. The worst case of key order, the longest track
+    queued last, is reported separately (keylast).
+
+    Arguments:
+        sizes {List[int]} -- Track counts
+        workers {int} -- Number of workers
+    """
+    rnd = random.Random(1)
+    for n in sizes:
+        durations = []
+        for i in range(0, n):
+            if rnd.random() < 0.03:
+                durations.append(rnd.uniform(600, 4200))
+            else:
+                durations.append(rnd.uniform(120, 420))
+        # key order is unrelated to duration
+        longest = durations.index(max(durations))
+        keylast = durations[:longest] + durations[longest + 1:] + [durations[longest]]
+        results = {}
+        results['bound'] = max(sum(durations) / workers, max(durations))
+        results['keyorder'] = makespan(durations, workers)
+        results['keylast'] = makespan(keylast, workers)
+        results['longest'] = makespan(sorted(durations, reverse=True), workers)
+        print("{:<10} {:>9d} ".format('order', n) +
+              "  ".join(["{}={:.0f}s".format(k, results[k]) for k in sorted(results.keys())]))
+
+
+BENCHMARKS = {
+    'e2e': benche2e,
+    'order': benchorder,
+    'plan': benchplan,
+    'scan': benchscan,
+}
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(version="%prog version " + VERSION,
+                                   description=DESCRIPTION,
+                                   usage="""%prog [--sizes=N,N,...] <benchmark>* ({})""".format("|".join(sorted(BENCHMARKS.keys()))))
+
+    parser.add_option("--sizes", action="store", type="string", dest="sizes", metavar="N,N,...",
+                      help="Problem sizes (default: {}, e2e: {})".format(
+                          ",".join([str(n) for n in SIZES]), ",".join([str(n) for n in E2E_SIZES])))
+
+    (options, args) = parser.parse_args()
+
+    if len([a for a in args if a not in BENCHMARKS]) > 0:
+        parser.print_help()
+        sys.exit(1)
+
+    for b in args or sorted(BENCHMARKS.keys()):
+        if options.sizes:
+            sizes = [int(x) for x in options.sizes.split(',')]
+        elif b == 'e2e':
+            sizes = E2E_SIZES
+        else:
+            sizes = SIZES
+        BENCHMARKS[b](sizes)
+
+    sys.exit(0)
@@ -2,12 +2,25 @@ import os
 import subprocess
 import shutil
 import tempfile
+import time
 import re
 
+from typing import Dict, List
+
 from tinaudio.album import AlbumSet
+from tinaudio.cover import CoverCache
+from tinaudio.tempstore import TempStore
+from tinstats import stats
+
 
+PIPE_CHUNK = 1 << 20
+DECODE_COST = 0.2
 
-TMPFS = '/tmp'
+# pipeline stages
+STAGE_DECODE = 'decode'
+STAGE_ENCODE = 'encode'
+STAGE_COMMIT = 'commit'
+STAGES = [STAGE_DECODE, STAGE_ENCODE, STAGE_COMMIT]
 
 # patterns
 PATTERN_FLAC = re.compile('.*\\.flac$')
@@ -23,6 +36,13 @@ COVER_TYPES = ['jpg', 'png']
 COVER_BASES = ['folder', 'cover']
 COVER_FILE = 'folder.jpg'
 
+# converted covers (shared by all jobs)
+covers = CoverCache()
+# temp directories (shared by all jobs)
+tmpstore = TempStore()
+# journals per destination root (shared by all jobs)
+journals = {}
+
 
 class GenericJob(object):
     """
@@ -31,6 +51,9 @@ class GenericJob(object):
     Ancestor for CoverJob and EncodeJob
     """
 
+    # outputs are moved into place through <output><tmpsuffix> (one per lease of a remote job)
+    tmpsuffix = '.tmp'
+
     def status(self, s1: str, s2: str) -> None:
         """
         Generic status output
@@ -39,8 +62,58 @@ class GenericJob(object):
             s1 {str} -- Pass/Fail
             s2 {str} -- Job' filename
         """
+        if s1 == 'FAILED':
+            stats.fail()
         print("{}: {}".format(s1, s2))
 
+    def cost(self) -> float:
+        """
+        Estimated cost of the job (for scheduling)
+
+        Returns:
+            float -- Cost
+        """
+        return 0.0
+
+    def stages(self) -> List[str]:
+        """
+        Pipeline stages of the job
+
+        Returns:
+            List[str] -- Stages
+        """
+        return [STAGE_ENCODE]
+
+    def runstage(self, stage: str) -> None:
+        """
+        Runs a pipeline stage of the job
+
+        Arguments:
+            stage {str} -- Stage
+        """
+        self.doit()
+
+    def cleanup(self) -> None:
+        """
+        Removes the temp files of a failed job
+        """
+        pass
+
+    def getcover(self, cover: str, jpeg: bool = False) -> bytes:
+        """
+        Cover to embed (shared by all tracks and destinations of the album)
+
+        Arguments:
+            cover {str} -- Cover file (relative to album collection' root) or None
+            jpeg {bool} -- Convert to JPEG
+
+        Returns:
+            bytes -- Cover (JPEG or PNG) or None
+        """
+        if cover:
+            return covers.get(os.path.join(self.albumset.getroot(), cover), jpeg)
+        return None
+
 
 class CoverJob(GenericJob):
     """
@@ -63,36 +136,44 @@ class CoverJob(GenericJob):
         else:
             self.status('COVER', f)
 
+    def cost(self) -> float:
+        """
+        Estimated cost of the job (for scheduling)
+
+        Returns:
+            float -- Cost (covers unblock their album's tracks, hence first)
+        """
+        return float('inf')
+
     def doit(self) -> None:
         """
         Business logic for 'album cover' job
+
+        Raises:
+            Exception: When the cover could not be converted (nothing written)
         """
+        t = time.perf_counter()
         cover = self.albumset.getcover()
         if not os.path.isdir(self.dstroot):
             os.makedirs(self.dstroot, exist_ok=True)
         if cover:
-            cover = os.path.join(self.albumset.getroot(), cover)
+            data = self.getcover(cover, True)
+            if not data:
+                raise Exception("Cover conversion failed: " + cover)
             dst = os.path.join(self.dstroot, COVER_FILE)
-            if os.path.isfile(dst):
-                os.remove(dst)
-            ext = COVER_FILE[-3:]
-            tmpf = dst + '.tmp'
-            if cover[-3:] == ext:
-                shutil.copyfile(cover, tmpf)
-            else:
-                # png
-                (no, tmpconvertext) = tempfile.mkstemp(suffix='.' + ext, dir=TMPFS)
-                os.close(no)
-                FNULL = open(os.devnull, 'w')
-                subprocess.call(['convert', cover, tmpconvertext], stdout=FNULL, stderr=FNULL)
-                FNULL.close()
-                shutil.move(tmpconvertext, tmpf)
+            tmpf = dst + self.tmpsuffix
+            with open(tmpf, 'wb') as stream:
+                stream.write(data)
             shutil.move(tmpf, dst)
+            stats.record('cover', time.perf_counter() - t, self.albumset.getkey(), written=len(data))
 
 
 class EncodeJob(GenericJob):
     """
     Job encodes a track
+
+    A track may fan out into several destinations (eg. one per codec),
+    the source is decoded only once for all of them.
     """
 
     def __init__(self, albumset: AlbumSet, discnumber: int, tracknumber: int, dstroot: str, dstfile: str, encoder: str) -> None:
@@ -111,53 +192,597 @@ class EncodeJob(GenericJob):
         self.key = albumset.getkey()
         self.discnumber = discnumber
         self.tracknumber = tracknumber
-        self.dstroot = dstroot
-        self.dstfile = dstfile
-        self.encoder = encoder
+        self.targets = []
+        self.addtarget(dstroot, dstfile, encoder)
+        self.stream = False
+        self.fingerprint = False
+        self.split = False
+        self.presplitted = False
+        self.tier = None
+        self.reserved = 0
+        self.wavs = {}
+        self.outputs = []
+        self.committed = []
+        self.cover = None
+        self.meta = None
+        self.fingerprinted = None
         self.albumset.load()
 
+    def addtarget(self, dstroot: str, dstfile: str, encoder: str) -> None:
+        """
+        Adds a further destination for the same track
+
+        Arguments:
+            dstroot {str} -- Output directory root
+            dstfile {str} -- Output file relative to directory root
+            encoder {str} -- Encoder selector
+        """
+        self.targets.append((dstroot, dstfile, encoder))
+
+    def merge(self, job) -> None:
+        """
+        Takes over the destinations of another job of the same track
+
+        Arguments:
+            job {EncodeJob} -- Job encoding the same track
+        """
+        for (dstroot, dstfile, encoder) in job.targets:
+            self.addtarget(dstroot, dstfile, encoder)
+        self.fingerprint = self.fingerprint or job.fingerprint
+
+    def dstroots(self) -> List[str]:
+        """
+        Output directory roots the job writes into
+
+        Returns:
+            List[str] -- Directories
+        """
+        return [t[0] for t in self.targets]
+
+    def cost(self) -> float:
+        """
+        Estimated cost of the job (for scheduling)
+
+        Returns:
+            float -- Track duration x (decode + encoders' cost factors)
+        """
+        return self.duration() * (DECODE_COST + sum([t[2].cost() for t in self.targets]))
+
+    def duration(self) -> float:
+        """
+        Duration of the track
+
+        Returns:
+            float -- Seconds (0.0 if unknown)
+        """
+        try:
+            return self.albumset.getduration(self.discnumber, self.tracknumber)
+        except Exception:
+            return 0.0
+
+    def sourcesize(self) -> int:
+        """
+        Source bytes of the track (read when decoding)
+
+        Returns:
+            int -- Bytes (0 if unknown)
+        """
+        try:
+            return self.albumset.getsize(self.discnumber, self.tracknumber)
+        except Exception:
+            return 0
+
     def announce(self, failed: bool) -> None:
         """
         Generic status logging to console
 
         Arguments:
-            failed {bool} -- Pass/Fail
+            failed {bool} -- Pass/Fail (outputs moved into place already are not failed)
         """
-        if failed:
-            self.status('FAILED', self.dstfile)
-        else:
-            self.status('ENCODE', self.dstfile)
+        for (dstroot, dstfile, encoder) in self.targets:
+            if failed:
+                if (dstroot, dstfile) not in self.committed:
+                    self.status('FAILED', dstfile)
+            else:
+                self.status('ENCODE', dstfile)
 
-    def doit(self) -> None:
+    def stages(self) -> List[str]:
         """
-        Business logic for 'track encode' job
+        Pipeline stages of the job
+
+        Returns:
+            List[str] -- Stages (streamed jobs decode and encode at once, tracks cut
+                by a SplitJob take over their WAV in the encode stage)
         """
-        dst = os.path.join(self.dstroot, self.dstfile)
-        dstdir = os.path.dirname(dst)
+        if self.streaming() or self.presplitted:
+            return [STAGE_ENCODE, STAGE_COMMIT]
+        return [STAGE_DECODE, STAGE_ENCODE, STAGE_COMMIT]
 
-        # temp wav
-        (no, tmpwav) = tempfile.mkstemp(suffix='.wav', dir=TMPFS)
-        os.close(no)
-        (cover, meta) = self.albumset.export(self.discnumber, self.tracknumber, tmpwav)
-        # prefer generated COVER_FILE
-        expectedcover = os.path.join(dstdir, COVER_FILE)
-        if os.path.isfile(expectedcover):
-            cover = expectedcover
-        elif cover:
-            cover = os.path.join(self.albumset.getroot(), cover)
-
-        # temp dst
-        no, tmp = tempfile.mkstemp(suffix='.' + self.encoder.suffix(), dir=TMPFS)
+    def streaming(self) -> bool:
+        """
+        Whether the decoder is piped into the encoders
+
+        Returns:
+            bool -- True if requested and all encoders can read stdin
+        """
+        return self.stream and not self.split and all(t[2].streamable() for t in self.targets)
+
+    def presplit(self, wavfile: str, tier: str, reserved: int) -> None:
+        """
+        Takes over the track's WAV cut by a SplitJob
+
+        Arguments:
+            wavfile {str} -- Decoded PCM WAV file
+            tier {str} -- Temp directory of the WAV
+            reserved {int} -- Temp space reserved for the track
+        """
+        self.wavs[False] = wavfile
+        self.tier = tier
+        self.reserved = reserved
+        # holds temp space already, must not wait for a decoder
+        self.presplitted = True
+
+    def tempsize(self) -> int:
+        """
+        Estimated temp space of the decoded track
+
+        Returns:
+            int -- Bytes (duration x sample rate x channels x sample width, plus stereo downmix)
+        """
+        try:
+            duration = self.albumset.getduration(self.discnumber, self.tracknumber)
+            (rate, channels, width) = self.albumset.getformat(self.discnumber, self.tracknumber)
+        except Exception:
+            return 0
+        size = int(duration * rate * channels * width)
+        downmix = [t for t in self.targets if t[2].downmix]
+        if downmix and len(downmix) < len(self.targets) and channels > 2:
+            size += size * 2 // channels
+        return size
+
+    def release(self) -> None:
+        """
+        Releases the job's temp space reservation
+        """
+        if self.reserved:
+            tmpstore.release(self.tier, self.reserved)
+            self.reserved = 0
+
+    def runstage(self, stage: str) -> None:
+        """
+        Runs a pipeline stage of the job
+
+        Arguments:
+            stage {str} -- Stage
+        """
+        if stage == self.stages()[0]:
+            self.journalstart()
+        if stage == STAGE_DECODE:
+            self.decode()
+        elif stage == STAGE_ENCODE:
+            if self.streaming():
+                self.pipe()
+            else:
+                if self.presplitted:
+                    self.decode()
+                self.encode()
+        elif stage == STAGE_COMMIT:
+            self.finalize()
+
+    def journalstart(self) -> None:
+        """
+        Records the start of the job in the destinations' journals
+        """
+        for (dstroot, dstfile, encoder) in self.targets:
+            if dstroot in journals:
+                journals[dstroot].start(dstfile)
+
+    def journalcommit(self, dstroot: str, dstfile: str, encoder: str) -> None:
+        """
+        Records an output moved into place in its destination's journal
+
+        Arguments:
+            dstroot {str} -- Output directory root
+            dstfile {str} -- Output file relative to directory root
+            encoder {str} -- Encoder selector
+        """
+        if dstroot in journals:
+            journals[dstroot].commit(dstfile, encoder.settings(),
+                                     self.albumset.gettimes(self.discnumber, self.tracknumber), self.fingerprinted)
+
+    def cleanup(self) -> None:
+        """
+        Removes the temp files of the job
+        """
+        for f in list(self.wavs.values()) + [o[3] for o in self.outputs]:
+            if os.path.isfile(f):
+                os.remove(f)
+        self.wavs = {}
+        self.outputs = []
+        self.release()
+
+    def prepare(self, cover: str, meta: Dict[str, List[str]]) -> None:
+        """
+        Collects what the outputs get tagged with
+
+        Arguments:
+            cover {str} -- Cover file (relative to album collection' root) or None
+            meta {Dict[str, List[str]]} -- Metadata
+        """
+        self.cover = self.getcover(cover)
+        self.meta = meta
+        self.fingerprinted = None
+        if self.fingerprint:
+            self.fingerprinted = self.albumset.fingerprint(self.discnumber, self.tracknumber)
+
+    def tmpoutput(self, encoder: str) -> str:
+        """
+        Temp file for an encoder's output
+
+        Arguments:
+            encoder {str} -- Encoder selector
+
+        Returns:
+            str -- File (not created)
+        """
+        no, tmp = tempfile.mkstemp(suffix='.' + encoder.suffix(), prefix=tmpstore.prefix,
+                                   dir=self.tier or tmpstore.tiers[0])
         os.close(no)
         os.remove(tmp)
-        self.encoder.encode(tmpwav, tmp, cover, meta)
+        return tmp
+
+    def decode(self) -> None:
+        """
+        Decodes the track into a temp WAV (and a stereo one if any destination downmixes)
+        """
+        if False in self.wavs:
+            # cut by a SplitJob already
+            tmpwav = self.wavs[False]
+            (cover, meta) = self.albumset.exportmeta(self.discnumber, self.tracknumber)
+        else:
+            # temp wav, waits for temp space
+            self.reserved = self.tempsize()
+            self.tier = tmpstore.reserve(self.reserved)
+            (no, tmpwav) = tempfile.mkstemp(suffix='.wav', prefix=tmpstore.prefix, dir=self.tier)
+            os.close(no)
+            self.wavs[False] = tmpwav
+            t = time.perf_counter()
+            (cover, meta) = self.albumset.export(self.discnumber, self.tracknumber, tmpwav)
+            stats.record('decode', time.perf_counter() - t, self.key, read=self.sourcesize())
+        self.prepare(cover, meta)
+        self.downmix(tmpwav)
+
+    def downmix(self, tmpwav: str) -> None:
+        """
+        Downmixes the decoded track for the destinations downmixing (in place if all of them)
+
+        Arguments:
+            tmpwav {str} -- Decoded PCM WAV file
+        """
+        downmix = [t[2] for t in self.targets if t[2].downmix]
+        t = time.perf_counter()
+        if len(downmix) == len(self.targets):
+            self.wavs[True] = downmix[0].downmixWAV(tmpwav)
+        elif downmix:
+            self.wavs[True] = downmix[0].downmixWAV(tmpwav, tmpwav[:-4] + '-stereo.wav')
+        if downmix:
+            stats.record('downmix', time.perf_counter() - t, self.key)
+
+    def encode(self) -> None:
+        """
+        Encodes the decoded track into every destination (temp files)
+        """
+        FNULL = open(os.devnull, 'w')
+        try:
+            for (dstroot, dstfile, encoder) in self.targets:
+                tmp = self.tmpoutput(encoder)
+                self.outputs.append((dstroot, dstfile, encoder, tmp))
+                wavf = self.wavs[encoder.downmix]
+                t = time.perf_counter()
+                subprocess.call(encoder.encodeargs(wavf, tmp), stdout=FNULL, stderr=FNULL)
+                stats.record('encode', time.perf_counter() - t, self.key, encoder.codec, self.duration())
+        finally:
+            FNULL.close()
+        # delete wav(s)
+        for f in set(self.wavs.values()):
+            if os.path.isfile(f):
+                os.remove(f)
+        self.wavs = {}
+        self.release()
+
+    def pipe(self) -> None:
+        """
+        Streams the decoder's output into every encoder (no temp WAV)
+
+        Raises:
+            Exception: When any of the processes failed
+        """
+        t = time.perf_counter()
+        (cover, meta) = self.albumset.exportmeta(self.discnumber, self.tracknumber)
+        self.prepare(cover, meta)
+        channels = self.albumset.getchannels(self.discnumber, self.tracknumber)
+        multichannel = channels is None or channels > 2
+        FNULL = open(os.devnull, 'w')
+        procs = []
+        heads = []
+        try:
+            decoder = subprocess.Popen(self.albumset.exportargs(self.discnumber, self.tracknumber),
+                                       stdout=subprocess.PIPE, stderr=FNULL)
+            procs.append(decoder)
+            for (dstroot, dstfile, encoder) in self.targets:
+                tmp = self.tmpoutput(encoder)
+                self.outputs.append((dstroot, dstfile, encoder, tmp))
+                if encoder.downmix and multichannel:
+                    downmix = subprocess.Popen(encoder.downmixargs(), stdin=subprocess.PIPE,
+                                               stdout=subprocess.PIPE, stderr=FNULL)
+                    p = subprocess.Popen(encoder.encodeargs('-', tmp), stdin=downmix.stdout,
+                                         stdout=FNULL, stderr=FNULL)
+                    downmix.stdout.close()
+                    procs.append(downmix)
+                    heads.append(downmix.stdin)
+                else:
+                    p = subprocess.Popen(encoder.encodeargs('-', tmp), stdin=subprocess.PIPE,
+                                         stdout=FNULL, stderr=FNULL)
+                    heads.append(p.stdin)
+                procs.append(p)
+            # tee
+            alive = list(heads)
+            chunk = decoder.stdout.read(PIPE_CHUNK)
+            while chunk and alive:
+                for h in list(alive):
+                    try:
+                        h.write(chunk)
+                    except BrokenPipeError:
+                        alive.remove(h)
+                chunk = decoder.stdout.read(PIPE_CHUNK)
+            decoder.stdout.close()
+            for h in heads:
+                try:
+                    h.close()
+                except BrokenPipeError:
+                    pass
+            failed = [p.args[0] for p in procs if p.wait() != 0]
+            if failed:
+                raise Exception("Pipeline failed: " + ", ".join(failed))
+            # decoder and encoders ran together, every codec took the whole time
+            seconds = time.perf_counter() - t
+            read = self.sourcesize()
+            for o in self.outputs:
+                stats.record('pipe', seconds, self.key, o[2].codec, self.duration(), read=read)
+                # the source is read once for all encoders
+                read = 0
+        finally:
+            for p in procs:
+                if p.poll() is None:
+                    p.kill()
+                    p.wait()
+            FNULL.close()
+
+    def finalize(self) -> None:
+        """
+        Tags the encoded temp files and moves them into their destinations
+        """
+        while self.outputs:
+            (dstroot, dstfile, encoder, tmp) = self.outputs[0]
+            t = time.perf_counter()
+            encoder.tag(tmp, self.cover, self.meta, self.fingerprinted)
+            stats.record('tag', time.perf_counter() - t, self.key)
+            t = time.perf_counter()
+            written = self.outputsize(tmp)
+            self.commit(tmp, os.path.join(dstroot, dstfile))
+            stats.record('move', time.perf_counter() - t, self.key, written=written)
+            self.journalcommit(dstroot, dstfile, encoder)
+            self.committed.append((dstroot, dstfile))
+            self.outputs.pop(0)
+
+    def doit(self) -> None:
+        """
+        Business logic for 'track encode' job (all stages in a row)
+        """
+        try:
+            for stage in self.stages():
+                self.runstage(stage)
+        finally:
+            self.cleanup()
+
+    def outputsize(self, tmp: str) -> int:
+        """
+        Size of an encoded temp file
+
+        Arguments:
+            tmp {str} -- Encoded temp file
 
-        # delete wav
-        os.remove(tmpwav)
+        Returns:
+            int -- Bytes (0 if missing)
+        """
+        if os.path.isfile(tmp):
+            return os.path.getsize(tmp)
+        return 0
+
+    def commit(self, tmp: str, dst: str) -> None:
+        """
+        Moves an encoded file into its destination
 
+        Arguments:
+            tmp {str} -- Encoded temp file
+            dst {str} -- Output file
+        """
+        dstdir = os.path.dirname(dst)
         # find if folder exists
         if not os.path.isdir(dstdir):
             os.makedirs(dstdir, exist_ok=True)
         # move the opus
-        shutil.move(tmp, dst + ".tmp")
-        shutil.move(dst + ".tmp", dst)
\ No newline at end of file
+        shutil.move(tmp, dst + self.tmpsuffix)
+        shutil.move(dst + self.tmpsuffix, dst)
+
+
+class SplitJob(GenericJob):
+    """
+    Job decodes a CUE image once and cuts it into its tracks' WAVs
+
+    The tracks' encode jobs depend on it and take over the WAVs, if the
+    split fails they decode their own track as usual.
+    """
+
+    def __init__(self, albumset: AlbumSet, discnumber: int, jobs: List[EncodeJob]) -> None:
+        """
+        Initializes disc' split job
+
+        Arguments:
+            albumset {AlbumSet} -- Album set
+            discnumber {int} -- Disc number (in slbum set)
+            jobs {List[EncodeJob]} -- Encode jobs of the disc's tracks
+        """
+        self.albumset = albumset
+        self.key = albumset.getkey()
+        self.discnumber = discnumber
+        self.jobs = jobs
+
+    def stages(self) -> List[str]:
+        """
+        Pipeline stages of the job
+
+        Returns:
+            List[str] -- Stages
+        """
+        return [STAGE_DECODE]
+
+    def cost(self) -> float:
+        """
+        Estimated cost of the job (for scheduling)
+
+        Returns:
+            float -- Cost of the tracks it unblocks
+        """
+        return sum([j.cost() for j in self.jobs])
+
+    def announce(self, failed: bool) -> None:
+        """
+        Generic status logging to console
+
+        Arguments:
+            failed {bool} -- Pass/Fail
+        """
+        disc = "{} (CD{:d})".format(self.key, self.discnumber)
+        if failed:
+            self.status('FAILED', disc)
+        else:
+            self.status('SPLIT', disc)
+
+    def doit(self) -> None:
+        """
+        Business logic for 'disc split' job
+        """
+        # waits for temp space of all the tracks
+        sizes = dict([(j.tracknumber, j.tempsize()) for j in self.jobs])
+        tier = tmpstore.reserve(sum(sizes.values()))
+        wavfiles = {}
+        for j in self.jobs:
+            (no, tmpwav) = tempfile.mkstemp(suffix='.wav', prefix=tmpstore.prefix, dir=tier)
+            os.close(no)
+            wavfiles[j.tracknumber] = tmpwav
+        try:
+            t = time.perf_counter()
+            self.albumset.split(self.discnumber, wavfiles)
+            # the image is read up to the last track
+            stats.record('split', time.perf_counter() - t, self.key,
+                         read=sum([self.albumset.getsize(self.discnumber, n) for n in range(1, max(wavfiles) + 1)]))
+        except Exception:
+            for f in wavfiles.values():
+                if os.path.isfile(f):
+                    os.remove(f)
+            tmpstore.release(tier, sum(sizes.values()))
+            raise
+        for j in self.jobs:
+            j.presplit(wavfiles[j.tracknumber], tier, sizes[j.tracknumber])
+
+
+class UpdateJob(GenericJob):
+    """
+    Job updates an already encoded track in place (no re-encode)
+
+    Used when only the source's metadata (retag) and/or cover (recover)
+    changed, or when the source's mtime changed but its content did not
+    (touch only)
+    """
+
+    def __init__(self, albumset: AlbumSet, discnumber: int, tracknumber: int, dstroot: str, dstfile: str, encoder: str,
+                 retag: bool = False, recover: bool = False) -> None:
+        """
+        Initializes track' update job
+
+        Arguments:
+            albumset {AlbumSet} -- Album set
+            discnumber {int} -- Disc number (in slbum set)
+            tracknumber {int} -- Track number (in album)
+            dstroot {str} -- Output directory root
+            dstfile {str} -- Output file relative to directory root
+            encoder {str} -- Encoder selector
+            retag {bool} -- Rewrite the tags
+            recover {bool} -- Replace the embedded cover
+        """
+        self.albumset = albumset
+        self.key = albumset.getkey()
+        self.discnumber = discnumber
+        self.tracknumber = tracknumber
+        self.dstroot = dstroot
+        self.dstfile = dstfile
+        self.encoder = encoder
+        self.retag = retag
+        self.recover = recover
+        self.fingerprint = False
+
+    def dstroots(self) -> List[str]:
+        """
+        Output directory roots the job writes into
+
+        Returns:
+            List[str] -- Directories
+        """
+        return [self.dstroot]
+
+    def stages(self) -> List[str]:
+        """
+        Pipeline stages of the job
+
+        Returns:
+            List[str] -- Stages (tagging only)
+        """
+        return [STAGE_COMMIT]
+
+    def announce(self, failed: bool) -> None:
+        """
+        Generic status logging to console
+
+        Arguments:
+            failed {bool} -- Pass/Fail
+        """
+        if failed:
+            self.status('FAILED', self.dstfile)
+        elif self.retag:
+            self.status('RETAG', self.dstfile)
+        elif self.recover:
+            self.status('RECOVER', self.dstfile)
+        else:
+            self.status('UPDATE', self.dstfile)
+
+    def doit(self) -> None:
+        """
+        Business logic for 'track update' job
+        """
+        t = time.perf_counter()
+        dst = os.path.join(self.dstroot, self.dstfile)
+        if self.retag or self.recover:
+            (cover, meta) = self.albumset.exportmeta(self.discnumber, self.tracknumber)
+        if self.recover:
+            self.encoder.embedcover(dst, self.getcover(cover))
+        if self.retag or (self.recover and self.fingerprint):
+            fingerprint = None
+            if self.fingerprint:
+                fingerprint = self.albumset.fingerprint(self.discnumber, self.tracknumber)
+            self.encoder.retag(dst, meta, fingerprint)
+        # newer than the source from now on
+        os.utime(dst)
+        # let persistent scan indexes notice
+        os.utime(os.path.dirname(dst))
+        stats.record('update', time.perf_counter() - t, self.key)
@@ -0,0 +1,236 @@
+import json
+import fcntl
+import glob
+import os
+import socket
+import threading
+import time
+
+from typing import Dict, List, Tuple
+
+
+JOURNAL_FILE = '.tintranscoder.journal'
+# journals of every shard (and their compaction temp and lock files)
+JOURNAL_PATTERN = '.tintranscoder*.journal*'
+JOURNAL_LOCK = '.lock'
+
+
+def journalname(shard: int = None, shards: int = None) -> str:
+    """
+    Journal file of a run, shards sharing a destination keep their own
+
+    Arguments:
+        shard {int} -- Shard or None (not sharded)
+        shards {int} -- Number of shards
+
+    Returns:
+        str -- Journal file (in the destination root)
+    """
+    if shard is None:
+        return JOURNAL_FILE
+    return '.tintranscoder-{:d}of{:d}.journal'.format(shard, shards)
+
+
+class Journal(object):
+    """
+    Append-only journal of the track encodes of a destination root
+
+    Every encode records its start and its commit (with the output's
+    modification time, the encoder settings and the source's times and
+    fingerprint), every run its temp directories. A run interrupted
+    (OOM, reboot, Ctrl-C) leaves starts without commits behind: the next
+    run removes their half moved outputs and the temp files of the dead
+    run. Outputs committed but looking outdated (ambiguous mtimes) are
+    not encoded again as long as neither they, nor their source, nor
+    the encoder settings changed. Records are flushed one by one, the
+    journal is compacted (committed outputs only) when opened.
+
+    Every run holds a shared lock (flock of the journal's lock file,
+    honoured across NFS clients) until it ends. Recovery and compaction
+    need the exclusive lock: while a run of any host is alive, nothing
+    is cleaned up.
+    """
+
+    def __init__(self, root: str, name: str = JOURNAL_FILE) -> None:
+        """
+        Arguments:
+            root {str} -- Destination root directory
+            name {str} -- Journal file (in root)
+        """
+        self.root = root
+        self.name = name
+        self.path = os.path.join(root, name)
+        self.lock = threading.Lock()
+        self.stream = None
+        self.lockstream = None
+        self.run = None
+        self.commits = {}
+
+    def read(self) -> Tuple[List[Dict], List[str]]:
+        """
+        Loads the journal, keeps the commits whose output is untouched since
+
+        A torn last record (crash while appending) is ignored.
+
+        Returns:
+            (List[Dict], List[str]) -- Unfinished runs, Outputs started but not committed
+        """
+        runs = {}
+        started = {}
+        commits = {}
+        try:
+            with open(self.path, encoding='utf8') as stream:
+                for line in stream:
+                    try:
+                        r = json.loads(line)
+                        op = r['op']
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    if op == 'run':
+                        runs[r['run']] = r
+                    elif op == 'end':
+                        runs.pop(r['run'], None)
+                    elif op == 'start':
+                        started[r['file']] = True
+                    elif op == 'commit':
+                        started.pop(r['file'], None)
+                        commits[r['file']] = r
+        except FileNotFoundError:
+            pass
+        self.commits = {}
+        for (f, c) in commits.items():
+            try:
+                if os.path.getmtime(os.path.join(self.root, f)) == c['mtime']:
+                    self.commits[f] = c
+            except OSError:
+                pass
+        return (list(runs.values()), sorted(started.keys()))
+
+    def alive(self, run: Dict) -> bool:
+        """
+        Whether a run's process still exists
+
+        Arguments:
+            run {Dict} -- Run record
+
+        Returns:
+            bool -- True if running on this host (other hosts are checked by the journal's lock)
+        """
+        if run.get('host') != socket.gethostname() or run.get('pid') == os.getpid():
+            return False
+        try:
+            os.kill(run['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except (OSError, KeyError, TypeError):
+            pass
+        return True
+
+    def open(self, tiers: List[str], prefix: str) -> None:
+        """
+        Recovers from interrupted runs, compacts the journal and starts recording
+
+        Arguments:
+            tiers {List[str]} -- Temp directories of this run
+            prefix {str} -- Prefix of this run's temp files
+        """
+        self.lockstream = open(self.path + JOURNAL_LOCK, 'a')
+        try:
+            fcntl.flock(self.lockstream, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            exclusive = True
+        except BlockingIOError:
+            # a run (of any host) is alive
+            exclusive = False
+        (runs, started) = self.read()
+        if exclusive and not any([self.alive(r) for r in runs]):
+            for f in started:
+                # <output>.tmp, or <output>.<lease>.tmp of remote jobs
+                for partial in glob.glob(glob.escape(os.path.join(self.root, f)) + '.*tmp'):
+                    if os.path.isfile(partial):
+                        print("CLEANUP: {}".format(partial))
+                        os.remove(partial)
+            for r in runs:
+                for t in r.get('tiers', []):
+                    try:
+                        names = os.listdir(t)
+                    except OSError:
+                        continue
+                    for n in names:
+                        if r.get('prefix') and n.startswith(r['prefix']):
+                            print("CLEANUP: {}".format(os.path.join(t, n)))
+                            os.remove(os.path.join(t, n))
+            compacted = self.path + '.tmp'
+            with open(compacted, 'w', encoding='utf8') as stream:
+                for f in sorted(self.commits.keys()):
+                    stream.write(json.dumps(self.commits[f], sort_keys=True) + '\n')
+            os.replace(compacted, self.path)
+        # waits for a recovery in progress, shared with the other runs from now on
+        fcntl.flock(self.lockstream, fcntl.LOCK_SH)
+        self.stream = open(self.path, 'a', encoding='utf8')
+        self.run = '{}:{:d}:{:f}'.format(socket.gethostname(), os.getpid(), time.time())
+        self.append({'op': 'run', 'run': self.run, 'host': socket.gethostname(), 'pid': os.getpid(),
+                     'tiers': tiers, 'prefix': prefix})
+
+    def append(self, record: Dict) -> None:
+        """
+        Appends a record
+
+        Arguments:
+            record {Dict} -- Record
+        """
+        with self.lock:
+            self.stream.write(json.dumps(record, sort_keys=True) + '\n')
+            self.stream.flush()
+
+    def start(self, dstfile: str) -> None:
+        """
+        Records the start of an encode
+
+        Arguments:
+            dstfile {str} -- Output file relative to root
+        """
+        self.append({'op': 'start', 'file': dstfile, 'run': self.run})
+
+    def commit(self, dstfile: str, settings: str, times: List[float], fingerprint: str = None) -> None:
+        """
+        Records an output moved into place
+
+        Arguments:
+            dstfile {str} -- Output file relative to root
+            settings {str} -- Encoder settings (see Encoder.settings)
+            times {List[float]} -- Source's modification times (audio, metadata, cover)
+            fingerprint {str} -- Source's fingerprint or None
+        """
+        r = {'op': 'commit', 'file': dstfile, 'mtime': os.path.getmtime(os.path.join(self.root, dstfile)),
+             'settings': settings, 'times': list(times), 'fingerprint': fingerprint}
+        self.append(r)
+        with self.lock:
+            self.commits[dstfile] = r
+
+    def committed(self, dstfile: str, mtime: float, settings: str, times: List[float]) -> bool:
+        """
+        Whether an output is the committed encode of the current source
+
+        Arguments:
+            dstfile {str} -- Output file relative to root
+            mtime {float} -- Output's modification time
+            settings {str} -- Encoder settings (see Encoder.settings)
+            times {List[float]} -- Source's modification times (audio, metadata, cover)
+
+        Returns:
+            bool -- True if neither the output, nor the source, nor the settings changed since committed
+        """
+        c = self.commits.get(dstfile)
+        return c is not None and c['mtime'] == mtime and c['settings'] == settings and c['times'] == list(times)
+
+    def close(self) -> None:
+        """
+        Records the end of the run
+        """
+        if self.stream:
+            self.append({'op': 'end', 'run': self.run})
+            self.stream.close()
+            self.stream = None
+        if self.lockstream:
+            self.lockstream.close()
+            self.lockstream = None
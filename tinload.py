@@ -0,0 +1,185 @@
+import os
+import threading
+
+from typing import Dict
+
+
+PROC = '/proc'
+SAMPLE_INTERVAL = 2.0
+
+# thresholds (fractions of time, PSI percentages)
+CPU_BUSY_HIGH = 0.95
+CPU_BUSY_LOW = 0.75
+CPU_PRESSURE_HIGH = 20.0
+IO_WAIT_HIGH = 0.10
+IO_PRESSURE_HIGH = 10.0
+
+
+class LoadSampler(object):
+    """
+    System load from /proc
+
+    CPU utilisation and iowait are the share of the CPU time since the
+    previous sample, pressure stall information (PSI, if the kernel
+    provides it) is the 10 seconds average.
+    """
+
+    def __init__(self, proc: str = PROC) -> None:
+        """
+        Arguments:
+            proc {str} -- procfs mount point
+        """
+        self.proc = proc
+        self.times = None
+
+    def cputimes(self) -> list:
+        """
+        Aggregated CPU times
+
+        Returns:
+            list -- Jiffies (user, nice, system, idle, iowait, ...)
+        """
+        with open(os.path.join(self.proc, 'stat')) as stream:
+            return [int(x) for x in stream.readline().split()[1:]]
+
+    def loadavg(self) -> float:
+        """
+        1 minute load average
+
+        Returns:
+            float -- Load average
+        """
+        with open(os.path.join(self.proc, 'loadavg')) as stream:
+            return float(stream.read().split()[0])
+
+    def pressure(self, resource: str) -> float:
+        """
+        Share of time some tasks stalled on a resource
+
+        Arguments:
+            resource {str} -- cpu or io
+
+        Returns:
+            float -- Percentage (10 seconds average), None if not available
+        """
+        try:
+            with open(os.path.join(self.proc, 'pressure', resource)) as stream:
+                for line in stream:
+                    fields = line.split()
+                    if fields[0] == 'some':
+                        return float(fields[1].split('=')[1])
+        except (OSError, IndexError, ValueError):
+            pass
+        return None
+
+    def sample(self) -> Dict[str, float]:
+        """
+        Current load
+
+        Returns:
+            Dict[str, float] -- busy, iowait (fractions), load, cpupressure, iopressure
+        """
+        times = self.cputimes()
+        previous = self.times or [0] * len(times)
+        self.times = times
+        delta = [t - p for (t, p) in zip(times, previous)]
+        total = sum(delta) or 1
+        idle = delta[3]
+        iowait = delta[4] if len(delta) > 4 else 0
+        return {
+            'busy': (total - idle - iowait) / total,
+            'iowait': iowait / total,
+            'load': self.loadavg(),
+            'cpupressure': self.pressure('cpu'),
+            'iopressure': self.pressure('io'),
+        }
+
+
+class Controller(object):
+    """
+    Adaptive concurrency of a scheduler
+
+    Periodically samples the system load and moves the scheduler's limit
+    of jobs in flight by one within bounds: shrinks it when CPUs are
+    oversubscribed, grows it when CPUs idle or jobs stall on I/O (more
+    jobs in flight hide the latency).
+    """
+
+    def __init__(self, scheduler, low: int, high: int, cpus: int, interval: float = SAMPLE_INTERVAL,
+                 sampler: LoadSampler = None) -> None:
+        """
+        Arguments:
+            scheduler {Scheduler} -- Scheduler to control
+            low {int} -- Minimum jobs in flight
+            high {int} -- Maximum jobs in flight
+            cpus {int} -- Usable CPUs
+            interval {float} -- Seconds between samples
+            sampler {LoadSampler} -- Load source
+        """
+        self.scheduler = scheduler
+        self.low = low
+        self.high = high
+        self.cpus = cpus
+        self.interval = interval
+        self.sampler = sampler or LoadSampler()
+        self.limit = max(low, min(high, cpus))
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def decide(self, sample: Dict[str, float]) -> int:
+        """
+        Next limit of jobs in flight
+
+        Arguments:
+            sample {Dict[str, float]} -- Load (see LoadSampler.sample)
+
+        Returns:
+            int -- Limit
+        """
+        cpupressure = sample['cpupressure'] or 0.0
+        iopressure = sample['iopressure'] or 0.0
+        oversubscribed = cpupressure > CPU_PRESSURE_HIGH or \
+            (sample['busy'] > CPU_BUSY_HIGH and sample['load'] > 1.5 * self.cpus)
+        iobound = sample['iowait'] > IO_WAIT_HIGH or iopressure > IO_PRESSURE_HIGH
+        limit = self.limit
+        if oversubscribed:
+            limit -= 1
+        elif sample['busy'] < CPU_BUSY_LOW or (iobound and sample['busy'] < CPU_BUSY_HIGH):
+            limit += 1
+        return max(self.low, min(self.high, limit))
+
+    def start(self) -> None:
+        """
+        Applies the initial limit and starts sampling
+        """
+        self.scheduler.setlimit(self.limit)
+        try:
+            self.sampler.sample()
+        except OSError:
+            # no procfs, static limit
+            return
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self) -> None:
+        """
+        Thread worker sampling the load
+        """
+        while not self.stopped.wait(self.interval):
+            try:
+                limit = self.decide(self.sampler.sample())
+            except OSError:
+                continue
+            if limit != self.limit:
+                self.limit = limit
+                self.scheduler.setlimit(limit)
+
+    def stop(self) -> None:
+        """
+        Stops sampling
+        """
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,582 @@
+import collections
+import heapq
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+from typing import Callable, Dict, Tuple
+
+from tinaudio.album import AlbumSet
+from tinaudio.encoder import Encoder
+from tinaudio.utilities import surveyor
+from tinjob import covers, CoverJob, EncodeJob, UpdateJob
+from tinstats import stats
+
+
+# seconds
+LEASE_TIME = 60.0
+WAIT_TIME = 1.0
+CONNECT_TIMEOUT = 30.0
+
+# a job is given up after being leased to this many workers which died
+MAX_ATTEMPTS = 3
+# surveyed album directories a worker keeps
+ALBUM_CACHE = 32
+
+
+def endpoint(address: str) -> Tuple[int, object]:
+    """
+    Parses a coordinator address
+
+    Arguments:
+        address {str} -- unix:PATH or [HOST]:PORT
+
+    Raises:
+        Exception: When malformed
+
+    Returns:
+        (int, object) -- Address family, Socket address
+    """
+    if address.startswith('unix:') and len(address) > 5:
+        return (socket.AF_UNIX, address[5:])
+    (host, sep, port) = address.rpartition(':')
+    if not sep or not port.isdigit():
+        raise Exception("Invalid address: " + address)
+    return (socket.AF_INET, (host, int(port)))
+
+
+def surveydir(albumset: AlbumSet) -> str:
+    """
+    Directory to survey for an album set (CUE images are keyed by their file)
+
+    Arguments:
+        albumset {AlbumSet} -- Album set
+
+    Returns:
+        str -- Directory relative to the album collection's root
+    """
+    key = albumset.getkey()
+    if os.path.isdir(os.path.join(albumset.getroot(), key)):
+        return key
+    return os.path.dirname(key)
+
+
+def describe(job) -> Dict:
+    """
+    Description of a job a worker can rebuild it from (see Worker.rebuild)
+
+    Arguments:
+        job {GenericJob} -- Cover, encode or update job
+
+    Raises:
+        Exception: When the job can't run remotely
+
+    Returns:
+        Dict -- Description
+    """
+    a = job.albumset
+    d = {'root': a.getroot(), 'dir': surveydir(a), 'key': a.getkey(), 'coversize': covers.maxsize}
+    if isinstance(job, CoverJob):
+        d.update({'type': 'cover', 'dstroot': job.dstroot})
+    elif isinstance(job, EncodeJob):
+        d.update({'type': 'encode', 'disc': job.discnumber, 'track': job.tracknumber, 'stream': job.stream,
+                  'fingerprint': job.fingerprint,
+                  'targets': [[r, f, e.codec, e.downmix, e.mix] for (r, f, e) in job.targets]})
+    elif isinstance(job, UpdateJob):
+        e = job.encoder
+        d.update({'type': 'update', 'disc': job.discnumber, 'track': job.tracknumber, 'retag': job.retag,
+                  'recover': job.recover, 'fingerprint': job.fingerprint,
+                  'targets': [[job.dstroot, job.dstfile, e.codec, e.downmix, e.mix]]})
+    else:
+        raise Exception("Job can't run remotely: " + type(job).__name__)
+    return d
+
+
+def send(conn: socket.socket, lock: threading.Lock, message: Dict) -> None:
+    """
+    Sends a message (a JSON line)
+
+    Arguments:
+        conn {socket.socket} -- Connection
+        lock {threading.Lock} -- Lock of the connection's writers
+        message {Dict} -- Message
+    """
+    data = (json.dumps(message, sort_keys=True) + '\n').encode('utf8')
+    with lock:
+        conn.sendall(data)
+
+
+class Coordinator(object):
+    """
+    Serves jobs to workers (possibly on other hosts sharing the file systems)
+
+    Workers connect over TCP or a Unix socket and talk JSON lines: they
+    pull a job, renew its lease while running it and report it done.
+    Jobs are handed out longest (most costly) first, covers before
+    tracks. The jobs of a worker which disconnects, or whose lease
+    expires, are queued again (up to MAX_ATTEMPTS). A stalled worker may
+    still finish its job, every lease moves its outputs into place
+    through its own temp file. Workers are told to quit once every job
+    is done.
+    """
+
+    def __init__(self, address: str, lease: float = LEASE_TIME, describe: Callable = describe) -> None:
+        """
+        Arguments:
+            address {str} -- unix:PATH or [HOST]:PORT to listen on
+            lease {float} -- Seconds a worker may run a job without renewing its lease
+            describe {Callable} -- Job description (see describe)
+        """
+        self.address = address
+        self.lease = lease
+        self.describe = describe
+        self.cond = threading.Condition()
+        self.sequence = itertools.count()
+        self.queue = []
+        self.jobs = {}
+        self.descs = {}
+        self.costs = {}
+        self.leases = {}
+        self.attempts = {}
+        self.remaining = 0
+        self.listener = None
+        self.connections = itertools.count()
+
+    def submit(self, job) -> None:
+        """
+        Adds a job
+
+        Arguments:
+            job {GenericJob} -- Job
+        """
+        with self.cond:
+            i = next(self.sequence)
+            self.jobs[i] = job
+            self.descs[i] = self.describe(job)
+            self.costs[i] = job.cost()
+            self.attempts[i] = 0
+            self.remaining += 1
+            heapq.heappush(self.queue, (-self.costs[i], i))
+            self.cond.notify_all()
+
+    def listen(self) -> None:
+        """
+        Opens the listening socket
+        """
+        (family, address) = endpoint(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(64)
+
+    def serve(self) -> None:
+        """
+        Serves the jobs until all of them are done
+        """
+        t = threading.Thread(target=self.accept)
+        t.daemon = True
+        t.start()
+        with self.cond:
+            while self.remaining > 0:
+                self.expire(time.monotonic())
+                self.cond.wait(min(WAIT_TIME, self.lease))
+
+    def accept(self) -> None:
+        """
+        Thread worker accepting workers' connections
+        """
+        while True:
+            try:
+                (conn, peer) = self.listener.accept()
+            except OSError:
+                return
+            t = threading.Thread(target=self.handle, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    def handle(self, conn: socket.socket) -> None:
+        """
+        Thread worker talking to a worker
+
+        Arguments:
+            conn {socket.socket} -- Connection
+        """
+        lock = threading.Lock()
+        token = '#{:d}'.format(next(self.connections))
+        try:
+            for line in conn.makefile('r', encoding='utf8'):
+                message = json.loads(line)
+                op = message.get('op')
+                if op == 'hello':
+                    token = '{}#{}'.format(message.get('worker'), token.split('#')[-1])
+                elif op == 'pull':
+                    send(conn, lock, self.pull(token))
+                elif op == 'renew':
+                    self.renew(message['id'], token)
+                elif op == 'done':
+                    self.complete(message['id'], message.get('ok', False), message.get('seconds', 0.0))
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            self.abandon(token)
+            conn.close()
+
+    def pull(self, token: str) -> Dict:
+        """
+        Leases the next job to a worker
+
+        Arguments:
+            token {str} -- Worker's connection
+
+        Returns:
+            Dict -- Job, wait or done message
+        """
+        with self.cond:
+            while self.queue:
+                (cost, i) = heapq.heappop(self.queue)
+                if i not in self.jobs or i in self.leases:
+                    continue
+                self.leases[i] = (token, time.monotonic() + self.lease)
+                self.attempts[i] += 1
+                job = self.jobs[i]
+                job.announce(False)
+                if isinstance(job, EncodeJob):
+                    job.journalstart()
+                # a worker whose lease expired may still be moving its outputs
+                desc = dict(self.descs[i], tmpsuffix='.{:d}-{:d}.tmp'.format(i, self.attempts[i]))
+                return {'op': 'job', 'id': i, 'job': desc, 'lease': self.lease}
+            if self.remaining == 0:
+                return {'op': 'done'}
+            return {'op': 'wait', 'seconds': WAIT_TIME}
+
+    def renew(self, i: int, token: str) -> None:
+        """
+        Extends a worker's lease of a job
+
+        Arguments:
+            i {int} -- Job
+            token {str} -- Worker's connection
+        """
+        with self.cond:
+            if i in self.leases and self.leases[i][0] == token:
+                self.leases[i] = (token, time.monotonic() + self.lease)
+
+    def complete(self, i: int, ok: bool, seconds: float) -> None:
+        """
+        Takes a job's result (the first one if it ran several times)
+
+        Arguments:
+            i {int} -- Job
+            ok {bool} -- Succeeded
+            seconds {float} -- Wall time on the worker
+        """
+        with self.cond:
+            job = self.jobs.pop(i, None)
+            if job is None:
+                return
+            self.leases.pop(i, None)
+            self.remaining -= 1
+            self.finish(job, ok, seconds)
+            self.cond.notify_all()
+
+    def finish(self, job, ok: bool, seconds: float) -> None:
+        """
+        Logs a job's result (called with the lock held)
+
+        Arguments:
+            job {GenericJob} -- Job
+            ok {bool} -- Succeeded
+            seconds {float} -- Wall time on the worker
+        """
+        if not ok:
+            job.announce(True)
+            return
+        stats.record('remote', seconds, getattr(job, 'key', None))
+        if isinstance(job, EncodeJob):
+            for (dstroot, dstfile, encoder) in job.targets:
+                try:
+                    job.journalcommit(dstroot, dstfile, encoder)
+                except OSError:
+                    pass
+
+    def requeue(self, i: int) -> None:
+        """
+        Queues a job again whose worker is gone (called with the lock held)
+
+        Arguments:
+            i {int} -- Job
+        """
+        del self.leases[i]
+        if self.attempts[i] < MAX_ATTEMPTS:
+            heapq.heappush(self.queue, (-self.costs[i], i))
+        else:
+            job = self.jobs.pop(i)
+            self.remaining -= 1
+            self.finish(job, False, 0.0)
+        self.cond.notify_all()
+
+    def abandon(self, token: str) -> None:
+        """
+        Queues the jobs of a disconnected worker again
+
+        Arguments:
+            token {str} -- Worker's connection
+        """
+        with self.cond:
+            for (i, (t, deadline)) in list(self.leases.items()):
+                if t == token:
+                    self.requeue(i)
+
+    def expire(self, now: float) -> None:
+        """
+        Queues the jobs with expired leases again (called with the lock held)
+
+        Arguments:
+            now {float} -- Time (monotonic)
+        """
+        for (i, (t, deadline)) in list(self.leases.items()):
+            if deadline < now:
+                self.requeue(i)
+
+    def close(self) -> None:
+        """
+        Stops listening
+        """
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+            (family, address) = endpoint(self.address)
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.remove(address)
+
+
+class Worker(object):
+    """
+    Runs the jobs of a coordinator
+
+    Album sets are surveyed again from the shared source tree (cached
+    per album directory), jobs run in full (decode, encode, tag, move)
+    while their lease is renewed in the background.
+    """
+
+    def __init__(self, address: str, name: str = None, run: Callable = None) -> None:
+        """
+        Arguments:
+            address {str} -- Coordinator's unix:PATH or [HOST]:PORT
+            name {str} -- Worker's name (default: host:pid)
+            run {Callable} -- Runs a job description, returns True if succeeded (default: Worker.run)
+        """
+        self.address = address
+        self.name = name or '{}:{:d}'.format(socket.gethostname(), os.getpid())
+        self.execute = run or self.run
+        self.albums = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def connect(self) -> socket.socket:
+        """
+        Connects to the coordinator, waits until it listens
+
+        Raises:
+            OSError: When the coordinator is not reachable in CONNECT_TIMEOUT
+
+        Returns:
+            socket.socket -- Connection
+        """
+        (family, address) = endpoint(self.address)
+        if family != socket.AF_UNIX:
+            address = (address[0] or 'localhost', address[1])
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            conn = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                conn.connect(address)
+                return conn
+            except OSError:
+                conn.close()
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(WAIT_TIME)
+
+    def albumset(self, root: str, directory: str, key: str) -> AlbumSet:
+        """
+        Album set surveyed from the shared source tree
+
+        Arguments:
+            root {str} -- Album collection's root
+            directory {str} -- Directory to survey (relative to root)
+            key {str} -- Album key
+
+        Raises:
+            Exception: When the album is gone
+
+        Returns:
+            AlbumSet -- Album set
+        """
+        with self.lock:
+            albums = self.albums.get((root, directory))
+            if albums is not None:
+                self.albums.move_to_end((root, directory))
+        if albums is None:
+            albums = {}
+            surveyor(albums, root, None, 1, [directory])
+            for a in albums.values():
+                a.load()
+            with self.lock:
+                self.albums[(root, directory)] = albums
+                while len(self.albums) > ALBUM_CACHE:
+                    self.albums.popitem(last=False)
+        if key not in albums:
+            raise Exception("Album not found: " + os.path.join(root, key))
+        return albums[key]
+
+    def rebuild(self, desc: Dict):
+        """
+        Job from its description (see describe)
+
+        Arguments:
+            desc {Dict} -- Description
+
+        Returns:
+            GenericJob -- Job
+        """
+        covers.maxsize = desc.get('coversize')
+        albumset = self.albumset(desc['root'], desc['dir'], desc['key'])
+        if desc['type'] == 'cover':
+            job = CoverJob(albumset, desc['dstroot'])
+            job.tmpsuffix = desc.get('tmpsuffix', job.tmpsuffix)
+            return job
+        encoders = []
+        for (dstroot, dstfile, codec, downmix, mix) in desc['targets']:
+            encoder = Encoder(codec, downmix)
+            encoder.mix = mix
+            encoders.append((dstroot, dstfile, encoder))
+        if desc['type'] == 'update':
+            (dstroot, dstfile, encoder) = encoders[0]
+            job = UpdateJob(albumset, desc['disc'], desc['track'], dstroot, dstfile, encoder,
+                            desc['retag'], desc['recover'])
+        else:
+            (dstroot, dstfile, encoder) = encoders[0]
+            job = EncodeJob(albumset, desc['disc'], desc['track'], dstroot, dstfile, encoder)
+            for (dstroot, dstfile, encoder) in encoders[1:]:
+                job.addtarget(dstroot, dstfile, encoder)
+            job.stream = desc['stream']
+        job.fingerprint = desc['fingerprint']
+        job.tmpsuffix = desc.get('tmpsuffix', job.tmpsuffix)
+        return job
+
+    def run(self, desc: Dict) -> bool:
+        """
+        Runs a job description
+
+        Arguments:
+            desc {Dict} -- Description
+
+        Returns:
+            bool -- True if succeeded
+        """
+        job = None
+        try:
+            job = self.rebuild(desc)
+            job.doit()
+            return True
+        except Exception:
+            traceback.print_exc()
+            if job:
+                job.announce(True)
+            return False
+
+    def heartbeat(self, conn: socket.socket, lock: threading.Lock, i: int, lease: float,
+                  done: threading.Event) -> None:
+        """
+        Thread worker renewing a job's lease
+
+        Arguments:
+            conn {socket.socket} -- Connection
+            lock {threading.Lock} -- Lock of the connection's writers
+            i {int} -- Job
+            lease {float} -- Lease time
+            done {threading.Event} -- Set once the job is done
+        """
+        while not done.wait(lease / 3):
+            try:
+                send(conn, lock, {'op': 'renew', 'id': i})
+            except OSError:
+                return
+
+    def work(self) -> int:
+        """
+        Pulls and runs jobs until the coordinator is done (or gone)
+
+        Returns:
+            int -- Jobs run
+        """
+        conn = self.connect()
+        lock = threading.Lock()
+        count = 0
+        try:
+            reader = conn.makefile('r', encoding='utf8')
+            send(conn, lock, {'op': 'hello', 'worker': self.name})
+            while True:
+                send(conn, lock, {'op': 'pull'})
+                line = reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message['op'] == 'done':
+                    break
+                if message['op'] == 'wait':
+                    time.sleep(message['seconds'])
+                    continue
+                done = threading.Event()
+                t = threading.Thread(target=self.heartbeat, args=(conn, lock, message['id'], message['lease'], done))
+                t.daemon = True
+                t.start()
+                started = time.perf_counter()
+                try:
+                    ok = self.execute(message['job'])
+                finally:
+                    done.set()
+                    t.join()
+                send(conn, lock, {'op': 'done', 'id': message['id'], 'ok': ok,
+                                  'seconds': time.perf_counter() - started})
+                count += 1
+        except (OSError, ValueError):
+            pass
+        finally:
+            conn.close()
+        return count
+
+
+def work(address: str, count: int) -> int:
+    """
+    Runs workers (one connection each) until the coordinator is done
+
+    Arguments:
+        address {str} -- Coordinator's unix:PATH or [HOST]:PORT
+        count {int} -- Parallel workers
+
+    Returns:
+        int -- Jobs run
+    """
+    worker = Worker(address)
+    results = []
+
+    def run() -> None:
+        try:
+            results.append(worker.work())
+        except OSError as e:
+            print("Coordinator not reachable: {} ({})".format(address, e))
+    threads = [threading.Thread(target=run) for i in range(0, count)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(results)
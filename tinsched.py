@@ -0,0 +1,258 @@
+import collections
+import heapq
+import itertools
+import threading
+
+from typing import Dict, List
+
+
+class Scheduler(object):
+    """
+    Dependency-aware pipelined job scheduler
+
+    Jobs are made of stages (eg. decode, encode, tag+commit), each stage
+    has its own pool of worker threads. A job enters the pool of its
+    first stage as soon as all the jobs it depends on are done (eg.
+    tracks wait for their own album's cover only), runnable jobs are
+    picked longest (most costly) first, so the end of a run is packed
+    tightly. Between stages jobs are handed over through bounded queues:
+    a stage running ahead blocks until the next one catches up, which
+    limits eg. the decoded temp files waiting for an encoder. Failed
+    jobs are reported and still release their dependents. The number of
+    jobs in flight (started but not done) may be limited further below
+    the pools' size, eg. by an adaptive controller.
+    """
+
+    def __init__(self, workers: Dict[str, int], bound: int = None) -> None:
+        """
+        Arguments:
+            workers {Dict[str, int]} -- Number of worker threads per stage
+            bound {int} -- Jobs waiting between stages or None (next stage's workers)
+        """
+        self.workers = workers
+        self.bounds = {}
+        for (stage, count) in workers.items():
+            self.bounds[stage] = bound or count
+        self.threads = []
+        self.ready = {}
+        self.handoff = {}
+        for stage in workers.keys():
+            self.ready[stage] = []
+            self.handoff[stage] = collections.deque()
+        self.costs = {}
+        self.plans = {}
+        self.sequence = itertools.count()
+        self.waiting = {}
+        self.dependents = {}
+        self.done = set()
+        self.pending = 0
+        self.limit = None
+        self.inflight = 0
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.announcelock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Starts the worker threads
+        """
+        for (stage, count) in self.workers.items():
+            for i in range(0, count):
+                t = threading.Thread(target=self.worker, args=(stage,))
+                t.daemon = True
+                t.start()
+                self.threads.append(t)
+
+    def setlimit(self, limit: int) -> None:
+        """
+        Limits the number of jobs in flight
+
+        Arguments:
+            limit {int} -- Jobs started but not done or None (pools' size)
+        """
+        with self.cond:
+            self.limit = limit
+            self.cond.notify_all()
+
+    def submit(self, job, deps: List = ()) -> None:
+        """
+        Adds a job
+
+        Arguments:
+            job {GenericJob} -- Job
+            deps {List[GenericJob]} -- Jobs to finish beforehand
+
+        Raises:
+            Exception: When the job has a stage without workers
+        """
+        cost = job.cost()
+        stages = job.stages()
+        for stage in stages:
+            if stage not in self.workers:
+                raise Exception("No workers for stage: " + stage)
+        with self.cond:
+            self.costs[job] = cost
+            self.plans[job] = (stages, 0)
+            self.pending += 1
+            count = 0
+            for d in deps:
+                if d not in self.done:
+                    self.dependents.setdefault(d, []).append(job)
+                    count += 1
+            if count > 0:
+                self.waiting[job] = count
+            else:
+                self.push(job)
+
+    def push(self, job) -> None:
+        """
+        Queues a runnable job for its first stage (called with the lock held)
+
+        The stages are taken again, those of a job may depend on the jobs
+        it waited for (eg. tracks cut by a SplitJob skip decoding).
+
+        Arguments:
+            job {GenericJob} -- Job
+        """
+        self.plans[job] = (job.stages(), 0)
+        stage = self.plans[job][0][0]
+        heapq.heappush(self.ready[stage], (-self.costs.pop(job), next(self.sequence), job))
+        self.cond.notify_all()
+
+    def pop(self, stage: str):
+        """
+        Next job of a stage (called with the lock held)
+
+        Jobs handed over by the previous stage go first, they hold
+        resources (eg. temp files) already.
+
+        Arguments:
+            stage {str} -- Stage
+
+        Returns:
+            GenericJob -- Job or None
+        """
+        if self.handoff[stage]:
+            job = self.handoff[stage].popleft()
+            # room for the previous stage
+            self.cond.notify_all()
+            return job
+        if self.ready[stage] and (self.limit is None or self.inflight < self.limit):
+            self.inflight += 1
+            return heapq.heappop(self.ready[stage])[2]
+        return None
+
+    def advance(self, job) -> bool:
+        """
+        Hands a job over to its next stage, blocks while that stage is full
+
+        Arguments:
+            job {GenericJob} -- Job
+
+        Returns:
+            bool -- False if the job has no further stages
+        """
+        with self.cond:
+            (stages, position) = self.plans[job]
+            position += 1
+            if position >= len(stages):
+                return False
+            stage = stages[position]
+            while len(self.handoff[stage]) >= self.bounds[stage] and not self.stopped:
+                self.cond.wait()
+            self.plans[job] = (stages, position)
+            self.handoff[stage].append(job)
+            self.cond.notify_all()
+            return True
+
+    def finish(self, job) -> None:
+        """
+        Marks a job done and releases its dependents
+
+        Arguments:
+            job {GenericJob} -- Job
+        """
+        with self.cond:
+            del self.plans[job]
+            self.done.add(job)
+            for d in self.dependents.pop(job, []):
+                self.waiting[d] -= 1
+                if self.waiting[d] == 0:
+                    del self.waiting[d]
+                    self.push(d)
+            self.pending -= 1
+            self.inflight -= 1
+            self.cond.notify_all()
+
+    def run(self, job, stage: str) -> bool:
+        """
+        Runs a stage of a job
+
+        Arguments:
+            job {GenericJob} -- Job
+            stage {str} -- Stage
+
+        Returns:
+            bool -- True if succeeded
+        """
+        if self.plans[job][1] == 0:
+            with self.announcelock:
+                job.announce(False)
+        try:
+            job.runstage(stage)
+        except Exception:
+            with self.announcelock:
+                job.announce(True)
+            try:
+                job.cleanup()
+            except Exception:
+                pass
+            return False
+        return True
+
+    def worker(self, stage: str) -> None:
+        """
+        Thread worker to process the jobs of a stage
+
+        Arguments:
+            stage {str} -- Stage
+        """
+        while True:
+            with self.cond:
+                job = None
+                while not self.stopped:
+                    job = self.pop(stage)
+                    if job is not None:
+                        break
+                    self.cond.wait()
+                if self.stopped:
+                    return
+            if not self.run(job, stage) or not self.advance(job):
+                self.finish(job)
+
+    def join(self) -> None:
+        """
+        Waits until all submitted jobs are done
+        """
+        with self.cond:
+            while self.pending > 0:
+                self.cond.wait()
+
+    def forget(self) -> None:
+        """
+        Drops the done jobs (no job submitted later may depend on them),
+        eg. between the batches of a long running scheduler
+        """
+        with self.cond:
+            self.done = set()
+
+    def stop(self) -> None:
+        """
+        Stops the worker threads (after their current job)
+        """
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        for t in self.threads:
+            t.join()
+        self.threads = []
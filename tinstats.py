@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+
+from typing import Dict, List
+
+
+# albums listed in the report
+SLOWEST_ALBUMS = 10
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(values: List[float], p: int) -> float:
+    """
+    Nearest-rank percentile
+
+    Arguments:
+        values {List[float]} -- Sorted values
+        p {int} -- Percentile
+
+    Returns:
+        float -- Value
+    """
+    if not values:
+        return 0.0
+    rank = max(1, -(-p * len(values) // 100))
+    return values[rank - 1]
+
+
+class Stats(object):
+    """
+    Run statistics shared by all jobs
+
+    Stages (scan, load, decode, downmix, encode, tag, move, ...) record
+    their wall time per album, encoders their audio seconds per codec.
+    Bytes read are source bytes decoded, bytes written final outputs
+    (moved into place or covers), temp files are not counted.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Drops everything recorded, restarts the run's clock
+        """
+        with self.lock:
+            self.started = time.perf_counter()
+            self.stages = {}
+            self.albums = {}
+            self.codecs = {}
+            self.read = 0
+            self.written = 0
+            self.failed = 0
+
+    def record(self, stage: str, seconds: float, key: str = None, codec: str = None, audio: float = 0.0,
+               read: int = 0, written: int = 0) -> None:
+        """
+        Records a timed stage
+
+        Arguments:
+            stage {str} -- Stage
+            seconds {float} -- Wall time
+            key {str} -- Album key or None
+            codec {str} -- Output codec (encoders) or None
+            audio {float} -- Seconds of audio processed (encoders)
+            read {int} -- Bytes read
+            written {int} -- Bytes written
+        """
+        with self.lock:
+            self.stages.setdefault(stage, []).append(seconds)
+            if key:
+                self.albums[key] = self.albums.get(key, 0.0) + seconds
+            if codec:
+                (a, w) = self.codecs.get(codec, (0.0, 0.0))
+                self.codecs[codec] = (a + audio, w + seconds)
+            self.read += read
+            self.written += written
+
+    def fail(self) -> None:
+        """
+        Counts a failed output
+        """
+        with self.lock:
+            self.failed += 1
+
+    def report(self) -> Dict:
+        """
+        Summary of the run
+
+        Returns:
+            Dict -- Wall time, per stage totals and percentiles, per codec
+                    throughput (audio seconds per wall second), bytes, slowest albums
+        """
+        with self.lock:
+            stages = {}
+            for (stage, seconds) in self.stages.items():
+                values = sorted(seconds)
+                s = {'count': len(values), 'total': sum(values), 'max': values[-1]}
+                for p in PERCENTILES:
+                    s['p{:d}'.format(p)] = percentile(values, p)
+                stages[stage] = s
+            codecs = {}
+            for (codec, (audio, wall)) in self.codecs.items():
+                codecs[codec] = {'audio': audio, 'wall': wall, 'speed': audio / wall if wall > 0 else 0.0}
+            albums = sorted(self.albums.items(), key=lambda a: (-a[1], a[0]))[0:SLOWEST_ALBUMS]
+            return {
+                'wall': time.perf_counter() - self.started,
+                'stages': stages,
+                'codecs': codecs,
+                'bytes': {'read': self.read, 'written': self.written},
+                'failed': self.failed,
+                'slowest': [{'album': k, 'seconds': v} for (k, v) in albums],
+            }
+
+    def dump(self, f: str) -> None:
+        """
+        Writes the summary as JSON
+
+        Arguments:
+            f {str} -- Report file
+        """
+        with open(f, 'w', encoding='utf8') as stream:
+            json.dump(self.report(), stream, indent=2, sort_keys=True)
+            stream.write('\n')
+
+
+def throughput(f: str) -> Dict[str, float]:
+    """
+    Measured encoder speeds of a previous run
+
+    Arguments:
+        f {str} -- Report file (see Stats.dump)
+
+    Returns:
+        Dict[str, float] -- Audio seconds per wall second per codec
+    """
+    with open(f, encoding='utf8') as stream:
+        report = json.load(stream)
+    speeds = {}
+    for (codec, c) in report.get('codecs', {}).items():
+        if c.get('speed', 0.0) > 0:
+            speeds[codec] = c['speed']
+    return speeds
+
+
+# statistics of the run (shared by all jobs)
+stats = Stats()
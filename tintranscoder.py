@@ -7,116 +7,351 @@
 # License: MIT
 #
 
+import json
 import os
 import sys
-import subprocess
+import time
 import optparse  # change to argsparse
-import queue
-import threading
-import multiprocessing  # parallel
 
-from typing import List
+from typing import Dict, List, Tuple
 
+from tinaudio.album import AlbumSet
 from tinaudio.encoder import Encoder
-from tinaudio.cache import ICache
+from tinaudio.cache import ICache, SCAN_WORKERS
+from tinaudio.pcm import DOWNMIX_CENTER, DOWNMIX_SURROUND, DOWNMIX_LFE
 from tinaudio.utilities import surveyor
 
-from tinutils import checkdir, jobsetup
+from tinjob import covers, tmpstore, journals, CoverJob, STAGE_DECODE, STAGE_ENCODE, STAGE_COMMIT
+from tinjournal import Journal, journalname, JOURNAL_PATTERN
+from tinutils import checkdir, cpucount, tempdirs, topdirs, allscope, keyscope, shardspec, shardscope, prunedirs
+from tinutils import jobsetup, jobmerge, jobdeps, jobsplit, jobplan
+from tinsched import Scheduler
+from tinasync import AsyncScheduler
+from tinload import Controller
+from tinstats import stats, throughput
+from tinwatch import watcher, Debouncer, SETTLE_TIME
+from tinnet import Coordinator, endpoint, work, LEASE_TIME
 
 
 DESCRIPTION = "tintranscoder"
 VERSION = "0.1"
+TMPDIR_ENV = 'TINTRANSCODER_TMPDIR'
+# seconds between checks while nothing changes (watch mode)
+WATCH_IDLE = 3600.0
+ENGINES = ['threads', 'async']
 
 # TODO: calculate disc-ids
-# TODO: TMPFS from ENV
 # TODO: failed logging w/ exception trace
 
-# GLOBAL
-encodeq = queue.Queue()
-mylock = threading.Lock()
 
-
-def encodeworker() -> None:
-    """
-    Thread worker to process job queues
+def survey(options, trees: Dict[str, List[str]]) -> Dict[str, AlbumSet]:
     """
-    while not encodeq.empty():
-        j = encodeq.get()
-        with mylock:
-            j.announce(False)
-        try:
-            j.doit()
-        except Exception:
-            with mylock:
-                j.announce(True)
-        encodeq.task_done()
-
-
-def perform(codec: str, options, *args: List[str]) -> None:
-    """
-    Busines logic for the transcoding
+    Surveys and loads the source albums (of the shard only)
 
     Arguments:
-        codec {str} -- Output codec
         options {Object} -- OptParse' options
-    """
-
-    downmix = not (options.downmix is None)
-    copycover = not (options.copycover is None)
-    if codec == 'flac':
-        dstdir = options.flac
-    if codec == 'opus':
-        dstdir = options.opus
-    if codec == 'aac':
-        dstdir = options.aac
-    if codec == 'mp3':
-        dstdir = options.mp3
-        downmix = True
-
-    dstcache = ICache(dstdir)
+        trees {Dict[str, List[str]]} -- Subtrees ('' for all) to survey per source root
 
+    Returns:
+        Dict[str, AlbumSet] -- Album sets
+    """
     albums = {}
-    for stree in args:
-        surveyor(albums, stree)
+    for stree in sorted(trees.keys()):
+        t = time.perf_counter()
+        surveyor(albums, stree, options.index, options.scanthreads, topdirs(trees[stree]))
+        stats.record('scan', time.perf_counter() - t)
+
+    # other shards' albums are left alone
+    if options.shard:
+        inshard = shardscope(*shardspec(options.shard))
+        albums = dict([(k, a) for (k, a) in albums.items() if inshard(k)])
 
     # init albums
     keys = sorted(list(albums.keys()))
     for k in keys:
+        t = time.perf_counter()
         albums[k].load()
+        stats.record('load', time.perf_counter() - t, k)
         # albums[k].dump()
+    return albums
+
+
+def setup(codecs: List[str], options, albums: Dict[str, AlbumSet],
+          dirs: List[str] = ('',)) -> Tuple[List[str], List[CoverJob], List]:
+    """
+    Plans every destination, deletes what is not needed any more
+
+    Arguments:
+        codecs {List[str]} -- Output codecs
+        options {Object} -- OptParse' options
+        albums {Dict[str, AlbumSet]} -- Album sets
+        dirs {List[str]} -- Album directories to plan ('' for all)
+
+    Returns:
+        (List[str], List[CoverJob], List[GenericJob]) -- Files to unlink (plan mode) or deleted,
+            Covers to replicate, Tracks to encode or update
+    """
+    copycover = not (options.copycover is None)
+    fingerprint = not (options.fingerprint is None)
+    mix = {'center': options.mixcenter, 'surround': options.mixsurround, 'lfe': options.mixlfe}
+    plan = not (options.plan is None)
+    journal = not (options.journal is None)
+    dirs = topdirs(dirs)
+    scopes = []
+    if dirs != ['']:
+        scopes.append(keyscope(dirs))
+    shard = (None, None)
+    if options.shard:
+        shard = shardspec(options.shard)
+        scopes.append(shardscope(*shard))
+    scope = None
+    if scopes:
+        scope = allscope(scopes)
 
     # get hands dirty
-    encoder = Encoder(codec, downmix)
-    (unlink, coverjobs, encodejobs) = jobsetup(albums, dstcache, encoder, copycover)
-
-    # delete unnecessary files
-    for u in unlink:
-        print("UNLINK: {}".format(u))
-        os.remove(os.path.join(dstcache.getroot(), u))
-    # hack
-    subprocess.call(["find", dstcache.getroot(), "-xdev", "-depth", "-mindepth", "1",
-                     "-type", "d", "-empty", "-exec", "rmdir", "-v", "{}", ";"])
-    # cover queue
+    unlinks = []
+    coverjobs = []
+    encodejobs = []
+    for codec in codecs:
+        downmix = not (options.downmix is None)
+        if codec == 'flac':
+            dstdir = options.flac
+        if codec == 'opus':
+            dstdir = options.opus
+        if codec == 'aac':
+            dstdir = options.aac
+        if codec == 'mp3':
+            dstdir = options.mp3
+            downmix = True
+
+        # recover from an interrupted run before scanning
+        dstjournal = journals.get(dstdir)
+        if journal and dstjournal is None:
+            dstjournal = Journal(dstdir, journalname(*shard))
+            if plan:
+                dstjournal.read()
+            else:
+                dstjournal.open(tmpstore.tiers, tmpstore.prefix)
+                journals[dstdir] = dstjournal
+
+        t = time.perf_counter()
+        dstcache = ICache(dstdir, options.index, options.scanthreads, [JOURNAL_PATTERN], dirs)
+        stats.record('scan', time.perf_counter() - t)
+        t = time.perf_counter()
+        encoder = Encoder(codec, downmix)
+        encoder.mix = mix
+        (unlink, cvrjobs, encjobs) = jobsetup(albums, dstcache, encoder, copycover, fingerprint, dstjournal, scope)
+        stats.record('plan', time.perf_counter() - t)
+        unlinks.extend([os.path.join(dstcache.getroot(), u) for u in unlink])
+        coverjobs.extend(cvrjobs)
+        encodejobs.extend(encjobs)
+        if plan:
+            continue
+
+        # delete unnecessary files
+        for u in unlink:
+            print("UNLINK: {}".format(u))
+            os.remove(os.path.join(dstcache.getroot(), u))
+        if options.shard:
+            # directories shared with other shards (eg. artists) are theirs too
+            emptied = set([os.path.dirname(u) for u in unlink]) - set([''])
+            prunedirs(dstcache.getroot(), sorted(emptied), False)
+        else:
+            prunedirs(dstcache.getroot(), dirs)
+    return (unlinks, coverjobs, encodejobs)
+
+
+def pools(options) -> Tuple[Dict[str, int], int, int]:
+    """
+    Worker threads of the pipeline stages
+
+    Arguments:
+        options {Object} -- OptParse' options
+
+    Returns:
+        (Dict[str, int], int, int) -- Workers per stage, Encoders (adaptive upper bound), Usable CPUs
+    """
+    cpus = cpucount()
+    jobs = options.jobs or cpus
+    if not (options.adaptive is None):
+        # pools sized for the upper bound, the controller limits jobs in flight
+        jobs = options.maxjobs or options.jobs or 2 * cpus
+    workers = {
+        STAGE_DECODE: options.decodejobs or jobs,
+        STAGE_ENCODE: jobs,
+        STAGE_COMMIT: options.tagjobs or max(1, jobs // 4),
+    }
+    return (workers, jobs, cpus)
+
+
+def prepare(options, coverjobs: List[CoverJob], encodejobs: List) -> Tuple[List, Dict, Dict]:
+    """
+    Merges the tracks of all destinations and orders them
+
+    Arguments:
+        options {Object} -- OptParse' options
+        coverjobs {List[CoverJob]} -- Covers to replicate
+        encodejobs {List[GenericJob]} -- Tracks to encode or update
+
+    Returns:
+        (List[GenericJob], Dict[GenericJob, List[GenericJob]], Dict[EncodeJob, SplitJob]) -- Tracks,
+            Dependencies of each track, Split job of an encode job
+    """
+    # covers first, tracks wait for their own album's cover only
+    tracks = jobmerge(encodejobs)
+    deps = jobdeps(coverjobs, tracks)
+    for j in tracks:
+        j.stream = not (options.stream is None)
+        # workers decode their own tracks
+        j.split = not (options.cuesplit is None) and options.serve is None
+    (splitjobs, splitdeps) = jobsplit(tracks)
+    for j in tracks:
+        if j in splitdeps:
+            deps[j].append(splitdeps[j])
+    return (tracks, deps, splitdeps)
+
+
+def submit(scheduler: Scheduler, coverjobs: List[CoverJob], tracks: List, deps: Dict, splitdeps: Dict) -> None:
+    """
+    Submits a run's jobs
+
+    Arguments:
+        scheduler {Scheduler|AsyncScheduler} -- Scheduler
+        coverjobs {List[CoverJob]} -- Covers to replicate
+        tracks {List[GenericJob]} -- Tracks to encode or update
+        deps {Dict[GenericJob, List[GenericJob]]} -- Dependencies of each track
+        splitdeps {Dict[EncodeJob, SplitJob]} -- Split job of an encode job
+    """
     for j in coverjobs:
-        encodeq.put(j)
+        scheduler.submit(j)
+    for j in sorted(set(splitdeps.values()), key=lambda s: (s.key, s.discnumber)):
+        scheduler.submit(j)
+    for j in tracks:
+        scheduler.submit(j, deps[j])
+
+
+def perform(codecs: List[str], options, *args: List[str]) -> None:
+    """
+    Busines logic for the transcoding
 
-    # parallel
-    for i in range(multiprocessing.cpu_count()):
-        t = threading.Thread(target=encodeworker)
-        t.daemon = True
-        t.start()
-    encodeq.join()
+    Source trees are surveyed once, every track is decoded once and
+    encoded into all requested codecs. In plan mode nothing is touched,
+    the jobs and their estimates are printed as JSON instead. In watch
+    mode the run goes on, albums changing are transcoded again. In serve
+    mode the jobs are run by workers (see tinnet).
 
-    # encode queue
-    for j in encodejobs:
-        encodeq.put(j)
+    Arguments:
+        codecs {List[str]} -- Output codecs
+        options {Object} -- OptParse' options
+    """
 
-    # parallel
-    for i in range(multiprocessing.cpu_count()):
-        t = threading.Thread(target=encodeworker)
-        t.daemon = True
-        t.start()
-    encodeq.join()
+    stats.reset()
+    covers.maxsize = options.coversize
+    if options.tmpdir:
+        tmpstore.configure(tempdirs(options.tmpdir))
+    plan = not (options.plan is None)
+    serving = options.serve is not None and not plan
+    watching = not (options.watch is None) and not plan and not serving
+
+    # watch before the initial survey, nothing slips through
+    w = None
+    if watching:
+        w = watcher(list(args), options.poll, options.scanthreads)
+
+    albums = survey(options, dict([(stree, ['']) for stree in args]))
+    (unlinks, coverjobs, encodejobs) = setup(codecs, options, albums)
+    (tracks, deps, splitdeps) = prepare(options, coverjobs, encodejobs)
+    (workers, jobs, cpus) = pools(options)
+    if plan:
+        speeds = throughput(options.measured) if options.measured else {}
+        json.dump(jobplan(unlinks, coverjobs, tracks, splitdeps, workers, speeds), sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        return
+
+    if serving:
+        coordinator = Coordinator(options.serve, options.lease)
+        for j in coverjobs + tracks:
+            coordinator.submit(j)
+        coordinator.listen()
+        try:
+            coordinator.serve()
+        finally:
+            coordinator.close()
+            for j in journals.values():
+                j.close()
+            journals.clear()
+        if options.report:
+            stats.dump(options.report)
+        return
+
+    if options.engine == 'async':
+        scheduler = AsyncScheduler(workers)
+    else:
+        scheduler = Scheduler(workers)
+    controller = None
+    if not (options.adaptive is None):
+        controller = Controller(scheduler, options.minjobs, jobs, cpus)
+        controller.start()
+    submit(scheduler, coverjobs, tracks, deps, splitdeps)
+    scheduler.start()
+    scheduler.join()
+    if options.report:
+        stats.dump(options.report)
+    try:
+        if w:
+            watch(w, codecs, options, scheduler)
+    finally:
+        scheduler.stop()
+        if controller:
+            controller.stop()
+        for j in journals.values():
+            j.close()
+        journals.clear()
+
+
+def watch(w, codecs: List[str], options, scheduler: Scheduler) -> None:
+    """
+    Transcodes the albums changing in the source trees (until interrupted)
+
+    Changes are collected per album directory, once an album settled its
+    directory is surveyed and planned again (nothing else), its jobs run
+    on the scheduler's pools. An album failing to load or plan (half
+    copied, damaged) is skipped until it changes again.
+
+    Arguments:
+        w {InotifyWatcher|PollWatcher} -- Source trees' watcher
+        codecs {List[str]} -- Output codecs
+        options {Object} -- OptParse' options
+        scheduler {Scheduler|AsyncScheduler} -- Running scheduler
+    """
+    debouncer = Debouncer(options.settle)
+    try:
+        while True:
+            timeout = debouncer.timeout(time.monotonic())
+            for (stree, d) in w.poll(WATCH_IDLE if timeout is None else timeout):
+                debouncer.add(stree, d, time.monotonic())
+            due = debouncer.due(time.monotonic())
+            if not due:
+                continue
+            for (stree, d) in due:
+                print("CHANGED: {}".format(os.path.join(stree, d)))
+                try:
+                    albums = survey(options, {stree: [d]})
+                    (unlinks, coverjobs, encodejobs) = setup(codecs, options, albums, [d])
+                    (tracks, deps, splitdeps) = prepare(options, coverjobs, encodejobs)
+                except Exception as e:
+                    # half copied or damaged, planned again on its next change
+                    print("FAILED: {}".format(os.path.join(stree, d)))
+                    print("ERROR: {}".format(e))
+                    continue
+                submit(scheduler, coverjobs, tracks, deps, splitdeps)
+            scheduler.join()
+            scheduler.forget()
+            sys.stdout.flush()
+            if options.report:
+                stats.dump(options.report)
+    finally:
+        w.close()
 
 
 if __name__ == "__main__":
@@ -139,29 +374,145 @@ if __name__ == "__main__":
     parser.add_option("--downmix", action="store_true", dest="downmix",
                       help="Downmix multi-channel")
 
+    parser.add_option("--downmix-center", action="store", type="float", dest="mixcenter", metavar="GAIN",
+                      default=DOWNMIX_CENTER, help="Downmix gain of center channels (default: %default)")
+
+    parser.add_option("--downmix-surround", action="store", type="float", dest="mixsurround", metavar="GAIN",
+                      default=DOWNMIX_SURROUND, help="Downmix gain of surround channels (default: %default)")
+
+    parser.add_option("--downmix-lfe", action="store", type="float", dest="mixlfe", metavar="GAIN",
+                      default=DOWNMIX_LFE, help="Downmix gain of LFE channel (default: %default)")
+
     parser.add_option("--copycover", action="store_true", dest="copycover",
                       help="Add extra cover file")
 
+    parser.add_option("--cover-size", action="store", type="int", dest="coversize", metavar="PX",
+                      help="Limit cover width/height")
+
+    parser.add_option("--fingerprint", action="store_true", dest="fingerprint",
+                      help="Detect changes by content instead of modification time")
+
+    parser.add_option("--index", action="store", type="string", dest="index", metavar="DIR",
+                      help="Persistent directory scan index")
+
+    parser.add_option("--scan-threads", action="store", type="int", dest="scanthreads", metavar="N",
+                      default=SCAN_WORKERS, help="Directory scanning threads")
+
+    parser.add_option("--stream", action="store_true", dest="stream",
+                      help="Pipe decoder into encoders (no temp WAV)")
+
+    parser.add_option("--cuesplit", action="store_true", dest="cuesplit",
+                      help="Decode CUE images once per disc (no per track decode)")
+
+    parser.add_option("--tmpdir", action="store", type="string", dest="tmpdir", metavar="DIR[:SIZE],...",
+                      default=os.environ.get(TMPDIR_ENV),
+                      help="Temp directories in order of preference with budgets, eg. /dev/shm:2G,/var/tmp "
+                           "(default: ${} or system temp, unlimited)".format(TMPDIR_ENV))
+
+    parser.add_option("--journal", action="store_true", dest="journal",
+                      help="Journal encodes in the destinations, resume interrupted runs")
+
+    parser.add_option("--watch", action="store_true", dest="watch",
+                      help="Keep running, transcode the albums changing in the sources")
+
+    parser.add_option("--settle", action="store", type="float", dest="settle", metavar="SECONDS",
+                      default=SETTLE_TIME, help="Watch: quiet time before a changed album is transcoded (default: %default)")
+
+    parser.add_option("--poll", action="store", type="float", dest="poll", metavar="SECONDS",
+                      help="Watch: rescan the sources periodically instead of inotify (default: inotify if available)")
+
+    parser.add_option("--shard", action="store", type="string", dest="shard", metavar="I/N",
+                      help="Transcode the I-th (from 0) of N disjoint shards of the albums, eg. one per host")
+
+    parser.add_option("--serve", action="store", type="string", dest="serve", metavar="unix:PATH|[HOST]:PORT",
+                      help="Coordinate: plan, then serve the jobs to workers (no --watch)")
+
+    parser.add_option("--worker", action="store", type="string", dest="worker", metavar="unix:PATH|HOST:PORT",
+                      help="Work for a coordinator (--jobs in parallel), no destinations/sources needed")
+
+    parser.add_option("--lease", action="store", type="float", dest="lease", metavar="SECONDS",
+                      default=LEASE_TIME, help="Coordinate: jobs of silent workers are queued again after (default: %default)")
+
+    parser.add_option("--report", action="store", type="string", dest="report", metavar="FILE",
+                      help="Write run statistics (JSON)")
+
+    parser.add_option("--plan", "--dry-run", action="store_true", dest="plan",
+                      help="Print the jobs and their estimates as JSON, touch nothing")
+
+    parser.add_option("--measured", action="store", type="string", dest="measured", metavar="FILE",
+                      help="Run statistics (--report) of a previous run to estimate with")
+
+    parser.add_option("--jobs", action="store", type="int", dest="jobs", metavar="N",
+                      help="Parallel encoders (default: usable CPUs)")
+
+    parser.add_option("--decode-jobs", action="store", type="int", dest="decodejobs", metavar="N",
+                      help="Parallel decoders/downmixers (default: --jobs)")
+
+    parser.add_option("--tag-jobs", action="store", type="int", dest="tagjobs", metavar="N",
+                      help="Parallel taggers (default: --jobs/4)")
+
+    parser.add_option("--engine", action="store", type="choice", dest="engine", metavar="ENGINE",
+                      choices=ENGINES, default=ENGINES[0],
+                      help="Job engine: threads (blocking worker per job) or async (asyncio, child processes "
+                           "awaited, failures with their stderr), no --adaptive (default: %default)")
+
+    parser.add_option("--adaptive", action="store_true", dest="adaptive",
+                      help="Adapt jobs in flight to CPU and I/O load")
+
+    parser.add_option("--min-jobs", action="store", type="int", dest="minjobs", metavar="N",
+                      default=1, help="Adaptive lower bound of jobs in flight")
+
+    parser.add_option("--max-jobs", action="store", type="int", dest="maxjobs", metavar="N",
+                      help="Adaptive upper bound of jobs in flight (default: --jobs or 2 x usable CPUs)")
+
     (options, args) = parser.parse_args()
 
+    # run jobs of a coordinator
+    if options.worker:
+        try:
+            endpoint(options.worker)
+            if options.tmpdir:
+                tmpstore.configure(tempdirs(options.tmpdir))
+        except Exception:
+            parser.print_help()
+            sys.exit(1)
+        work(options.worker, options.jobs or cpucount())
+        sys.exit(0)
+
     # check if correctly called
     guard1 = options.flac is None and options.aac is None and options.mp3 is None and options.opus is None
     guard2 = len(args) == 0
     guard3 = not checkdir(options.flac, options.aac, options.mp3, options.opus, *args)
-
-    if guard1 or guard2 or guard3:
+    try:
+        guard4 = options.tmpdir is not None and len(tempdirs(options.tmpdir)) == 0
+    except Exception:
+        guard4 = True
+    guard5 = options.measured is not None and not os.path.isfile(options.measured)
+    try:
+        guard6 = options.serve is not None and endpoint(options.serve) is None
+    except Exception:
+        guard6 = True
+    try:
+        guard7 = options.shard is not None and shardspec(options.shard) is None
+    except Exception:
+        guard7 = True
+    guard8 = options.engine == 'async' and options.adaptive is not None
+
+    if guard1 or guard2 or guard3 or guard4 or guard5 or guard6 or guard7 or guard8:
         parser.print_help()
         sys.exit(1)
 
     # process dirs
+    codecs = []
     if options.flac:
-        perform('flac', options, *args)
+        codecs.append('flac')
     if options.opus:
-        perform('opus', options, *args)
+        codecs.append('opus')
     if options.aac:
-        perform('aac', options, *args)
+        codecs.append('aac')
     if options.mp3:
-        perform('mp3', options, *args)
+        codecs.append('mp3')
+    perform(codecs, options, *args)
 
     # all done
     sys.exit(0)
@@ -1,12 +1,19 @@
+import concurrent.futures
 import os
+import zlib
 
-from typing import Dict, Tuple, List
+from typing import Callable, Dict, Tuple, List
 
 from tinaudio.album import AlbumSet
 from tinaudio.cache import ICache
-from tinjob import CoverJob, EncodeJob
+from tinjournal import Journal
+from tinjob import CoverJob, EncodeJob, SplitJob, UpdateJob, DECODE_COST, STAGE_DECODE, STAGE_ENCODE
 
 COVER_FILE = 'folder.jpg'
+CHANGES_ALL = ['audio', 'meta', 'cover']
+SIZE_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+# threads reading the sources' audio for fingerprints (planning)
+DIGEST_WORKERS = 8
 
 
 def checkdir(*args: List[str]) -> bool:
@@ -24,41 +31,344 @@ def checkdir(*args: List[str]) -> bool:
     return True
 
 
-def jobsetup(albums: Dict[str, AlbumSet], dstcache: ICache, encoder: str, copycover: bool) -> Tuple[List[str], List[CoverJob], List[EncodeJob]]:
+def cpucount() -> int:
+    """
+    CPUs usable by the process
+
+    Honours the CPU affinity mask and the cgroup (v2 or v1) CPU quota,
+    eg. inside containers.
+
+    Returns:
+        int -- Number of CPUs (at least 1)
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    quota = None
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as stream:
+            (q, period) = stream.read().split()[:2]
+            if q != 'max':
+                quota = int(q) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as stream:
+                q = int(stream.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as stream:
+                period = int(stream.read())
+            if q > 0 and period > 0:
+                quota = q / period
+        except (OSError, ValueError):
+            pass
+    if quota:
+        count = min(count, max(1, int(quota + 0.5)))
+    return max(1, count)
+
+
+def tempdirs(spec: str) -> List[Tuple[str, int]]:
+    """
+    Parses temp directory tiers
+
+    Arguments:
+        spec {str} -- DIR[:SIZE],... in order of preference, SIZE in bytes or with K/M/G suffix, no SIZE for unlimited
+
+    Raises:
+        Exception: When malformed or not an absolute directory
+
+    Returns:
+        List[Tuple[str, int]] -- Directory and budget in bytes (or None) per tier
+    """
+    tiers = []
+    for t in spec.split(','):
+        (path, sep, size) = t.partition(':')
+        if not checkdir(path) or not path:
+            raise Exception("Invalid temp directory: " + path)
+        budget = None
+        if size:
+            unit = SIZE_UNITS.get(size[-1].upper(), 1)
+            if size[-1].upper() in SIZE_UNITS:
+                size = size[:-1]
+            try:
+                budget = int(float(size) * unit)
+            except ValueError:
+                raise Exception("Invalid temp budget: " + t)
+        tiers.append((path, budget))
+    return tiers
+
+
+def topdirs(dirs: List[str]) -> List[str]:
+    """
+    Drops the directories nested into others
+
+    Arguments:
+        dirs {List[str]} -- Directories relative to a root ('' for the root)
+
+    Returns:
+        List[str] -- Outermost directories (sorted)
+    """
+    top = []
+    for d in sorted(set(dirs)):
+        if top and (top[-1] == '' or d.startswith(top[-1] + '/')):
+            continue
+        top.append(d)
+    return top
+
+
+def keyscope(dirs: List[str]) -> Callable[[str], bool]:
+    """
+    Album keys within directories
+
+    Arguments:
+        dirs {List[str]} -- Directories relative to a root ('' for the root)
+
+    Returns:
+        Callable[[str], bool] -- Predicate of keys in scope
+    """
+    dirs = topdirs(dirs)
+
+    def scope(key: str) -> bool:
+        for d in dirs:
+            if d == '' or key == d or key.startswith(d + '/'):
+                return True
+        return False
+    return scope
+
+
+def shardspec(spec: str) -> Tuple[int, int]:
+    """
+    Parses a shard specification
+
+    Arguments:
+        spec {str} -- Shard and number of shards, eg. 0/4 (shards counted from 0)
+
+    Raises:
+        Exception: If the specification is malformed
+
+    Returns:
+        (int, int) -- Shard, Number of shards
+    """
+    try:
+        (i, n) = [int(x) for x in spec.split('/')]
+    except ValueError:
+        raise Exception("Malformed shard: " + spec)
+    if n < 1 or i < 0 or i >= n:
+        raise Exception("Shard out of range: " + spec)
+    return (i, n)
+
+
+def keyshard(key: str, shards: int) -> int:
+    """
+    Shard of an album key, the same on every host and run
+
+    Arguments:
+        key {str} -- Album key
+        shards {int} -- Number of shards
+
+    Returns:
+        int -- Shard
+    """
+    return zlib.crc32(key.encode('utf8')) % shards
+
+
+def shardscope(shard: int, shards: int) -> Callable[[str], bool]:
+    """
+    Album keys of a shard
+
+    Arguments:
+        shard {int} -- Shard
+        shards {int} -- Number of shards
+
+    Returns:
+        Callable[[str], bool] -- Predicate of keys in scope
+    """
+    def scope(key: str) -> bool:
+        return keyshard(key, shards) == shard
+    return scope
+
+
+def allscope(scopes: List[Callable[[str], bool]]) -> Callable[[str], bool]:
+    """
+    Album keys in all of several scopes
+
+    Arguments:
+        scopes {List[Callable[[str], bool]]} -- Predicates of keys in scope
+
+    Returns:
+        Callable[[str], bool] -- Predicate of keys in scope
+    """
+    def scope(key: str) -> bool:
+        return all(s(key) for s in scopes)
+    return scope
+
+
+def prunedirs(root: str, dirs: List[str] = ('',), parents: bool = True) -> None:
+    """
+    Removes the empty directories within (and above) directories of a tree
+
+    Stays on the root's file system, the root itself is kept.
+
+    Arguments:
+        root {str} -- Tree's root directory
+        dirs {List[str]} -- Directories relative to root ('' for the whole tree)
+        parents {bool} -- Remove the parents left empty too (not shared with other runs)
+    """
+    device = os.stat(root).st_dev
+    for d in topdirs(dirs):
+        top = os.path.join(root, d) if d else root
+        if os.path.isdir(top):
+            for (path, subdirs, files) in os.walk(top, topdown=False):
+                if path != root and not os.listdir(path) and os.stat(path).st_dev == device:
+                    print("RMDIR: {}".format(path))
+                    os.rmdir(path)
+        # parents left empty
+        while parents and d:
+            path = os.path.join(root, d)
+            if os.path.isdir(path):
+                if os.listdir(path):
+                    break
+                print("RMDIR: {}".format(path))
+                os.rmdir(path)
+            d = os.path.dirname(d)
+
+
+def newjob(albumset: AlbumSet, discnumber: int, tracknumber: int, dstroot: str, dstfile: str, encoder: str,
+           fingerprint: bool) -> EncodeJob:
+    """
+    Track-encode job
+
+    Arguments:
+        albumset {AlbumSet} -- Album set
+        discnumber {int} -- Disc number (in album set)
+        tracknumber {int} -- Track number (in album)
+        dstroot {str} -- Output directory root
+        dstfile {str} -- Output file relative to directory root
+        encoder {str} -- Encoder selector
+        fingerprint {bool} -- Record the source fingerprint in the output
+
+    Returns:
+        EncodeJob -- Track-encode
+    """
+    j = EncodeJob(albumset, discnumber, tracknumber, dstroot, dstfile, encoder)
+    j.fingerprint = fingerprint
+    return j
+
+
+def changes(albumset: AlbumSet, discnumber: int, tracknumber: int, dst: str, dmtime: float, encoder: str,
+            fingerprint: bool) -> List[str]:
+    """
+    Which components of an outdated track changed since it was encoded
+
+    Arguments:
+        albumset {AlbumSet} -- Album set
+        discnumber {int} -- Disc number (in album set)
+        tracknumber {int} -- Track number (in album)
+        dst {str} -- Output file
+        dmtime {float} -- Output's modification time
+        encoder {str} -- Encoder selector
+        fingerprint {bool} -- Compare the recorded fingerprint instead of mtimes
+
+    Returns:
+        List[str] -- Changed components of CHANGES_ALL
+    """
+    if not fingerprint:
+        times = albumset.gettimes(discnumber, tracknumber)
+        return [c for (c, t) in zip(CHANGES_ALL, times) if t > dmtime]
+    recorded = encoder.getfingerprint(dst)
+    if recorded is None:
+        return CHANGES_ALL
+    try:
+        current = albumset.fingerprint(discnumber, tracknumber)
+    except Exception:
+        return CHANGES_ALL
+    recorded = recorded.split('/')
+    current = current.split('/')
+    if len(recorded) != len(current):
+        return CHANGES_ALL
+    return [c for (c, r, s) in zip(CHANGES_ALL, recorded, current) if r != s]
+
+
+def updatejob(albumset: AlbumSet, discnumber: int, tracknumber: int, dstroot: str, dstfile: str, encoder: str,
+              changed: List[str], fingerprint: bool) -> UpdateJob:
+    """
+    Track-update job for the changed components or None if re-encode needed
+
+    Arguments:
+        albumset {AlbumSet} -- Album set
+        discnumber {int} -- Disc number (in album set)
+        tracknumber {int} -- Track number (in album)
+        dstroot {str} -- Output directory root
+        dstfile {str} -- Output file relative to directory root
+        encoder {str} -- Encoder selector
+        changed {List[str]} -- Changed components
+        fingerprint {bool} -- Record the source fingerprint in the output
+
+    Returns:
+        UpdateJob -- Track-update or None
+    """
+    if 'audio' in changed:
+        return None
+    j = UpdateJob(albumset, discnumber, tracknumber, dstroot, dstfile, encoder, 'meta' in changed, 'cover' in changed)
+    j.fingerprint = fingerprint
+    return j
+
+
+def jobsetup(albums: Dict[str, AlbumSet], dstcache: ICache, encoder: str, copycover: bool,
+             fingerprint: bool = False, journal: Journal = None,
+             scope: Callable[[str], bool] = None) -> Tuple[List[str], List[CoverJob], List[EncodeJob]]:
     """
     Generate jobs (unlink, covers, track-encodes)
 
+    Outputs older than their source are re-encoded only if the audio
+    changed, metadata and cover changes are updated in place.
+    In fingerprint mode the changes are detected by content. Outputs
+    the journal knows committed from the current source and settings
+    are kept whatever their mtimes. Albums out of scope (eg. unchanged
+    when watching) are left alone on both sides.
+
     Arguments:
         albums {dict[str, AlbumSet]} -- album set to transcode
         dstcache {ICache} -- Output directory's cache
         encode {str} -- Output codec
         coverfile {bool} -- Generate folder.jpg's
+        fingerprint {bool} -- Content fingerprint based change detection
+        journal {Journal} -- Destination's journal or None
+        scope {Callable[[str], bool]} -- Predicate of the album keys to plan or None (all)
 
     Returns:
         (List[str], List[CoverJob], List[EncodeJob]) -- Files to unlink, Covers to replicate, Tracks to encode
     """
     srckeys = sorted(list(albums.keys()))
     dstkeys = dstcache.getleafs()
+    if scope:
+        srckeys = [k for k in srckeys if scope(k)]
+        dstkeys = [k for k in dstkeys if scope(k)]
+    dstkeyset = set(dstkeys)
     keydel = []
     keynew = []
     keycommon = []
 
     # loop source
     for k in srckeys:
-        if k in dstkeys:
+        if k in dstkeyset:
             keycommon.append(k)
         else:
             keynew.append(k)
 
     # loop dst
     for k in dstkeys:
-        if k not in keycommon:
+        if k not in albums:
             keydel.append(k)
 
     # state
     unlink = []
     cvrjobs = []
     encjobs = []
+    # outdated tracks (their slots in unlink and encjobs), fingerprints (audio reads) compared concurrently
+    outdated = []
+    pool = None
+    if fingerprint:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=DIGEST_WORKERS)
 
     # delete
     for k in keydel:
@@ -73,18 +383,16 @@ def jobsetup(albums: Dict[str, AlbumSet], dstcache: ICache, encoder: str, copyco
             # add encode jobs
             (skey, sdiscnumber, stracknumber, smtime, sname) = tmp[i]
             sfile = os.path.join(skey, sname + "." + encoder.suffix())
-            encjobs.append(EncodeJob(albums[skey], sdiscnumber, stracknumber, dstcache.getroot(), sfile, encoder))
+            encjobs.append(newjob(albums[skey], sdiscnumber, stracknumber, dstcache.getroot(), sfile, encoder, fingerprint))
         if copycover and albums[k].getcover() is not None:
             cvrjobs.append(CoverJob(albums[k], os.path.join(dstcache.getroot(), k)))
 
     # common
     for k in keycommon:
-        src = []
         (xd, xf) = dstcache.get(k)
         dst = [os.path.join(k, x) for x in sorted(xf)]
-        tmp = albums[k].dump()
-        for i in range(0, len(tmp)):
-            src.append(tmp[i])
+        src = albums[k].dump()
+        dstcover = os.path.join(k, COVER_FILE)
         s = 0
         d = 0
         docover = copycover and (albums[k].getcover() is not None)
@@ -95,17 +403,24 @@ def jobsetup(albums: Dict[str, AlbumSet], dstcache: ICache, encoder: str, copyco
             # get destination details
             dfile = dst[d]
             dmtime = dstcache.getmtime(dfile)
-            if copycover and (dfile == os.path.join(k, COVER_FILE)):
-                docover = smtime > dmtime
+            if copycover and (dfile == dstcover):
+                docover = albums[k].getcovertime() > dmtime
                 d += 1
             elif sfile == dfile:
-                if smtime > dmtime:
-                    unlink.append(dfile)
-                    encjobs.append(EncodeJob(albums[skey], sdiscnumber, stracknumber, dstcache.getroot(), sfile, encoder))
+                if smtime > dmtime and journal and \
+                        journal.committed(dfile, dmtime, encoder.settings(), albums[skey].gettimes(sdiscnumber, stracknumber)):
+                    pass
+                elif smtime > dmtime:
+                    args = (albums[skey], sdiscnumber, stracknumber, os.path.join(dstcache.getroot(), dfile), dmtime,
+                            encoder, fingerprint)
+                    changed = pool.submit(changes, *args) if pool else changes(*args)
+                    unlink.append(len(outdated))
+                    encjobs.append(len(outdated))
+                    outdated.append((changed, skey, sdiscnumber, stracknumber, dfile, sfile))
                 s += 1
                 d += 1
             elif sfile < dfile:
-                encjobs.append(EncodeJob(albums[skey], sdiscnumber, stracknumber, dstcache.getroot(), sfile, encoder))
+                encjobs.append(newjob(albums[skey], sdiscnumber, stracknumber, dstcache.getroot(), sfile, encoder, fingerprint))
                 s += 1
             else:
                 unlink.append(dfile)
@@ -113,16 +428,199 @@ def jobsetup(albums: Dict[str, AlbumSet], dstcache: ICache, encoder: str, copyco
         while s < len(src):
             (skey, sdiscnumber, stracknumber, smtime, sname) = src[s]
             sfile = os.path.join(skey, sname + "." + encoder.suffix())
-            encjobs.append(EncodeJob(albums[skey], sdiscnumber, stracknumber, dstcache.getroot(), sfile, encoder))
+            encjobs.append(newjob(albums[skey], sdiscnumber, stracknumber, dstcache.getroot(), sfile, encoder, fingerprint))
             s += 1
         while d < len(dst):
             dfile = dst[d]
-            if copycover and (dfile == os.path.join(k, COVER_FILE)):
-                docover = smtime > dmtime
+            if copycover and (dfile == dstcover):
+                docover = albums[k].getcovertime() > dstcache.getmtime(dfile)
             else:
                 unlink.append(dfile)
             d += 1
         if docover:
             cvrjobs.append(CoverJob(albums[k], os.path.join(dstcache.getroot(), k)))
-        # we are ready
-    return (unlink, cvrjobs, encjobs)
\ No newline at end of file
+
+    # update in place or encode again
+    updates = []
+    try:
+        for (changed, skey, sdiscnumber, stracknumber, dfile, sfile) in outdated:
+            if pool:
+                changed = changed.result()
+            updates.append(updatejob(albums[skey], sdiscnumber, stracknumber, dstcache.getroot(), dfile, encoder,
+                                     changed, fingerprint))
+    finally:
+        if pool:
+            pool.shutdown()
+    slots = unlink
+    unlink = []
+    for u in slots:
+        if not isinstance(u, int):
+            unlink.append(u)
+        elif updates[u] is None:
+            unlink.append(outdated[u][4])
+    slots = encjobs
+    encjobs = []
+    for j in slots:
+        if not isinstance(j, int):
+            encjobs.append(j)
+        elif updates[j] is not None:
+            encjobs.append(updates[j])
+        else:
+            (changed, skey, sdiscnumber, stracknumber, dfile, sfile) = outdated[j]
+            encjobs.append(newjob(albums[skey], sdiscnumber, stracknumber, dstcache.getroot(), sfile, encoder, fingerprint))
+    # we are ready
+    return (unlink, cvrjobs, encjobs)
+
+
+def jobmerge(encjobs: List[EncodeJob]) -> List[EncodeJob]:
+    """
+    Merge encode jobs of the same track (eg. planned for different codecs)
+
+    Arguments:
+        encjobs {List[EncodeJob]} -- Track-encodes, possibly for several destinations
+
+    Returns:
+        List[EncodeJob] -- One track-encode per source track
+    """
+    merged = {}
+    for j in encjobs:
+        if not isinstance(j, EncodeJob):
+            merged[j] = j
+            continue
+        k = (j.key, j.discnumber, j.tracknumber)
+        if k in merged:
+            merged[k].merge(j)
+        else:
+            merged[k] = j
+    return list(merged.values())
+
+
+def jobdeps(coverjobs: List[CoverJob], jobs: List[EncodeJob]) -> Dict[EncodeJob, List[CoverJob]]:
+    """
+    Track jobs depend on the cover jobs of their own album (per destination)
+
+    Arguments:
+        coverjobs {List[CoverJob]} -- Covers to replicate
+        jobs {List[EncodeJob]} -- Track jobs
+
+    Returns:
+        Dict[EncodeJob, List[CoverJob]] -- Dependencies of each track job
+    """
+    bydir = {}
+    for c in coverjobs:
+        bydir[c.dstroot] = c
+    deps = {}
+    for j in jobs:
+        deps[j] = []
+        for r in j.dstroots():
+            c = bydir.get(os.path.join(r, j.key))
+            if c:
+                deps[j].append(c)
+    return deps
+
+
+def jobsplit(jobs: List) -> Tuple[List[SplitJob], Dict]:
+    """
+    Single decode jobs for CUE images
+
+    Groups the encode jobs (asking for it) by disc and adds a split job
+    for discs of CUE images with several tracks to encode. Jobs left out
+    decode their own track (and may stream).
+
+    Arguments:
+        jobs {List[GenericJob]} -- Jobs
+
+    Returns:
+        (List[SplitJob], Dict[EncodeJob, SplitJob]) -- Split jobs, Split job of an encode job
+    """
+    discs = {}
+    for j in jobs:
+        if isinstance(j, EncodeJob) and j.split and j.albumset.splittable(j.discnumber):
+            discs.setdefault((j.key, j.discnumber), []).append(j)
+    splitjobs = []
+    splitdeps = {}
+    for k in sorted(discs.keys()):
+        if len(discs[k]) < 2:
+            continue
+        sj = SplitJob(discs[k][0].albumset, k[1], discs[k])
+        splitjobs.append(sj)
+        for j in discs[k]:
+            splitdeps[j] = sj
+    for j in jobs:
+        if isinstance(j, EncodeJob) and j not in splitdeps:
+            j.split = False
+    return (splitjobs, splitdeps)
+
+
+def jobplan(unlink: List[str], coverjobs: List[CoverJob], jobs: List, splitdeps: Dict, workers: Dict[str, int],
+            speeds: Dict[str, float] = None) -> Dict:
+    """
+    What a run would do and what it would take (dry run)
+
+    Encoders without a measured speed are assumed to encode at the
+    inverse of their cost factor. Temp space peaks when every decoder,
+    encoder and hand-over slot holds one of the largest decoded tracks
+    (a split job holds its whole disc).
+
+    Arguments:
+        unlink {List[str]} -- Files to unlink
+        coverjobs {List[CoverJob]} -- Covers to replicate
+        jobs {List[GenericJob]} -- Track jobs (merged)
+        splitdeps {Dict[EncodeJob, SplitJob]} -- Split job of an encode job
+        workers {Dict[str, int]} -- Number of worker threads per stage
+        speeds {Dict[str, float]} -- Measured audio seconds per wall second per codec (see throughput)
+
+    Returns:
+        Dict -- Unlinks, covers, splits, encodes, updates and estimates (audio seconds per codec,
+                temp space peak in bytes, encoder seconds per codec, wall seconds)
+    """
+    speeds = speeds or {}
+    encodes = []
+    updates = []
+    audio = {}
+    encoding = {}
+    decoding = 0.0
+    tempsizes = []
+    for j in jobs:
+        if isinstance(j, UpdateJob):
+            updates.append({'target': os.path.join(j.dstroot, j.dstfile), 'retag': j.retag, 'recover': j.recover})
+            continue
+        if not isinstance(j, EncodeJob):
+            continue
+        duration = j.duration()
+        encodes.append({
+            'album': j.key,
+            'disc': j.discnumber,
+            'track': j.tracknumber,
+            'duration': duration,
+            'targets': [os.path.join(t[0], t[1]) for t in j.targets],
+            'stream': j.streaming(),
+            'split': j in splitdeps,
+        })
+        decoding += duration * DECODE_COST
+        for (dstroot, dstfile, encoder) in j.targets:
+            audio[encoder.codec] = audio.get(encoder.codec, 0.0) + duration
+            speed = speeds.get(encoder.codec) or 1.0 / encoder.cost()
+            encoding[encoder.codec] = encoding.get(encoder.codec, 0.0) + duration / speed
+        if not j.streaming() and j not in splitdeps:
+            tempsizes.append(j.tempsize())
+    splits = []
+    for sj in sorted(set(splitdeps.values()), key=lambda s: (s.key, s.discnumber)):
+        splits.append({'album': sj.key, 'disc': sj.discnumber, 'tracks': len(sj.jobs)})
+        tempsizes.append(sum([j.tempsize() for j in sj.jobs]))
+    holders = workers.get(STAGE_DECODE, 0) + 2 * workers.get(STAGE_ENCODE, 0)
+    tempspace = sum(sorted(tempsizes, reverse=True)[0:holders])
+    return {
+        'unlink': unlink,
+        'covers': [os.path.join(c.dstroot, COVER_FILE) for c in coverjobs],
+        'splits': splits,
+        'encodes': encodes,
+        'updates': updates,
+        'estimate': {
+            'audio': audio,
+            'tempspace': tempspace,
+            'encoding': encoding,
+            'measured': sorted([c for c in audio.keys() if speeds.get(c)]),
+            'wall': (decoding + sum(encoding.values())) / max(1, workers.get(STAGE_ENCODE, 1)),
+        },
+    }
@@ -0,0 +1,322 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import re
+import select
+import struct
+import time
+
+from typing import Dict, List, Tuple
+
+from tinaudio.cache import ICache, SCAN_WORKERS
+
+
+# inotify(7)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_EVENT = struct.Struct('iIII')
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+READ_SIZE = 1 << 16
+
+# seconds
+POLL_INTERVAL = 60.0
+SETTLE_TIME = 10.0
+
+PATTERN_CD = re.compile('^CD([0-9]{1,3})$')
+
+
+def albumdir(relative_path: str) -> str:
+    """
+    Album directory of a changed directory (disc directories belong to their album)
+
+    Arguments:
+        relative_path {str} -- Directory relative to a root
+
+    Returns:
+        str -- Directory relative to the root
+    """
+    if PATTERN_CD.match(os.path.basename(relative_path)):
+        return os.path.dirname(relative_path)
+    return relative_path
+
+
+class InotifyWatcher(object):
+    """
+    Changed directories of trees (inotify)
+
+    Every directory of the trees is watched, new ones as they appear.
+    When the kernel's event queue overflows the whole tree counts as
+    changed.
+
+    Raises:
+        OSError: When inotify is not available (or out of watches)
+    """
+
+    def __init__(self, roots: List[str]) -> None:
+        """
+        Arguments:
+            roots {List[str]} -- Root directories
+        """
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "No inotify")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.watches = {}
+        try:
+            for root in roots:
+                self.addtree(root, '')
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def addtree(self, root: str, relative_path: str) -> List[str]:
+        """
+        Watches a directory and its subdirectories
+
+        Arguments:
+            root {str} -- Root directory
+            relative_path {str} -- Directory relative to root
+
+        Returns:
+            List[str] -- Directories watched (relative to root), changed if new
+        """
+        added = []
+        top = os.path.join(root, relative_path) if relative_path else root
+        for (path, dirs, files) in os.walk(top):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK | IN_ONLYDIR)
+            if wd < 0:
+                e = ctypes.get_errno()
+                if e in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(e, "inotify_add_watch: " + path)
+            self.watches[wd] = (root, os.path.relpath(path, root) if path != root else '')
+            added.append(self.watches[wd][1])
+        return added
+
+    def removetree(self, root: str, relative_path: str) -> None:
+        """
+        Forgets the watches of a directory moved away and its subdirectories
+
+        Arguments:
+            root {str} -- Root directory
+            relative_path {str} -- Directory relative to root
+        """
+        for (wd, (r, p)) in list(self.watches.items()):
+            if r == root and (p == relative_path or p.startswith(relative_path + '/')):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def poll(self, timeout: float) -> List[Tuple[str, str]]:
+        """
+        Waits for changes
+
+        Arguments:
+            timeout {float} -- Seconds to wait at most
+
+        Returns:
+            List[Tuple[str, str]] -- Root and changed directory relative to it
+        """
+        (readable, w, x) = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        changed = []
+        i = 0
+        while i + IN_EVENT.size <= len(data):
+            (wd, mask, cookie, size) = IN_EVENT.unpack_from(data, i)
+            name = os.fsdecode(data[i + IN_EVENT.size:i + IN_EVENT.size + size].rstrip(b'\0'))
+            i += IN_EVENT.size + size
+            if mask & IN_Q_OVERFLOW:
+                changed.extend([(r, '') for r in set([w[0] for w in self.watches.values()])])
+                continue
+            if wd not in self.watches:
+                continue
+            (root, parent) = self.watches[wd]
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            if mask & IN_DELETE_SELF:
+                changed.append((root, parent))
+                continue
+            if mask & IN_ISDIR:
+                path = os.path.join(parent, name)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # subdirectories made before the watch are new too
+                    changed.extend([(root, p) for p in self.addtree(root, path)])
+                else:
+                    if mask & IN_MOVED_FROM:
+                        self.removetree(root, path)
+                    changed.append((root, path))
+            else:
+                changed.append((root, parent))
+        return changed
+
+    def close(self) -> None:
+        """
+        Stops watching
+        """
+        os.close(self.fd)
+
+
+class PollWatcher(object):
+    """
+    Changed directories of trees (periodic rescans)
+
+    Fallback without inotify: directories whose files (or their mtimes)
+    changed, appeared or vanished since the previous scan.
+    """
+
+    def __init__(self, roots: List[str], interval: float = POLL_INTERVAL, workers: int = SCAN_WORKERS) -> None:
+        """
+        Arguments:
+            roots {List[str]} -- Root directories
+            interval {float} -- Seconds between scans
+            workers {int} -- Number of directory scanning threads
+        """
+        self.roots = roots
+        self.interval = interval
+        self.workers = workers
+        self.listings = {}
+        for root in roots:
+            self.listings[root] = self.scan(root)
+        self.next = time.monotonic() + interval
+
+    def scan(self, root: str) -> Dict[str, list]:
+        """
+        Files of every directory of a tree
+
+        Arguments:
+            root {str} -- Root directory
+
+        Returns:
+            Dict[str, list] -- Files with modification times per directory
+        """
+        c = ICache(root, None, self.workers)
+        return dict([(p, entry[3]) for (p, entry) in c.scanned.items()])
+
+    def poll(self, timeout: float) -> List[Tuple[str, str]]:
+        """
+        Waits for changes (until the next scan)
+
+        Arguments:
+            timeout {float} -- Seconds to wait at most
+
+        Returns:
+            List[Tuple[str, str]] -- Root and changed directory relative to it
+        """
+        wait = self.next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, wait))
+        self.next = time.monotonic() + self.interval
+        changed = []
+        for root in self.roots:
+            listing = self.scan(root)
+            previous = self.listings[root]
+            for p in set(listing.keys()) | set(previous.keys()):
+                if listing.get(p) != previous.get(p):
+                    changed.append((root, p))
+            self.listings[root] = listing
+        return changed
+
+    def close(self) -> None:
+        """
+        Stops watching
+        """
+        pass
+
+
+def watcher(roots: List[str], interval: float = None, workers: int = SCAN_WORKERS):
+    """
+    Watcher of trees, inotify if available
+
+    Arguments:
+        roots {List[str]} -- Root directories
+        interval {float} -- Polling interval in seconds (None for inotify if available)
+        workers {int} -- Number of directory scanning threads (polling)
+
+    Returns:
+        InotifyWatcher|PollWatcher -- Watcher
+    """
+    if interval is None:
+        try:
+            return InotifyWatcher(roots)
+        except OSError:
+            interval = POLL_INTERVAL
+    return PollWatcher(roots, interval, workers)
+
+
+class Debouncer(object):
+    """
+    Changed album directories settling
+
+    An album is due once no change arrived for it during the settle time,
+    eg. a rip being copied is picked up after its last file.
+    """
+
+    def __init__(self, settle: float = SETTLE_TIME) -> None:
+        """
+        Arguments:
+            settle {float} -- Seconds without changes
+        """
+        self.settle = settle
+        self.pending = {}
+
+    def add(self, root: str, relative_path: str, now: float) -> None:
+        """
+        Notes a changed directory
+
+        Arguments:
+            root {str} -- Root directory
+            relative_path {str} -- Changed directory relative to root
+            now {float} -- Time (monotonic)
+        """
+        self.pending[(root, albumdir(relative_path))] = now
+
+    def due(self, now: float) -> List[Tuple[str, str]]:
+        """
+        Takes the settled album directories
+
+        Arguments:
+            now {float} -- Time (monotonic)
+
+        Returns:
+            List[Tuple[str, str]] -- Root and album directory relative to it
+        """
+        due = sorted([k for (k, t) in self.pending.items() if now - t >= self.settle])
+        for k in due:
+            del self.pending[k]
+        return due
+
+    def timeout(self, now: float) -> float:
+        """
+        Seconds until the next album settles
+
+        Arguments:
+            now {float} -- Time (monotonic)
+
+        Returns:
+            float -- Seconds (None if nothing pending)
+        """
+        if not self.pending:
+            return None
+        return max(0.0, min(self.pending.values()) + self.settle - now)